@@ -0,0 +1,112 @@
+import uuid
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import caches
+
+from products.models import Products
+from products.stock import InsufficientStock
+
+from .services import apply_operations, fold_operations, get_cart_id
+
+TOKEN_HEADER = 'HTTP_X_CART_TOKEN'
+SALT = 'cart.guest'
+
+
+def get_cache():
+    """
+    Return the cache holding guest carts (`GUEST_CART_CACHE_ALIAS`).
+    """
+    return caches[getattr(settings, 'GUEST_CART_CACHE_ALIAS', 'default')]
+
+
+class GuestCart:
+    """
+    Cart of an anonymous visitor, kept in the cache instead of the database.
+
+    The visitor holds a signed token naming the cart, so cart ids cannot be
+    guessed or forged. Lines are a `{product_id: quantity}` mapping stored
+    under one cache key that expires after `GUEST_CART_TIMEOUT` seconds of
+    inactivity. Nothing is written to the database until the visitor logs
+    in and the cart is merged into their own.
+
+    Args:
+        token (str): Signed token of an existing cart; a new cart when None.
+
+    Raises:
+        signing.BadSignature: If the token was not issued by this site.
+    """
+
+    def __init__(self, token=None):
+        if token is None:
+            self.id = uuid.uuid4().hex
+            self.items = {}
+        else:
+            self.id = signing.Signer(salt=SALT).unsign(token)
+            self.items = get_cache().get(self.key, {})
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Return the guest cart named by the `X-Cart-Token` header, or None.
+        """
+        token = request.META.get(TOKEN_HEADER)
+        return cls(token) if token else None
+
+    @property
+    def key(self):
+        return f'cart:guest:{self.id}'
+
+    @property
+    def token(self):
+        return signing.Signer(salt=SALT).sign(self.id)
+
+    @property
+    def item_count(self):
+        return sum(self.items.values())
+
+    def apply(self, operations):
+        """
+        Apply validated `add`/`set`/`remove` operations to the lines.
+        """
+        quantities = fold_operations(self.items, operations)
+        self.items = {product: quantity for product, quantity in quantities.items() if quantity is not None}
+
+    def save(self):
+        get_cache().set(self.key, self.items, getattr(settings, 'GUEST_CART_TIMEOUT', 60 * 60 * 24 * 7))
+
+    def delete(self):
+        get_cache().delete(self.key)
+        self.items = {}
+
+    def as_operations(self):
+        """
+        Return the lines as `add` operations, to merge them into a user's cart.
+        """
+        return [
+            {'product': product, 'quantity': quantity, 'op': 'add'}
+            for product, quantity in self.items.items()
+        ]
+
+    def merge_into(self, user_id):
+        """
+        Move the lines into the user's cart with one bulk operation and drop
+        the guest cart. Products deleted meanwhile are skipped. When the stock
+        cannot cover the lines nothing is merged and the guest cart is kept.
+
+        Args:
+            user_id (int): Id of the user who just logged in.
+
+        Returns:
+            bool: Whether the cart was merged.
+        """
+        if self.items:
+            products = Products.objects.only('id', 'value').in_bulk(self.items)
+            operations = [operation for operation in self.as_operations() if operation['product'] in products]
+            if operations:
+                try:
+                    apply_operations(get_cart_id(user_id), operations, products)
+                except InsufficientStock:
+                    return False
+        self.delete()
+        return True
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from cart.models import Carts
+from cart.services import inconsistent_carts, refresh_totals
+
+
+class Command(BaseCommand):
+    help = 'Check the item count and subtotal stored on every cart against its lines.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', help='Recompute the totals of inconsistent carts.')
+
+    def handle(self, *args, **options):
+        cart_ids = list(inconsistent_carts().values_list('id', flat=True))
+        if not cart_ids:
+            self.stdout.write(self.style.SUCCESS('Every cart total is consistent.'))
+            return
+
+        if not options['repair']:
+            raise CommandError(f'{len(cart_ids)} carts have inconsistent totals: {cart_ids[:20]}')
+
+        refresh_totals(Carts.objects.filter(pk__in=cart_ids))
+        self.stdout.write(self.style.SUCCESS(f'Repaired the totals of {len(cart_ids)} carts.'))
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:15
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Fold duplicated (cart, product) lines into the oldest one before the
+    # unique constraint is created
+    ItensCart = apps.get_model('cart', 'ItensCart')
+    duplicates = ItensCart.objects.values('cart', 'product').order_by().annotate(
+        lines=Count('id'), first=Min('id'), total=Sum('quantity')
+    ).filter(lines__gt=1)
+    for row in duplicates:
+        ItensCart.objects.filter(pk=row['first']).update(quantity=row['total'])
+        ItensCart.objects.filter(cart=row['cart'], product=row['product']).exclude(pk=row['first']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0004_alter_itenscart_quantity'),
+        ('products', '0004_categoryfacets'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='itenscart',
+            constraint=models.UniqueConstraint(fields=('cart', 'product'), name='unique_cart_product'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:21
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_totals(apps, schema_editor):
+    Carts = apps.get_model('cart', 'Carts')
+    ItensCart = apps.get_model('cart', 'ItensCart')
+    money = DecimalField(max_digits=20, decimal_places=2)
+    lines = ItensCart.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    Carts.objects.update(
+        item_count=Coalesce(Subquery(lines.annotate(total=Sum('quantity')).values('total')), 0),
+        subtotal=Coalesce(
+            Subquery(lines.annotate(
+                total=Sum(F('quantity') * F('product__value'), output_field=money)
+            ).values('total')),
+            Value(0, output_field=money),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_itenscart_unique_cart_product'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carts',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='carts',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=20),
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
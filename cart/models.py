@@ -6,8 +6,17 @@ from django.core.validators import MinValueValidator
 class Carts(models.Model):
     user = models.OneToOneField(Users, on_delete=models.CASCADE)
     data_updated = models.DateTimeField(auto_now=True)
+    # Maintained by every cart mutation so the cart badge reads a single row
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=20, decimal_places=2, default=0)
 
 class ItensCart(models.Model):
     cart = models.ForeignKey(Carts, on_delete=models.CASCADE)
     product = models.ForeignKey(Products, on_delete=models.CASCADE)
-    quantity = models.IntegerField(default=1, validators=[MinValueValidator(1)])
\ No newline at end of file
+    quantity = models.IntegerField(default=1, validators=[MinValueValidator(1)])
+
+    class Meta:
+        constraints = [
+            # A product appears at most once per cart; adding it again raises the quantity
+            models.UniqueConstraint(fields=['cart', 'product'], name='unique_cart_product'),
+        ]
\ No newline at end of file
@@ -16,4 +16,71 @@ class ItensCartSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'product', 'cart', 'quantity'
         ]
-        read_only_fields = ['cart']
\ No newline at end of file
+        read_only_fields = ['cart']
+
+
+class CartBadgeSerializer(serializers.ModelSerializer):
+    """
+    The totals maintained on the cart row, shown in the cart badge.
+    """
+    class Meta:
+        model = Carts
+        fields = [
+            'item_count', 'subtotal'
+        ]
+
+
+class CartOperationSerializer(serializers.Serializer):
+    """
+    One operation of a bulk cart request.
+
+    `add` raises the quantity of the product's line (creating it), `set`
+    replaces it and `remove` deletes the line. Products are referenced by id
+    and checked all at once by the view, not one query per operation.
+    """
+    OPS = ('add', 'set', 'remove')
+
+    product = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, required=False)
+    op = serializers.ChoiceField(choices=OPS, default='add')
+
+    def validate(self, data):
+        """
+        Require a quantity for `add` and `set`.
+        """
+        if data['op'] != 'remove' and 'quantity' not in data:
+            raise serializers.ValidationError({'quantity': ['This field is required.']})
+        return data
+
+
+class CartOperationsSerializer(serializers.Serializer):
+    """
+    Validates the body of the bulk cart endpoint.
+    """
+    MAX_OPERATIONS = 500
+
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
+
+class CartLineSerializer(serializers.ModelSerializer):
+    """
+    A cart line with its product and the line total computed by the database.
+    """
+    product = ProductsSerializer(read_only=True)
+    line_total = serializers.DecimalField(max_digits=20, decimal_places=2, read_only=True)
+
+    class Meta:
+        model = ItensCart
+        fields = [
+            'id', 'product', 'quantity', 'line_total'
+        ]
+
+
+class CartSummarySerializer(serializers.Serializer):
+    """
+    The whole cart: its lines, the number of units and the grand total.
+    """
+    id = serializers.IntegerField(read_only=True)
+    items = CartLineSerializer(many=True, read_only=True)
+    item_count = serializers.IntegerField(read_only=True)
+    total = serializers.DecimalField(max_digits=20, decimal_places=2, read_only=True)
@@ -0,0 +1,277 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now, Round
+
+from products import stock
+
+from .models import Carts, ItensCart
+
+# Type of line and cart totals: product prices (15, 2) times a quantity
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+
+
+class CartChanged(Exception):
+    """
+    Raised when a cart line changed between being read and being written;
+    the request can be retried.
+    """
+
+
+def cart_id_cache_key(user_id):
+    return f'cart:user:{user_id}'
+
+
+def get_cart_id(user_id):
+    """
+    Return the id of the user's cart, creating the cart when there is none.
+
+    The id is kept in the cache (`CART_ID_CACHE_ALIAS`) until the cart or
+    a new user with the same id says otherwise (see `cart.signals`). On a
+    miss a single `INSERT ... ON CONFLICT (user) DO UPDATE ... RETURNING id`
+    gets or creates the cart, so concurrent first requests agree on one cart.
+
+    Args:
+        user_id (int): Id of the user.
+
+    Returns:
+        int: Id of the user's cart.
+    """
+    cache = caches[getattr(settings, 'CART_ID_CACHE_ALIAS', 'default')]
+    key = cart_id_cache_key(user_id)
+    cart_id = cache.get(key)
+    if cart_id is None:
+        cart_id = Carts.objects.bulk_create(
+            [Carts(user_id=user_id)], update_conflicts=True, unique_fields=['user'], update_fields=['user']
+        )[0].pk
+        # Only remembered once the cart is known to be committed
+        transaction.on_commit(
+            lambda: cache.set(key, cart_id, getattr(settings, 'CART_ID_CACHE_TIMEOUT', 60 * 60 * 24))
+        )
+    return cart_id
+
+
+def request_cart_id(request):
+    """
+    Return the cart id of the request's user, resolved once per request.
+    """
+    if not hasattr(request, '_cart_id'):
+        request._cart_id = get_cart_id(request.user.id)
+    return request._cart_id
+
+
+def forget_cart_id(user_id):
+    caches[getattr(settings, 'CART_ID_CACHE_ALIAS', 'default')].delete(cart_id_cache_key(user_id))
+
+
+def cart_totals_expressions(prefix=''):
+    """
+    Return `{item_count, subtotal}` expressions computing a cart's totals
+    from its lines, for the cart model reached through `prefix`.
+    """
+    lines = ItensCart.objects.filter(cart=OuterRef(f'{prefix}pk')).order_by().values('cart')
+    return {
+        'item_count': Coalesce(Subquery(lines.annotate(total=Sum('quantity')).values('total')), 0),
+        'subtotal': Coalesce(
+            Subquery(lines.annotate(
+                total=Sum(F('quantity') * F('product__value'), output_field=MONEY)
+            ).values('total')),
+            Value(0, output_field=MONEY),
+        ),
+    }
+
+
+def adjust_totals(cart_id, quantity, amount):
+    """
+    Apply a mutation to the stored totals of a cart.
+
+    A relative `UPDATE`, so concurrent mutations of the same cart commute
+    instead of overwriting each other.
+
+    Args:
+        cart_id (int): Id of the cart.
+        quantity (int): Units added (negative when removed).
+        amount (Decimal): Value added to the subtotal (negative when removed).
+    """
+    if quantity or amount:
+        Carts.objects.filter(pk=cart_id).update(
+            item_count=F('item_count') + quantity,
+            subtotal=F('subtotal') + amount,
+            data_updated=Now(),
+        )
+
+
+def refresh_totals(carts):
+    """
+    Recompute the stored totals of `carts` (a `Carts` queryset) from their
+    lines with one `UPDATE`; used when product prices change and to repair.
+
+    Returns:
+        int: The number of carts updated.
+    """
+    return carts.update(**cart_totals_expressions())
+
+
+def inconsistent_carts():
+    """
+    Return the carts whose stored totals differ from their lines.
+    """
+    computed = cart_totals_expressions()
+    # Rounded on both sides: SQLite does decimal arithmetic in floating point
+    return Carts.objects.annotate(
+        computed_item_count=computed['item_count'],
+        computed_subtotal=Round(computed['subtotal'], 2, output_field=MONEY),
+        stored_subtotal=Round('subtotal', 2, output_field=MONEY),
+    ).filter(~Q(item_count=F('computed_item_count')) | ~Q(stored_subtotal=F('computed_subtotal')))
+
+
+def cart_holder(cart_id):
+    """
+    Return the name under which a cart holds its stock reservations.
+    """
+    return f'cart:{cart_id}'
+
+
+def adjust_reservation(cart_id, product_id, quantity):
+    """
+    Reserve (`quantity` > 0) or release (< 0) units of a product for a cart.
+
+    Raises:
+        stock.InsufficientStock: If the product cannot cover the increase.
+    """
+    if quantity > 0:
+        stock.reserve(product_id, cart_holder(cart_id), quantity)
+    elif quantity < 0:
+        stock.release(product_id, cart_holder(cart_id), -quantity)
+
+
+def add_item(cart_id, product, quantity):
+    """
+    Add `quantity` units of a product to a cart without lost updates.
+
+    When the product is already in the cart this is a single
+    `UPDATE ... SET quantity = quantity + n`; otherwise the line is inserted.
+    If a concurrent request inserts the same line first, the unique
+    `(cart, product)` constraint rejects our insert and the increment is
+    applied to the winning row instead. The units are reserved and the cart
+    totals move in the same transaction.
+
+    Args:
+        cart_id (int): Id of the cart.
+        product (Products): The product added.
+        quantity (int): Units to add.
+
+    Raises:
+        stock.InsufficientStock: If the product does not have `quantity` units available.
+    """
+    lines = ItensCart.objects.filter(cart_id=cart_id, product_id=product.pk)
+    with transaction.atomic():
+        adjust_reservation(cart_id, product.pk, quantity)
+        if not lines.update(quantity=F('quantity') + quantity):
+            try:
+                with transaction.atomic():
+                    ItensCart.objects.create(cart_id=cart_id, product_id=product.pk, quantity=quantity)
+            except IntegrityError:
+                lines.update(quantity=F('quantity') + quantity)
+        adjust_totals(cart_id, quantity, quantity * product.value)
+
+
+def fold_operations(quantities, operations):
+    """
+    Apply `add`/`set`/`remove` operations, in order, to a `{product: quantity}`
+    mapping and return it; removed products map to None.
+    """
+    for operation in operations:
+        product_id = operation['product']
+        if operation['op'] == 'add':
+            quantities[product_id] = (quantities.get(product_id) or 0) + operation['quantity']
+        elif operation['op'] == 'set':
+            quantities[product_id] = operation['quantity']
+        else:
+            quantities[product_id] = None
+    return quantities
+
+
+def apply_operations(cart_id, operations, products):
+    """
+    Apply a list of `add`/`set`/`remove` operations to a cart at once.
+
+    Operations are folded per product in request order, then the stock of
+    every changed line is reserved or released and the cart is written with
+    at most one `bulk_create`, one `bulk_update` and one delete, all in a
+    single transaction: either every operation applies or none does.
+
+    Args:
+        cart_id (int): Id of the cart.
+        operations (list): Validated `{product, quantity, op}` dicts whose
+            products are known to exist.
+        products (dict): The referenced products by id, with their `value`.
+
+    Raises:
+        stock.InsufficientStock: If a product cannot cover its increase.
+    """
+    product_ids = {operation['product'] for operation in operations}
+
+    with transaction.atomic():
+        lines = {
+            item.product_id: item
+            for item in ItensCart.objects.select_for_update().filter(cart_id=cart_id, product_id__in=product_ids)
+        }
+
+        # Final quantity of every touched product; None means no line
+        quantities = fold_operations({product_id: item.quantity for product_id, item in lines.items()}, operations)
+
+        to_create, to_update, to_delete = [], [], []
+        added_quantity, added_amount = 0, 0
+        for product_id, quantity in quantities.items():
+            item = lines.get(product_id)
+            delta = (quantity or 0) - (item.quantity if item else 0)
+            adjust_reservation(cart_id, product_id, delta)
+            added_quantity += delta
+            added_amount += delta * products[product_id].value
+            if item is None:
+                if quantity is not None:
+                    to_create.append(ItensCart(cart_id=cart_id, product_id=product_id, quantity=quantity))
+            elif quantity is None:
+                to_delete.append(item.pk)
+            elif quantity != item.quantity:
+                item.quantity = quantity
+                to_update.append(item)
+
+        if to_delete:
+            ItensCart.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            ItensCart.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            ItensCart.objects.bulk_create(to_create)
+        adjust_totals(cart_id, added_quantity, added_amount)
+
+
+def cart_summary(cart_id):
+    """
+    Return a cart with its lines and totals, computed in SQL.
+
+    Two queries whatever the number of lines: one for the cart and its
+    aggregated totals, one for the lines joined to their products.
+
+    Args:
+        cart_id (int): Id of the cart, from `get_cart_id`.
+
+    Returns:
+        tuple: `(cart, lines)`; `cart` is a dict with `id`, `item_count` and
+            `total`, and every line carries its product and `line_total`.
+    """
+    cart = Carts.objects.filter(pk=cart_id).annotate(
+        units=Coalesce(Sum('itenscart__quantity'), 0),
+        total=Coalesce(
+            Sum(F('itenscart__quantity') * F('itenscart__product__value'), output_field=MONEY),
+            Value(0, output_field=MONEY),
+        ),
+    ).values('id', 'units', 'total').get()
+    cart['item_count'] = cart.pop('units')
+
+    lines = ItensCart.objects.filter(cart_id=cart['id']).select_related('product').annotate(
+        line_total=ExpressionWrapper(F('quantity') * F('product__value'), output_field=MONEY)
+    ).order_by('id')
+    return cart, lines
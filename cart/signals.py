@@ -0,0 +1,64 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from products.facets import as_price
+from products.models import Products
+from products.signals import products_changed
+from users.models import Users
+
+from .models import Carts
+from .services import forget_cart_id, refresh_totals
+
+
+@receiver(post_save, sender=Products)
+def refresh_totals_on_price_change(sender, instance, created, raw=False, **kwargs):
+    """
+    Recompute the totals of every cart holding a product whose price changed.
+    """
+    previous = getattr(instance, '_previous_values', None)
+    if created or raw or previous is None or previous['value'] == as_price(instance.value):
+        return
+    refresh_totals(Carts.objects.filter(itenscart__product=instance))
+
+
+@receiver(pre_delete, sender=Products)
+def remember_carts(sender, instance, **kwargs):
+    """
+    Keep the carts holding a product being deleted; its lines go with it.
+    """
+    instance._cart_ids = list(Carts.objects.filter(itenscart__product=instance).values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Products)
+def refresh_totals_on_delete(sender, instance, **kwargs):
+    """
+    Recompute the totals of the carts that held a deleted product.
+    """
+    cart_ids = getattr(instance, '_cart_ids', None)
+    if cart_ids:
+        refresh_totals(Carts.objects.filter(pk__in=cart_ids))
+
+
+@receiver(products_changed)
+def refresh_totals_on_bulk_change(sender, products, **kwargs):
+    """
+    Recompute the totals of the carts holding products rewritten in bulk.
+    """
+    refresh_totals(Carts.objects.filter(itenscart__product__in=[product.pk for product in products]))
+
+
+@receiver(post_delete, sender=Carts)
+def forget_deleted_cart(sender, instance, **kwargs):
+    """
+    Stop handing out the id of a deleted cart.
+    """
+    forget_cart_id(instance.user_id)
+
+
+@receiver(post_save, sender=Users)
+def forget_reused_user_id(sender, instance, created, **kwargs):
+    """
+    Drop any cart id cached for the id a new user received.
+    """
+    if created:
+        forget_cart_id(instance.pk)
@@ -1,15 +1,33 @@
-from django.test import TestCase
+import threading
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, TransactionTestCase, override_settings
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.urls import reverse
 from .models import Carts, ItensCart
+from .services import add_item, get_cart_id, inconsistent_carts, refresh_totals
+from .views import ItensCartViewSet
 from products.models import Products
 from users.models import Users
+from users.revocation import revocations
+from e_commerce.throttling import get_cache as get_throttle_cache
 from django.contrib.auth import get_user_model
 
+# The revocation set is refreshed once in setUp, not during the query counts
+@override_settings(TOKEN_REVOCATION_REFRESH_INTERVAL=60 * 60)
 class ItemCartTesteCase(TestCase):
 
     def setUp(self):
+        revocations.refresh(force=True)
         self.user1 = Users.objects.create(
             username="lucaspaulo",
             first_name="Lucas",
@@ -20,6 +38,7 @@ class ItemCartTesteCase(TestCase):
             is_staff=False,
             is_superuser=False
         )
+        caches['idempotency'].clear()
 
         self.user1.set_password("Senha@789")
         self.user1.save()
@@ -64,6 +83,7 @@ class ItemCartTesteCase(TestCase):
             product=self.product2,
             quantity=1
         )
+        refresh_totals(Carts.objects.filter(pk=self.cart.pk))
 
     def test_create_item_cart(self):
         """
@@ -157,4 +177,461 @@ class ItemCartTesteCase(TestCase):
             response = self.client.patch(url)
 
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
-        self.assertFalse(ItensCart.objects.filter(id=self.item1.id).exists())
\ No newline at end of file
+        self.assertFalse(ItensCart.objects.filter(id=self.item1.id).exists())
+
+    def test_line_changed_while_editing(self):
+        """
+        Test reducing and editing a line never overwrite a concurrent change of it
+        """
+        get_object = ItensCartViewSet.get_object
+
+        def get_object_then_add(view):
+            item = get_object(view)
+            add_item(self.cart.id, self.product1, 2)  # Another request adds to the line meanwhile
+            return item
+
+        with mock.patch.object(ItensCartViewSet, 'get_object', get_object_then_add):
+            response = self.client.patch(reverse('cart-reduce-quantity', kwargs={'pk': self.item1.id}))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(ItensCart.objects.get(id=self.item1.id).quantity, 5)
+
+            response = self.client.patch(reverse('cart-detail', kwargs={'pk': self.item1.id}), {"quantity": 1})
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertEqual(ItensCart.objects.get(id=self.item1.id).quantity, 7)
+
+        self.assertFalse(inconsistent_carts().exists())
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.reserved, 3)
+
+
+    def test_bulk_operations(self):
+        """
+        Test applying add, set and remove operations in one request
+        """
+        product3 = Products.objects.create(
+            name="Tênis Corrida",
+            category="Shoes",
+            description="Tênis leve para corrida.",
+            value=299.90,
+            storage=20
+        )
+        url = reverse('cart-bulk')
+        data = {
+            "operations": [
+                {"product": self.product1.id, "quantity": 2},
+                {"product": self.product2.id, "op": "remove"},
+                {"product": product3.id, "quantity": 5, "op": "set"},
+                {"product": product3.id, "quantity": 1, "op": "add"},
+            ]
+        }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        quantities = {item['product']: item['quantity'] for item in response.data}
+        self.assertEqual(quantities, {self.product1.id: 6, product3.id: 6})
+        self.assertFalse(ItensCart.objects.filter(product=self.product2).exists())
+
+    def test_bulk_operations_unknown_product(self):
+        """
+        Test a bulk request referencing an unknown product changes nothing
+        """
+        url = reverse('cart-bulk')
+        data = {
+            "operations": [
+                {"product": self.product1.id, "op": "remove"},
+                {"product": 999, "quantity": 1},
+            ]
+        }
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['products'], [999])
+        self.assertTrue(ItensCart.objects.filter(id=self.item1.id, quantity=4).exists())
+
+    def test_cart_summary(self):
+        """
+        Test the cart summary returns nested products and database totals
+        """
+        url = reverse('cart-summary')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['id'], self.cart.id)
+        self.assertEqual(response.data['item_count'], 5)
+        self.assertEqual(response.data['total'], '449.95')
+        self.assertEqual(response.data['items'][0]['product']['name'], self.product1.name)
+        self.assertEqual(response.data['items'][0]['line_total'], '399.96')
+
+    def test_cart_summary_query_count(self):
+        """
+        Test the cart summary runs the same queries for one line or many
+        """
+        url = reverse('cart-summary')
+        self.item2.delete()
+
+        # Authentication, the cart id, the cart with its totals and the lines with their products
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+        self.assertEqual(len(response.data['items']), 1)
+        # From now on the user and the cart id come from the cache
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+        ItensCart.objects.bulk_create(
+            ItensCart(cart=self.cart, product=Products.objects.create(
+                name=f"Produto {i}", category="Misc", description="Produto.", value=10, storage=1
+            ))
+            for i in range(20)
+        )
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data['items']), 21)
+        self.assertEqual(response.data['total'], '599.96')
+
+    def test_cart_badge(self):
+        """
+        Test the cart badge reads the maintained totals from the cart row
+        """
+        url = reverse('cart-badge')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)  # Authenticated user and cart id cached
+
+        # The cart row alone
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'item_count': 5, 'subtotal': '449.95'})
+
+    def test_summary_and_badge_without_cart(self):
+        """
+        Test a user without a cart gets an empty summary and badge instead of an error
+        """
+        user = Users.objects.create_user(username="semcarrinho", password="Senha@321", cpf="998.877.665-54")
+        self.client.force_authenticate(user=user)
+
+        response = self.client.get(reverse('cart-badge'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, {'item_count': 0, 'subtotal': '0.00'})
+
+        response = self.client.get(reverse('cart-summary'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual((response.data['item_count'], response.data['total'], response.data['items']), (0, '0.00', []))
+        self.assertEqual(response.data['id'], Carts.objects.get(user=user).id)
+
+    def test_add_path_skips_cart_lookup(self):
+        """
+        Test adding to the cart stops looking the cart up once its id is cached
+        """
+        url = reverse('cart-list')
+        self.client.get(reverse('cart-badge'))  # Authenticated user cached
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connection) as cold:
+                self.client.post(url, {"product": self.product1.id, "quantity": 1})
+        with CaptureQueriesContext(connection) as warm:
+            response = self.client.post(url, {"product": self.product1.id, "quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        def cart_lookups(queries):
+            # Every statement on the cart row but the totals update
+            return [
+                query['sql'] for query in queries.captured_queries
+                if '"cart_carts"' in query['sql'] and not query['sql'].startswith('UPDATE')
+            ]
+        self.assertEqual(len(cart_lookups(cold)), 1)
+        self.assertEqual(cart_lookups(warm), [])
+
+    def test_get_cart_id_creates_once(self):
+        """
+        Test the cart accessor creates a missing cart once and then returns it
+        """
+        user = Users.objects.create(username="semcarrinho", cpf="999.999.999-99", email="sem@example.com")
+
+        with self.assertNumQueries(1):
+            cart_id = get_cart_id(user.id)
+        self.assertEqual(get_cart_id(user.id), cart_id)
+        self.assertEqual(get_cart_id(self.user1.id), self.cart.id)
+        self.assertEqual(list(Carts.objects.filter(user=user).values_list('id', flat=True)), [cart_id])
+
+    def test_cart_totals_follow_every_mutation(self):
+        """
+        Test create, update, reduce, bulk and delete keep the cart totals consistent
+        """
+        url = reverse('cart-list')
+        self.client.post(url, {"product": self.product1.id, "quantity": 2})
+        self.assertFalse(inconsistent_carts().exists())
+
+        detail = reverse('cart-detail', kwargs={'pk': self.item1.id})
+        self.client.put(detail, {"product": self.product2.id, "quantity": 3})
+        self.assertFalse(inconsistent_carts().exists())
+
+        self.client.patch(reverse('cart-reduce-quantity', kwargs={'pk': self.item1.id}))
+        self.assertFalse(inconsistent_carts().exists())
+
+        self.client.post(reverse('cart-bulk'), {"operations": [{"product": self.product1.id, "quantity": 7}]}, format='json')
+        self.assertFalse(inconsistent_carts().exists())
+
+        self.client.delete(detail)
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (7, Decimal('699.93')))
+        self.assertFalse(inconsistent_carts().exists())
+
+    def test_cart_totals_follow_price_changes(self):
+        """
+        Test changing or deleting a product refreshes the carts holding it
+        """
+        self.product1.value = Decimal('10.00')
+        self.product1.save()
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.subtotal, Decimal('89.99'))
+
+        self.product2.delete()
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (4, Decimal('40.00')))
+
+    def test_check_cart_totals_command(self):
+        """
+        Test the consistency check reports drifted carts and repairs them
+        """
+        Carts.objects.filter(pk=self.cart.pk).update(item_count=0)
+
+        with self.assertRaises(CommandError):
+            call_command('check_cart_totals', stdout=StringIO())
+
+        call_command('check_cart_totals', '--repair', stdout=StringIO())
+        self.assertFalse(inconsistent_carts().exists())
+
+    def test_create_item_cart_reserves_stock(self):
+        """
+        Test adding to the cart reserves stock and refuses to oversell
+        """
+        url = reverse('cart-list')
+
+        response = self.client.post(url, {"product": self.product1.id, "quantity": 50})
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.reserved, 50)
+
+        response = self.client.post(url, {"product": self.product1.id, "quantity": 1})
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['available'], 0)
+        self.assertTrue(ItensCart.objects.filter(id=self.item1.id, quantity=54).exists())
+
+        self.client.delete(reverse('cart-detail', kwargs={'pk': self.item1.id}))
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.reserved, 0)
+
+    def test_create_item_cart_idempotency_key(self):
+        """
+        Test retried adds with the same Idempotency-Key add the units only once
+        """
+        url = reverse('cart-list')
+        data = {"product": self.product1.id, "quantity": 1}
+
+        response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertTrue(ItensCart.objects.filter(id=self.item1.id, quantity=5).exists())
+
+        # The same key with another body is a client error, not a replay
+        response = self.client.post(url, {"product": self.product1.id, "quantity": 3}, HTTP_IDEMPOTENCY_KEY='add-1')
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # A new key is a new request
+        self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='add-2')
+        self.assertTrue(ItensCart.objects.filter(id=self.item1.id, quantity=6).exists())
+
+        # Keys belong to the user, not to the token: a refreshed token still replays
+        token = self.client.post(reverse('token_obtain_pair'), {"username": "lucaspaulo", "password": "Senha@789"})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.data["access"]}')
+        response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='add-2')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertTrue(ItensCart.objects.filter(id=self.item1.id, quantity=6).exists())
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'cart': '1/min'}})
+    def test_idempotency_key_not_stored_when_throttled(self):
+        """
+        Test a throttled request is not replayed, so its retry can succeed
+        """
+        url = reverse('cart-list')
+        data = {"product": self.product1.id, "quantity": 1}
+        self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='add-1')
+
+        response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='add-2')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+        get_throttle_cache().clear()
+        response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='add-2')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertTrue(ItensCart.objects.filter(id=self.item1.id, quantity=6).exists())
+
+
+class GuestCartTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = Users.objects.create(
+            username="marialima",
+            first_name="Maria",
+            last_name="Lima",
+            cpf="123.456.789-00",
+            email="maria.lima@example.com",
+        )
+        self.user.set_password("Senha@789")
+        self.user.save()
+        self.cart = Carts.objects.create(user=self.user)
+
+        self.product1 = Products.objects.create(
+            name="Notebook Ultra", category="Electronics", description="Notebook leve.", value=10, storage=5
+        )
+        self.product2 = Products.objects.create(
+            name="Mochila", category="Bags", description="Mochila para notebook.", value=2, storage=5
+        )
+        ItensCart.objects.create(cart=self.cart, product=self.product1, quantity=1)
+        refresh_totals(Carts.objects.filter(pk=self.cart.pk))
+
+        self.client = APIClient()
+        self.token = self.client.post(reverse('guest-cart-list')).data['token']
+        self.client.credentials(HTTP_X_CART_TOKEN=self.token)
+
+    def test_guest_cart_never_writes_to_the_database(self):
+        """
+        Test guest cart changes only read the products they reference
+        """
+        url = reverse('guest-cart-items')
+        data = {
+            "operations": [
+                {"product": self.product1.id, "quantity": 2},
+                {"product": self.product2.id, "quantity": 3},
+            ]
+        }
+
+        with self.assertNumQueries(1):
+            response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['item_count'], 5)
+
+        response = self.client.post(url, {"operations": [{"product": self.product2.id, "op": "remove"}]}, format='json')
+        self.assertEqual(response.data['items'], [{'product': self.product1.id, 'quantity': 2}])
+        self.assertEqual(ItensCart.objects.count(), 1)
+
+    def test_guest_cart_idempotency_key_scoped_to_token(self):
+        """
+        Test anonymous callers sharing an Idempotency-Key never get each other's cart
+        """
+        url = reverse('guest-cart-list')
+        first = APIClient().post(url, HTTP_IDEMPOTENCY_KEY='open-1')
+        second = APIClient().post(url, HTTP_IDEMPOTENCY_KEY='open-1')
+        self.assertNotEqual(first.data['token'], second.data['token'])
+        self.assertNotIn('Idempotent-Replayed', second)
+
+        data = {"operations": [{"product": self.product1.id, "quantity": 2}]}
+        self.client.post(reverse('guest-cart-items'), data, format='json', HTTP_IDEMPOTENCY_KEY='items-1')
+        other = APIClient()
+        other.credentials(HTTP_X_CART_TOKEN=first.data['token'])
+        response = other.post(reverse('guest-cart-items'), data, format='json', HTTP_IDEMPOTENCY_KEY='items-1')
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(response.data['token'], first.data['token'])
+
+    def test_guest_cart_rejects_forged_token(self):
+        """
+        Test a token that was not signed by the site is refused
+        """
+        self.client.credentials(HTTP_X_CART_TOKEN=self.token[:-1] + 'x')
+
+        response = self.client.get(reverse('guest-cart-list'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_guest_cart_merged_on_login(self):
+        """
+        Test logging in with a guest cart token moves its lines into the user cart
+        """
+        self.client.post(reverse('guest-cart-items'), {
+            "operations": [
+                {"product": self.product1.id, "quantity": 2},
+                {"product": self.product2.id, "quantity": 3},
+            ]
+        }, format='json')
+
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "marialima", "password": "Senha@789"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.data)
+
+        quantities = dict(ItensCart.objects.filter(cart=self.cart).values_list('product', 'quantity'))
+        self.assertEqual(quantities, {self.product1.id: 3, self.product2.id: 3})
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (6, Decimal('36.00')))
+
+        # The guest cart is gone once merged
+        self.assertEqual(self.client.get(reverse('guest-cart-list')).data['items'], [])
+
+class ItemCartConcurrencyTestCase(TransactionTestCase):
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            username="anasouza",
+            first_name="Ana",
+            last_name="Souza",
+            cpf="998.877.665-44",
+            email="ana.souza@example.com",
+            is_staff=False,
+            is_superuser=False
+        )
+        self.cart = Carts.objects.create(user=self.user)
+        self.product = Products.objects.create(
+            name="Fone Bluetooth",
+            category="Electronics",
+            description="Fone sem fio.",
+            value=199.90,
+            storage=30
+        )
+
+    def add_in_parallel(self, requests, quantity):
+        barrier = threading.Barrier(requests)
+        statuses = []
+
+        def add():
+            client = APIClient()
+            client.force_authenticate(user=self.user)
+            try:
+                barrier.wait()
+                response = client.post(reverse('cart-list'), {"product": self.product.id, "quantity": quantity})
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return statuses
+
+    def test_parallel_adds_lose_no_increment(self):
+        """
+        Test parallel adds of the same product keep one line with every unit
+        """
+        statuses = self.add_in_parallel(requests=8, quantity=2)
+
+        self.assertEqual(statuses, [status.HTTP_201_CREATED] * 8)
+        items = ItensCart.objects.filter(cart=self.cart, product=self.product)
+        self.assertEqual(items.count(), 1)
+        self.assertEqual(items.get().quantity, 16)
+        self.assertFalse(inconsistent_carts().exists())
+
+    def test_parallel_adds_to_existing_line(self):
+        """
+        Test parallel adds on a line that already exists increment it atomically
+        """
+        ItensCart.objects.create(cart=self.cart, product=self.product, quantity=1)
+
+        statuses = self.add_in_parallel(requests=8, quantity=1)
+
+        self.assertEqual(statuses, [status.HTTP_201_CREATED] * 8)
+        self.assertEqual(ItensCart.objects.get(cart=self.cart, product=self.product).quantity, 9)
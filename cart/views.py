@@ -1,12 +1,44 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from rest_framework import viewsets, status
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from django.core import signing
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.decorators import action
+from e_commerce.idempotency import IdempotentMixin
+from products.models import Products
+from products.stock import InsufficientStock
+from .guest import TOKEN_HEADER, GuestCart
 from .models import Carts, ItensCart
-from .serializers import ItensCartSerializer
+from .serializers import CartBadgeSerializer, CartOperationsSerializer, CartSummarySerializer, ItensCartSerializer
+from .services import (
+    CartChanged, add_item, adjust_reservation, adjust_totals, apply_operations, cart_summary, request_cart_id,
+)
+
+def cart_changed_response():
+    """
+    Build the 409 response for a cart changed by a concurrent request.
+    """
+    return Response(
+        {'detail': 'The cart was changed by another request, please retry.'},
+        status=status.HTTP_409_CONFLICT
+    )
+
+
+def insufficient_stock_response(error):
+    """
+    Build the 409 response for a product without enough available stock.
+    """
+    return Response(
+        {'detail': 'Not enough stock available.', 'product': error.product_id, 'available': error.available},
+        status=status.HTTP_409_CONFLICT
+    )
+
 
 # ViewSet for managing items in the cart
-class ItensCartViewSet(viewsets.ModelViewSet):
+class ItensCartViewSet(IdempotentMixin, viewsets.ModelViewSet):
     """
     ViewSet to handle CRUD operations for items in the cart.
 
@@ -16,6 +48,9 @@ class ItensCartViewSet(viewsets.ModelViewSet):
     queryset = ItensCart.objects.all()  # Queryset to fetch all ItemCart objects
     serializer_class = ItensCartSerializer  # Serializer to handle ItemCart data
     permission_classes = [IsAuthenticated]  # Restricts access to authenticated users only
+    # Retries carrying the same Idempotency-Key replay the first response
+    idempotent_actions = ['create', 'update', 'partial_update', 'destroy', 'reduce_quantity', 'bulk']
+    throttle_scopes = dict.fromkeys(idempotent_actions, 'cart')  # Cart writes reserve stock
 
     def get_queryset(self):
         user = self.request.user
@@ -25,25 +60,29 @@ class ItensCartViewSet(viewsets.ModelViewSet):
         
         return ItensCart.objects.filter(cart__user=user)
 
+    def handle_exception(self, exc):
+        """
+        Answer stock shortages and concurrent changes raised by any cart
+        mutation with a 409.
+        """
+        if isinstance(exc, InsufficientStock):
+            return insufficient_stock_response(exc)
+        if isinstance(exc, CartChanged):
+            return cart_changed_response()
+        return super().handle_exception(exc)
+
     def create(self, request, *args, **kwargs):
         """
         Custom create method to handle adding items to the authenticated user's cart.
 
         Functionality:
         - Validates the incoming data using the serializer.
-        - Checks if the product already exists in the user's cart:
-            - If it exists, increments the quantity of the product.
-            - If it doesn't exist, adds a new item to the cart.
-        - Ensures proper error handling and returns appropriate responses.
-
-        Steps:
-        - Deserialize and validate the incoming data using the serializer.
-        - Retrieve the authenticated user's cart.
-        - Check if the product already exists in the cart:
-            - If it exists, update the quantity and save the changes.
-            - If not, create a new item associated with the user's cart.
-        - Return a success response if the operation succeeds.
-        - Handle unexpected errors and return appropriate error messages.
+        - Adds the quantity to the product's line in the user's cart, creating
+          the line when the product is not in the cart yet.
+        - Reserves the units with a conditional update of the product stock.
+        - The increment is a single `UPDATE ... quantity = quantity + n`, so
+          parallel requests for the same product never lose an update, and the
+          unique `(cart, product)` constraint prevents duplicated lines.
 
         Args:
             request: The HTTP request containing item data to be added to the cart.
@@ -52,29 +91,22 @@ class ItensCartViewSet(viewsets.ModelViewSet):
             Response: A JSON response with a success or error message.
                 - HTTP 201 (Created): If the item is successfully added or updated in the cart.
                 - HTTP 400 (Bad Request): If the serializer validation fails.
+                - HTTP 409 (Conflict): If the product does not have enough stock available.
                 - HTTP 500 (Internal Server Error): If an unexpected error occurs during the operation.
         """
         # Deserialize and validate the incoming data
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid():
             try:
-                # Retrieve the cart associated with the authenticated user
-                cart = Carts.objects.filter(user=self.request.user.id).first()
-
-                # Check if the product already exists in the user's cart
-                product = serializer.validated_data['product']
-                product_in_cart = ItensCart.objects.filter(cart=cart, product=product).first()
-
-                if product_in_cart:
-                    # Increment the quantity if the product already exists in the cart
-                    product_in_cart.quantity += serializer.validated_data['quantity']
-                    product_in_cart.save()
-                    return Response({'message': 'Item added successfully.'}, status=status.HTTP_201_CREATED)
-
-                # Save the new item in the user's cart
-                item = serializer.save(cart=cart)
-
+                # Only the id of the user's cart is needed to write the line
+                add_item(
+                    request_cart_id(request),
+                    serializer.validated_data['product'],
+                    serializer.validated_data['quantity'],
+                )
                 return Response({'message': 'Item added successfully.'}, status=status.HTTP_201_CREATED)
+            except InsufficientStock as e:
+                return insufficient_stock_response(e)
             except Exception as e:
                 # Handle unexpected errors during the save process
                 return Response(
@@ -84,7 +116,60 @@ class ItensCartViewSet(viewsets.ModelViewSet):
 
         # Return a 400 Bad Request response if the serializer is invalid
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
+
+    def perform_update(self, serializer):
+        """
+        Save an edited line; when it is moved to a product that already has its
+        own line in the cart, the edited line replaces that one. The stock
+        reservations and the cart totals move by the difference in the same
+        transaction.
+
+        Every line is written with a compare-and-swap on the values read, so
+        the difference is exact: if a concurrent request changed one of them
+        meanwhile, nothing is written and `CartChanged` answers a 409.
+        """
+        with transaction.atomic():
+            item = serializer.instance
+            before_product, before_quantity = item.product_id, item.quantity
+            before_amount = item.quantity * item.product.value
+            product = serializer.validated_data.get('product', item.product)
+            quantity = serializer.validated_data.get('quantity', item.quantity)
+
+            replaced = ItensCart.objects.filter(cart=item.cart_id, product=product).exclude(pk=item.pk)
+            replaced_quantity = 0
+            for pk, replaced_line_quantity in replaced.values_list('pk', 'quantity'):
+                if not ItensCart.objects.filter(pk=pk, quantity=replaced_line_quantity).delete()[0]:
+                    raise CartChanged()
+                replaced_quantity += replaced_line_quantity
+
+            written = ItensCart.objects.filter(
+                pk=item.pk, product_id=before_product, quantity=before_quantity
+            ).update(product=product, quantity=quantity)
+            if not written:
+                raise CartChanged()
+            item.product, item.quantity = product, quantity
+
+            reservations = defaultdict(int)
+            reservations[before_product] -= before_quantity
+            reservations[product.pk] += item.quantity - replaced_quantity
+            for product_id, quantity in reservations.items():
+                adjust_reservation(item.cart_id, product_id, quantity)
+            adjust_totals(
+                item.cart_id,
+                item.quantity - before_quantity - replaced_quantity,
+                (item.quantity - replaced_quantity) * product.value - before_amount,
+            )
+
+    def perform_destroy(self, instance):
+        """
+        Delete a line, releasing its stock and taking it out of the cart
+        totals in the same transaction.
+        """
+        with transaction.atomic():
+            instance.delete()
+            adjust_reservation(instance.cart_id, instance.product_id, -instance.quantity)
+            adjust_totals(instance.cart_id, -instance.quantity, -instance.quantity * instance.product.value)
+
     @action(detail=True, methods=['patch'])
     def reduce_quantity(self, request, pk=None):
         """
@@ -92,15 +177,10 @@ class ItensCartViewSet(viewsets.ModelViewSet):
 
         Functionality:
         - Decreases the quantity of an item in the authenticated user's cart by 1.
-        - If the item's quantity becomes 1 and is reduced further, the item is removed from the cart.
-        - Ensures proper error handling and returns appropriate responses.
-
-        Steps:
-        - Retrieve the cart item using the provided primary key (`pk`).
-        - Check if the quantity is greater than 1:
-            - If yes, reduce the quantity by 1 and save the changes.
-            - If the quantity is 1, delete the item from the cart.
-        - Handle unexpected errors and return appropriate error messages.
+        - If the item's quantity is 1, the item is removed from the cart.
+        - Both are conditional writes on the stored quantity, so a concurrent
+          change of the line is never overwritten; the reservation and the
+          cart totals only move when a unit was actually taken out.
 
         Args:
             request: The HTTP request (not directly used but required by DRF).
@@ -110,28 +190,187 @@ class ItensCartViewSet(viewsets.ModelViewSet):
             Response: A JSON response with a success or error message.
                 - HTTP 200 (OK): If the item quantity is successfully reduced.
                 - HTTP 204 (No Content): If the item is successfully removed from the cart.
-                - HTTP 400 (Bad Request): If the item's quantity cannot be reduced further.
-                - HTTP 500 (Internal Server Error): If an unexpected error occurs during the operation.
+                - HTTP 409 (Conflict): If the line changed meanwhile and the request can be retried.
         """
-        try:
-            # Retrieve the cart item by primary key
-            item = self.get_object()
-
-            if item.quantity > 1:
-                # Reduce quantity and save changes
-                item.quantity -= 1
-                item.save()
-                return Response({'message': 'Item quantity reduced successfully.'}, status=status.HTTP_200_OK)
-            elif item.quantity == 1:
-                # Delete the item if quantity reaches 1
-                item.delete()
-                return Response({'message': 'Item removed successfully.'}, status=status.HTTP_204_NO_CONTENT)
+        # Retrieve the cart item by primary key, checking it belongs to the user
+        item = self.get_object()
+        lines = ItensCart.objects.filter(pk=item.pk)
+
+        with transaction.atomic():
+            if lines.filter(quantity__gt=1).update(quantity=F('quantity') - 1):
+                response = Response({'message': 'Item quantity reduced successfully.'}, status=status.HTTP_200_OK)
+            elif lines.filter(quantity=1).delete()[0]:
+                response = Response({'message': 'Item removed successfully.'}, status=status.HTTP_204_NO_CONTENT)
             else:
-                # Prevent reducing below 1
-                return Response({'error': 'Quantity cannot be reduced below 1.'}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            # Handle unexpected errors
+                return cart_changed_response()
+            adjust_reservation(item.cart_id, item.product_id, -1)
+            adjust_totals(item.cart_id, -1, -item.product.value)
+        return response
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Custom POST method to apply many cart changes in one request.
+
+        Functionality:
+        - Accepts `{"operations": [{"product": id, "quantity": n, "op": "add"|"set"|"remove"}, ...]}`.
+        - Checks that every referenced product exists with one `in_bulk` query.
+        - Applies all operations to the user's cart in a single transaction
+          with bulk create, update and delete, reserving or releasing the
+          stock of every changed line.
+
+        Args:
+            request: The HTTP request containing the list of operations.
+
+        Returns:
+            Response: The resulting lines of the user's cart.
+                - HTTP 200 (OK): If every operation was applied.
+                - HTTP 400 (Bad Request): If an operation is invalid or references an unknown product.
+                - HTTP 409 (Conflict): If a product lacks stock, or the cart was changed
+                  concurrently and the request can be retried.
+        """
+        serializer = CartOperationsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+
+        product_ids = {operation['product'] for operation in operations}
+        found = Products.objects.only('id', 'value').in_bulk(product_ids)
+        missing = sorted(product_ids - found.keys())
+        if missing:
             return Response(
-                {'error': 'An error occurred: ' + str(e)},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                {'detail': 'Products not found.', 'products': missing},
+                status=status.HTTP_400_BAD_REQUEST
             )
+
+        cart_id = request_cart_id(request)
+        try:
+            apply_operations(cart_id, operations, found)
+        except InsufficientStock as e:
+            return insufficient_stock_response(e)
+        except IntegrityError:
+            return cart_changed_response()
+
+        items = ItensCart.objects.filter(cart_id=cart_id).order_by('id')
+        return Response(ItensCartSerializer(items, many=True).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='summary')
+    def summary(self, request):
+        """
+        Custom GET method returning the user's whole cart in one response.
+
+        Functionality:
+        - Lists every line with its nested product data, loaded with
+          `select_related('product')` instead of one product request per line.
+        - Line totals, the unit count and the grand total are computed by the
+          database, in a fixed number of queries however many lines there are.
+        - A user without a cart gets an empty one, created on first use.
+
+        Args:
+            request: The HTTP request of the authenticated user.
+
+        Returns:
+            Response: The cart id, its lines, `item_count` and `total`.
+                - HTTP 200 (OK): The cart summary.
+        """
+        cart, lines = cart_summary(request_cart_id(request))
+        return Response(CartSummarySerializer({**cart, 'items': lines}).data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='badge')
+    def badge(self, request):
+        """
+        Custom GET method returning the cart badge: unit count and subtotal.
+
+        Functionality:
+        - Reads the totals maintained on the user's `Carts` row; no line is
+          aggregated, so the cost does not grow with the cart.
+        - A user without a cart gets an empty one, created on first use.
+
+        Args:
+            request: The HTTP request of the authenticated user.
+
+        Returns:
+            Response: `item_count` and `subtotal` of the user's cart.
+                - HTTP 200 (OK): The cart badge.
+        """
+        cart = Carts.objects.values('item_count', 'subtotal').get(pk=request_cart_id(request))
+        return Response(CartBadgeSerializer(cart).data, status=status.HTTP_200_OK)
+
+
+class GuestCartViewSet(IdempotentMixin, viewsets.ViewSet):
+    """
+    ViewSet for the cart of anonymous visitors, kept in the cache.
+
+    `POST /guest-cart/` opens a cart and returns its signed token; the other
+    requests send it back in the `X-Cart-Token` header. Adding and removing
+    products never writes to the database: the cart is merged into the
+    user's own when the token is sent along with the login request.
+    """
+    permission_classes = [AllowAny]
+    # Not `create`: opening a cart sends no token, so nothing tells callers apart
+    idempotent_actions = ['items']
+    throttle_scopes = dict.fromkeys(['create', 'items'], 'cart')
+    idempotency_scope_headers = (TOKEN_HEADER,)
+
+    def get_guest_cart(self, request):
+        """
+        Return the guest cart named by the request, or an error response.
+        """
+        try:
+            cart = GuestCart.from_request(request)
+        except signing.BadSignature:
+            return None, Response({'detail': 'Invalid cart token.'}, status=status.HTTP_400_BAD_REQUEST)
+        if cart is None:
+            return None, Response({'detail': 'The X-Cart-Token header is required.'}, status=status.HTTP_400_BAD_REQUEST)
+        return cart, None
+
+    def render(self, cart, status_code=status.HTTP_200_OK):
+        items = [{'product': product, 'quantity': quantity} for product, quantity in cart.items.items()]
+        return Response(
+            {'token': cart.token, 'items': items, 'item_count': cart.item_count},
+            status=status_code
+        )
+
+    def create(self, request):
+        """
+        Open an empty guest cart and return its token.
+        """
+        cart = GuestCart()
+        cart.save()
+        return self.render(cart, status.HTTP_201_CREATED)
+
+    def list(self, request):
+        """
+        Return the lines of the guest cart.
+        """
+        cart, error = self.get_guest_cart(request)
+        if error:
+            return error
+        return self.render(cart)
+
+    @action(detail=False, methods=['post'], url_path='items')
+    def items(self, request):
+        """
+        Apply `add`/`set`/`remove` operations to the guest cart.
+
+        Takes the same body as the bulk endpoint of the user cart. The only
+        database access is one `in_bulk` read checking that the products exist.
+        """
+        cart, error = self.get_guest_cart(request)
+        if error:
+            return error
+
+        serializer = CartOperationsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+
+        product_ids = {operation['product'] for operation in operations}
+        missing = sorted(product_ids - Products.objects.only('id').in_bulk(product_ids).keys())
+        if missing:
+            return Response(
+                {'detail': 'Products not found.', 'products': missing},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cart.apply(operations)
+        cart.save()
+        return self.render(cart)
@@ -0,0 +1,12 @@
+import pytest
+from django.core.cache import caches
+from django.conf import settings
+
+
+@pytest.fixture(autouse=True)
+def clear_throttle_counters():
+    """
+    Start every test with empty throttle counters; the suite sends far more
+    requests from one address than a client ever should.
+    """
+    caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')].clear()
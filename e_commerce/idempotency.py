@@ -0,0 +1,130 @@
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from rest_framework.exceptions import APIException
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+# Refusals a retry of the same request may get past: throttling, timeouts,
+# locks and conflicts with concurrent requests or stock. Never stored.
+TRANSIENT_STATUSES = frozenset({408, 409, 423, 425, 429})
+
+
+def get_cache():
+    """
+    Return the cache storing replayable responses (`IDEMPOTENCY_CACHE_ALIAS`).
+
+    Its size bound (`MAX_ENTRIES`) and timeout are what bound the store.
+    """
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')]
+
+
+def idempotency_cache_key(request, scope, key):
+    """
+    Build the store key of a request from its method, path, caller scope and
+    `Idempotency-Key`, so two callers can never replay each other's responses.
+    """
+    raw = '|'.join([request.method, request.path, *scope, key])
+    return f'idempotency:{hashlib.sha256(raw.encode()).hexdigest()}'
+
+
+def error_response(detail, status):
+    return HttpResponse(json.dumps({'detail': detail}), status=status, content_type='application/json')
+
+
+class IdempotentMixin:
+    """
+    ViewSet mixin honouring the `Idempotency-Key` header on mutating actions.
+
+    The first response to a key is stored with a fingerprint of the request
+    body; a retry with the same key gets that response back, marked with
+    `Idempotent-Replayed: true`, without running the handler or touching the
+    database. Reusing a key with a different body is refused with 422, and a
+    retry arriving while the first request is still running gets a 409.
+    Server errors and transient refusals (`TRANSIENT_STATUSES`) are not
+    stored, so they can be retried.
+
+    Keys are scoped to the caller: the authenticated user (so a retry after
+    a token refresh still replays), the `idempotency_scope_headers`, and the
+    body itself with `idempotency_scope_body`. A caller identified by none
+    of them could replay anyone's response, so its key is refused with 400.
+    """
+    idempotent_actions = ()
+    # Secret request headers identifying the caller besides the user, such as a cart token
+    idempotency_scope_headers = ()
+    # Whether the body identifies the caller, e.g. a registration carrying its password
+    idempotency_scope_body = False
+
+    def is_idempotent(self, request):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        return (
+            request.method in ('POST', 'PUT', 'PATCH', 'DELETE')
+            and action in self.idempotent_actions
+            and HEADER in request.META
+        )
+
+    def initialize_request(self, request, *args, **kwargs):
+        if hasattr(request, '_idempotency_request'):
+            return request._idempotency_request
+        return super().initialize_request(request, *args, **kwargs)
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_idempotent(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        key = request.META[HEADER]
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return error_response(f'Idempotency-Key must have 1 to {MAX_KEY_LENGTH} characters.', 400)
+
+        # Authenticated once here; dispatch reuses this request
+        drf_request = request._idempotency_request = self.initialize_request(request, *args, **kwargs)
+        try:
+            user = drf_request.user
+        except APIException:
+            # Let the usual dispatch authenticate again and refuse the credentials
+            del request._idempotency_request
+            return super().dispatch(request, *args, **kwargs)
+
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        scope = [request.META.get(header, '') for header in self.idempotency_scope_headers]
+        if user and user.is_authenticated:
+            scope.append(f'user:{user.pk}')
+        if self.idempotency_scope_body:
+            scope.append(fingerprint)
+        if not any(scope):
+            return error_response('Idempotency-Key can only be used by an identified caller.', 400)
+
+        cache = get_cache()
+        store_key = idempotency_cache_key(request, scope, key)
+
+        entry = cache.get(store_key)
+        if entry is None:
+            lock_key = f'{store_key}:lock'
+            if not cache.add(lock_key, 1, getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 30)):
+                return error_response('A request with this Idempotency-Key is still in progress.', 409)
+            try:
+                response = super().dispatch(request, *args, **kwargs)
+                if hasattr(response, 'render'):
+                    response.render()
+                if response.status_code < 500 and response.status_code not in TRANSIENT_STATUSES:
+                    cache.set(store_key, {
+                        'fingerprint': fingerprint,
+                        'status': response.status_code,
+                        'content': response.content,
+                        'headers': dict(response.items()),
+                    }, getattr(settings, 'IDEMPOTENCY_TIMEOUT', 60 * 60 * 24))
+            finally:
+                cache.delete(lock_key)
+            return response
+
+        if entry['fingerprint'] != fingerprint:
+            return error_response('Idempotency-Key was already used with a different request body.', 422)
+
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers'].items():
+            response[header] = value
+        response['Idempotent-Replayed'] = 'true'
+        return response
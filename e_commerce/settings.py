@@ -50,13 +50,73 @@ AUTH_USER_MODEL = 'users.Users'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
+    # Reverse proxies in front of the app. Throttles key clients by the
+    # address this many hops back in X-Forwarded-For; with 0 the header is
+    # ignored and REMOTE_ADDR is used, so clients cannot pick their counter
+    'NUM_PROXIES': 0,
+    # Fixed-window request counters kept in the THROTTLE_CACHE_ALIAS cache
+    'DEFAULT_THROTTLE_CLASSES': (
+        'e_commerce.throttling.UserThrottle',
+        'e_commerce.throttling.IPThrottle',
+        'e_commerce.throttling.EndpointThrottle',
+    ),
+    'DEFAULT_THROTTLE_RATES': {
+        'user': '600/min',
+        'ip': '300/min',
+        # Endpoint classes, on top of the user or address limit
+        'search': '60/min',
+        'cart': '120/min',
+        'login': '10/min',
+    },
 }
 
+# Product catalog pagination (keyset/cursor based)
+PRODUCTS_PAGE_SIZE = 50
+PRODUCTS_MAX_PAGE_SIZE = 500
+
+# Order history pagination (keyset/cursor based)
+ORDERS_PAGE_SIZE = 20
+ORDERS_MAX_PAGE_SIZE = 100
+
+# Opt-in: serialize product pages from .values() rows with precompiled converters
+PRODUCTS_FAST_SERIALIZATION = False
+
+# Full-response cache for anonymous product reads
+PRODUCTS_CACHE_ALIAS = 'default'
+PRODUCTS_CACHE_TIMEOUT = 300
+PRODUCTS_CACHE_LOCK_TIMEOUT = 10
+
+# Seconds a cart holds the stock of the products added to it
+STOCK_RESERVATION_TTL = 15 * 60
+
+# Guest carts live only in the cache until their owner logs in
+GUEST_CART_CACHE_ALIAS = 'default'
+GUEST_CART_TIMEOUT = 60 * 60 * 24 * 7
+
+# Cart ids of users, so adding to the cart needs no cart lookup
+CART_ID_CACHE_ALIAS = 'default'
+CART_ID_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Authenticated users are read from the cache instead of once per request
+AUTH_USER_CACHE_ALIAS = 'default'
+AUTH_USER_CACHE_TIMEOUT = 60
+
+SIMPLE_JWT = {
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.RevocableTokenRefreshSerializer',
+}
+
+# Revoked tokens are checked in memory; other processes' revocations are
+# picked up every TOKEN_REVOCATION_REFRESH_INTERVAL seconds
+TOKEN_REVOCATION_REFRESH_INTERVAL = 5
+TOKEN_REVOCATION_CAPACITY = 10000
+TOKEN_REVOCATION_ERROR_RATE = 0.01
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'e_commerce.throttling.RateLimitHeadersMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -93,10 +153,52 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Writers wait for each other instead of failing with "database is locked"
+            'timeout': 20,
+        },
+        'TEST': {
+            # A file database, unlike the shared-cache in-memory default,
+            # gives concurrent test threads the same locking as production
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Replayable responses of Idempotency-Key requests: bounded and expiring
+    'idempotency': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'idempotency',
+        'TIMEOUT': 60 * 60 * 24,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+    # Request counters of the API throttles; each lives one throttle window
+    'throttle': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'throttle',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+THROTTLE_CACHE_ALIAS = 'throttle'
+
+IDEMPOTENCY_CACHE_ALIAS = 'idempotency'
+IDEMPOTENCY_TIMEOUT = 60 * 60 * 24
+IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
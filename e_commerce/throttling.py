@@ -0,0 +1,142 @@
+import math
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+def get_cache():
+    """
+    Return the cache holding the throttle counters (`THROTTLE_CACHE_ALIAS`).
+    """
+    return caches[getattr(settings, 'THROTTLE_CACHE_ALIAS', 'default')]
+
+
+class FixedWindowThrottle(SimpleRateThrottle):
+    """
+    Throttle counting the requests of every client per fixed time window.
+
+    A rate of `N/period` allows N requests in each window of one period,
+    aligned on multiples of the period; the count of the current window is
+    one cache counter, so a check is a single atomic `incr` (an `add` for
+    the first request of a window) and never a database query. Refusals are
+    not counted. As windows are fixed, a client can get up to 2N requests
+    through around a window boundary.
+
+    The state of every check is left on the request for
+    `RateLimitHeadersMiddleware` to report.
+    """
+
+    def get_rate(self):
+        # Read at every request so overridden settings apply
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        period = int(self.now // self.duration)
+        self.reset = (period + 1) * self.duration
+        key = f'{self.key}:{period}'
+
+        cache = get_cache()
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # First request of the window; another one may have just created it
+            count = 1 if cache.add(key, 1, self.duration + 1) else cache.incr(key)
+
+        if count > self.num_requests:
+            try:
+                cache.decr(key)
+            except ValueError:
+                # Evicted or expired since: the window stays full until it ends
+                cache.add(key, self.num_requests, self.duration + 1)
+            self.record(request, 0)
+            return self.throttle_failure()
+        self.record(request, self.num_requests - count)
+        return True
+
+    def record(self, request, remaining):
+        states = getattr(request._request, 'throttle_states', [])
+        states.append({'limit': self.num_requests, 'remaining': remaining, 'reset': self.reset - self.now})
+        request._request.throttle_states = states
+
+    def wait(self):
+        return max(self.reset - self.timer(), 0)
+
+
+class UserThrottle(FixedWindowThrottle):
+    """
+    Window per authenticated user (`user` rate).
+    """
+    scope = 'user'
+
+    def get_cache_key(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': request.user.pk}
+
+
+class IPThrottle(FixedWindowThrottle):
+    """
+    Window per client address for anonymous requests (`ip` rate).
+    """
+    scope = 'ip'
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class EndpointThrottle(FixedWindowThrottle):
+    """
+    Window per client and endpoint class, such as `search` or `cart`.
+
+    The class of a view is its `throttle_scope`, or the entry of its action
+    in `throttle_scopes`; views with neither are not limited by it. The rate
+    depends on the view, so it is only read in `allow_request`. Clients are
+    users when authenticated, addresses otherwise.
+    """
+
+    def allow_request(self, request, view):
+        self.scope = getattr(view, 'throttle_scopes', {}).get(getattr(view, 'action', None))
+        self.scope = self.scope or getattr(view, 'throttle_scope', None)
+        if not self.scope:
+            return True
+        self.rate = self.get_rate()
+        self.num_requests, self.duration = self.parse_rate(self.rate)
+        return super().allow_request(request, view)
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = f'user-{request.user.pk}'
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {'scope': self.scope, 'ident': ident}
+
+
+class RateLimitHeadersMiddleware:
+    """
+    Report the tightest throttle of a request in the `RateLimit-Limit`,
+    `RateLimit-Remaining` and `RateLimit-Reset` (seconds) headers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        states = getattr(request, 'throttle_states', None)
+        if states:
+            state = min(states, key=lambda state: (state['remaining'], -state['reset']))
+            response['RateLimit-Limit'] = state['limit']
+            response['RateLimit-Remaining'] = state['remaining']
+            response['RateLimit-Reset'] = max(math.ceil(state['reset']), 0)
+        return response
@@ -2,23 +2,27 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from products.views import ProductsViewSet
-from users.views import UsersViewSet
-from cart.views import ItensCartViewSet
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from users.views import LoginView, LogoutView, UsersViewSet
+from cart.views import GuestCartViewSet, ItensCartViewSet
+from orders.views import OrdersViewSet
+from rest_framework_simplejwt.views import TokenRefreshView
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
 router = DefaultRouter()
 router.register(r'products', ProductsViewSet, basename='product')
 router.register(r'users', UsersViewSet, basename='user')
 router.register(r'cart', ItensCartViewSet, basename='cart')
+router.register(r'guest-cart', GuestCartViewSet, basename='guest-cart')
+router.register(r'orders', OrdersViewSet, basename='order')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
     path('api/', include(router.urls)),
 
-    path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('api/token/', LoginView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('api/token/revoke/', LogoutView.as_view(), name='token_revoke'),
 
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
@@ -0,0 +1,119 @@
+import math
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from orders.models import Orders
+from orders.views import OrdersViewSet
+from users.models import Users
+
+
+class Command(BaseCommand):
+    help = (
+        'Time order history pages at increasing depths over a large seeded order table. '
+        'Rows are created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1000000, help='Orders to seed.')
+        parser.add_argument('--users', type=int, default=100, help='Users the orders are spread over.')
+        parser.add_argument('--page-size', type=int, default=20, help='Orders per history page.')
+        parser.add_argument(
+            '--pages', type=int, nargs='+',
+            help='Page numbers to time (1 is the newest page); by default 1, 10, 100... and the last page.'
+        )
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per page; the best is kept.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            started = time.perf_counter()
+            user = self.seed(options['orders'], options['users'])
+            user_orders = Orders.objects.filter(user=user).count()
+            self.stdout.write(
+                f'Seeded {options["orders"]:,} orders over {options["users"]} users '
+                f'in {time.perf_counter() - started:.1f}s; '
+                f'user under test has {user_orders:,} orders.'
+            )
+
+            last_page = max(math.ceil(user_orders / options['page_size']), 1)
+            wanted = self.probe_pages(options['pages'], last_page)
+
+            view = OrdersViewSet.as_view({'get': 'history'})
+            factory = APIRequestFactory()
+            url = f'/api/orders/history/?page_size={options["page_size"]}'
+            page = 0
+            while url and wanted:
+                page += 1
+                request = factory.get(url, HTTP_HOST='localhost')
+                force_authenticate(request, user=user)
+                if page == wanted[0]:
+                    wanted.pop(0)
+                    best = self.measure(view, factory, url, user, options['repeat'])
+                    self.stdout.write(f'page {page:>6}: {best * 1000:.2f} ms')
+                url = view(request).data['next']
+
+            with connection.cursor() as cursor:
+                sql, params = Orders.objects.filter(user=user).order_by('-data_created', '-id')[:21].query.sql_with_params()
+                if connection.vendor == 'sqlite':
+                    cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+                    self.stdout.write('plan: ' + '; '.join(row[-1] for row in cursor.fetchall()))
+
+            transaction.set_rollback(True)
+
+    def probe_pages(self, pages, last_page):
+        """
+        Return the sorted pages to time: `pages` without those past the last
+        page, which are reported, or 1, 10, 100... and the last page.
+        """
+        if pages is None:
+            pages = [10 ** i for i in range(int(math.log10(last_page)) + 1)] + [last_page]
+        skipped = sorted(page for page in set(pages) if page > last_page or page < 1)
+        if skipped:
+            self.stderr.write(
+                f'Skipping page(s) {", ".join(map(str, skipped))}: the history has {last_page:,} pages.'
+            )
+        return sorted(set(pages) - set(skipped))
+
+    @staticmethod
+    def measure(view, factory, url, user, repeat):
+        """
+        Return the best wall time of serving `url`, queries and rendering included.
+        """
+        best = None
+        for _ in range(repeat):
+            request = factory.get(url, HTTP_HOST='localhost')
+            force_authenticate(request, user=user)
+            started = time.perf_counter()
+            view(request).render()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    @staticmethod
+    def seed(orders, users):
+        """
+        Create `users` users and `orders` orders spread evenly over them;
+        return the user whose history is timed.
+        """
+        Users.objects.bulk_create(
+            Users(
+                username=f'bench-{i}', cpf=f'bench-{i}', email=f'bench-{i}@example.com', password='!'
+            )
+            for i in range(users)
+        )
+        user_ids = list(Users.objects.filter(username__startswith='bench-').values_list('id', flat=True))
+        batch = []
+        for i in range(orders):
+            batch.append(Orders(
+                user_id=user_ids[i % len(user_ids)],
+                item_count=1 + i % 5,
+                total=Decimal(i % 100000) / 100,
+            ))
+            if len(batch) == 10000:
+                Orders.objects.bulk_create(batch)
+                batch = []
+        Orders.objects.bulk_create(batch)
+        return Users.objects.get(pk=user_ids[0])
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orders',
+            index=models.Index(fields=['user', 'data_created', 'id', 'status', 'item_count', 'total'], name='orders_user_created_idx'),
+        ),
+    ]
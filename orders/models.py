@@ -1,3 +1,39 @@
 from django.db import models
+from users.models import Users
+from products.models import Products
 
-# Create your models here.
+class Orders(models.Model):
+    STATUS_CHOICES = [
+        ('placed', 'Placed'),
+        ('paid', 'Paid'),
+        ('shipped', 'Shipped'),
+        ('cancelled', 'Cancelled'),
+    ]
+
+    user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='orders')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='placed')
+    item_count = models.PositiveIntegerField()
+    total = models.DecimalField(max_digits=20, decimal_places=2)
+    data_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Order history: a user's orders newest first, keyset paginated. The
+            # listed columns trail the key so pages are read from the index
+            # alone on every database (SQLite has no INCLUDE)
+            models.Index(
+                fields=['user', 'data_created', 'id', 'status', 'item_count', 'total'],
+                name='orders_user_created_idx',
+            ),
+        ]
+
+class ItensOrder(models.Model):
+    """
+    A line of an order, snapshotting the product name and price at checkout
+    so later catalog changes never alter past orders.
+    """
+    order = models.ForeignKey(Orders, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Products, on_delete=models.SET_NULL, null=True)
+    name = models.CharField(max_length=255)
+    unit_value = models.DecimalField(max_digits=15, decimal_places=2)
+    quantity = models.PositiveIntegerField()
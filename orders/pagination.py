@@ -0,0 +1,22 @@
+from django.conf import settings
+
+from products.pagination import KeysetPagination
+
+
+class OrdersCursorPagination(KeysetPagination):
+    """
+    Keyset pagination of order listings, newest first by default.
+
+    Both orderings walk the `(user, data_created, id)` index once the
+    queryset is filtered by user. Page sizes come from the
+    `ORDERS_PAGE_SIZE` and `ORDERS_MAX_PAGE_SIZE` settings.
+    """
+    orderings = {
+        '-created': ('-data_created', '-id'),
+        'created': ('data_created', 'id'),
+    }
+    default_ordering = '-created'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'ORDERS_PAGE_SIZE', 20)
+        self.max_page_size = getattr(settings, 'ORDERS_MAX_PAGE_SIZE', 100)
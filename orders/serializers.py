@@ -0,0 +1,30 @@
+from rest_framework import serializers
+from .models import ItensOrder, Orders
+
+class ItensOrderSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ItensOrder
+        fields = [
+            'id', 'product', 'name', 'unit_value', 'quantity'
+        ]
+
+
+class OrdersSerializer(serializers.ModelSerializer):
+    items = ItensOrderSerializer(many=True, read_only=True)
+
+    class Meta:
+        model = Orders
+        fields = [
+            'id', 'user', 'status', 'item_count', 'total', 'data_created', 'items'
+        ]
+
+
+class OrderHistorySerializer(serializers.ModelSerializer):
+    """
+    An order in the history listing: only the totals stored on the order row.
+    """
+    class Meta:
+        model = Orders
+        fields = [
+            'id', 'status', 'item_count', 'total', 'data_created'
+        ]
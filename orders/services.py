@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models.functions import Now
+
+from cart.models import Carts, ItensCart
+from cart.services import cart_holder
+from products import stock
+
+from .models import ItensOrder, Orders
+
+
+class EmptyCart(Exception):
+    """
+    Raised when checking out a cart without lines.
+    """
+
+
+def checkout(user):
+    """
+    Turn the user's cart into an order, in one transaction.
+
+    The cart lines are read once with their product name and price, the
+    order and all of its lines are inserted with one `bulk_create`, the
+    stock is sold with one conditional `UPDATE` (consuming the cart's
+    reservations) and one insert into the inventory ledger, and the cart is
+    emptied. The number of queries does not depend on the number of lines.
+
+    Args:
+        user (Users): The user checking out.
+
+    Returns:
+        Orders: The placed order.
+
+    Raises:
+        EmptyCart: If the cart has no lines.
+        stock.InsufficientStock: If a product cannot cover its line; nothing is written.
+    """
+    with transaction.atomic():
+        lines = list(
+            ItensCart.objects.filter(cart__user=user).order_by('id').values(
+                'cart_id', 'product_id', 'quantity', 'product__name', 'product__value'
+            )
+        )
+        if not lines:
+            raise EmptyCart()
+        cart_id = lines[0]['cart_id']
+
+        order = Orders.objects.create(
+            user=user,
+            item_count=sum(line['quantity'] for line in lines),
+            total=sum(line['quantity'] * line['product__value'] for line in lines),
+        )
+        ItensOrder.objects.bulk_create(
+            ItensOrder(
+                order=order,
+                product_id=line['product_id'],
+                name=line['product__name'],
+                unit_value=line['product__value'],
+                quantity=line['quantity'],
+            )
+            for line in lines
+        )
+
+        stock.sell(
+            cart_holder(cart_id),
+            {line['product_id']: line['quantity'] for line in lines},
+            reference=f'order:{order.id}',
+        )
+
+        ItensCart.objects.filter(cart_id=cart_id).delete()
+        Carts.objects.filter(pk=cart_id).update(item_count=0, subtotal=0, data_updated=Now())
+    return order
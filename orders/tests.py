@@ -1,3 +1,224 @@
+from decimal import Decimal
+from django.core.cache import caches
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from cart.models import Carts, ItensCart
+from cart.services import add_item
+from products import stock
+from products.models import CategoryFacets, InventoryMovements, Products, StockReservations
+from users.models import Users
+from .models import ItensOrder, Orders
 
-# Create your tests here.
+class CheckoutTestCase(TestCase):
+
+    def setUp(self):
+        caches['idempotency'].clear()
+        self.user = Users.objects.create(
+            username="joaosilva",
+            first_name="João",
+            last_name="Silva",
+            cpf="111.222.333-44",
+            email="joao.silva@example.com",
+        )
+        self.cart = Carts.objects.create(user=self.user)
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        self.product1 = Products.objects.create(
+            name="Smartphone XYZ 5G",
+            category="Electronics",
+            description="Smartphone com 5G e câmera de 64MP.",
+            value=99.99,
+            storage=10
+        )
+        self.product2 = Products.objects.create(
+            name="Camiseta Masculina Slim Fit",
+            category="Clothing",
+            description="Camiseta slim fit em algodão.",
+            value=49.99,
+            storage=3
+        )
+        add_item(self.cart.id, self.product1, 2)
+        add_item(self.cart.id, self.product2, 3)
+
+    def test_checkout(self):
+        """
+        Test checkout snapshots the cart into an order and sells its stock
+        """
+        url = reverse('order-checkout')
+
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['item_count'], 5)
+        self.assertEqual(response.data['total'], '349.95')
+        self.assertEqual(
+            [(item['name'], item['unit_value'], item['quantity']) for item in response.data['items']],
+            [("Smartphone XYZ 5G", '99.99', 2), ("Camiseta Masculina Slim Fit", '49.99', 3)]
+        )
+
+        self.assertEqual((stock.available(self.product1.id), stock.available(self.product2.id)), (8, 0))
+        self.assertEqual(
+            list(InventoryMovements.objects.order_by('product_id').values_list('delta', 'reference')),
+            [(-2, f"order:{response.data['id']}"), (-3, f"order:{response.data['id']}")]
+        )
+        self.assertFalse(StockReservations.objects.exists())
+
+        # The sales reach the storage snapshot and the facets once compacted
+        stock.compact()
+        self.product1.refresh_from_db()
+        self.product2.refresh_from_db()
+        self.assertEqual((self.product1.storage, self.product1.reserved), (8, 0))
+        self.assertEqual((self.product2.storage, self.product2.reserved), (0, 0))
+        self.assertEqual(CategoryFacets.objects.get(category="Clothing").total_storage, 0)
+
+        self.assertFalse(ItensCart.objects.filter(cart=self.cart).exists())
+        self.cart.refresh_from_db()
+        self.assertEqual((self.cart.item_count, self.cart.subtotal), (0, Decimal('0')))
+
+        # Later price changes leave the order untouched
+        self.product1.value = 10
+        self.product1.save()
+        self.assertEqual(ItensOrder.objects.get(product=self.product1).unit_value, Decimal('99.99'))
+
+    def test_checkout_idempotency_key(self):
+        """
+        Test a retried checkout replays the placed order instead of placing another
+        """
+        url = reverse('order-checkout')
+
+        first = self.client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(0):
+            replay = self.client.post(url, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        self.assertEqual(replay.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(replay.json()['id'], first.data['id'])
+        self.assertEqual(Orders.objects.count(), 1)
+
+    def test_checkout_insufficient_stock(self):
+        """
+        Test checkout fails cleanly and changes nothing when stock is short
+        """
+        # The hold expired and another buyer took the units meanwhile
+        StockReservations.objects.filter(product=self.product2).delete()
+        Products.objects.filter(pk=self.product2.pk).update(reserved=0, storage=1)
+
+        response = self.client.post(reverse('order-checkout'))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['product'], self.product2.id)
+        self.assertEqual(response.data['available'], 1)
+
+        self.assertFalse(Orders.objects.exists())
+        self.assertEqual(ItensCart.objects.filter(cart=self.cart).count(), 2)
+        self.product1.refresh_from_db()
+        self.assertEqual((self.product1.storage, self.product1.reserved), (10, 2))
+
+    def test_checkout_empty_cart(self):
+        """
+        Test checkout of an empty cart is refused
+        """
+        ItensCart.objects.filter(cart=self.cart).delete()
+
+        response = self.client.post(reverse('order-checkout'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_checkout_query_count(self):
+        """
+        Test checkout runs the same number of queries however many lines the cart has
+        """
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(reverse('order-checkout'))
+
+        for i in range(15):
+            product = Products.objects.create(
+                name=f"Produto {i}", category=f"Categoria {i % 3}", description="Produto.", value=5, storage=4
+            )
+            add_item(self.cart.id, product, 2)
+
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(reverse('order-checkout'))
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), 15)
+        self.assertEqual(len(large.captured_queries), len(small.captured_queries))
+
+    def test_list_orders(self):
+        """
+        Test users only list their own orders
+        """
+        self.client.post(reverse('order-checkout'))
+        other = Users.objects.create(username="outro", cpf="999.888.777-66", email="outro@example.com")
+        Orders.objects.create(user=other, item_count=1, total=1)
+
+        response = self.client.get(reverse('order-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['user'], self.user.id)
+
+
+class OrderHistoryTestCase(TestCase):
+
+    def setUp(self):
+        self.user = Users.objects.create(
+            username="carlaramos", cpf="222.333.444-55", email="carla.ramos@example.com"
+        )
+        self.other = Users.objects.create(
+            username="pedroalves", cpf="333.444.555-66", email="pedro.alves@example.com"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+
+        # Created one by one, so many share the same millisecond
+        self.orders = [
+            Orders.objects.create(user=self.user, item_count=i % 4 + 1, total=Decimal(i)).id
+            for i in range(45)
+        ]
+        Orders.objects.create(user=self.other, item_count=1, total=1)
+
+    def test_history_walks_every_order_once(self):
+        """
+        Test following the cursors returns the user's orders newest first, each once
+        """
+        url = reverse('order-history') + '?page_size=10'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen += [order['id'] for order in response.data['results']]
+            url = response.data['next']
+
+        self.assertEqual(seen, self.orders[::-1])
+        self.assertEqual(
+            set(response.data['results'][0]), {'id', 'status', 'item_count', 'total', 'data_created'}
+        )
+
+    def test_history_query_count(self):
+        """
+        Test a history page is one query whatever its depth, and never reads order lines
+        """
+        url = reverse('order-history') + '?page_size=10'
+        for _ in range(4):
+            with self.assertNumQueries(1):
+                response = self.client.get(url)
+            url = response.data['next']
+
+    def test_history_uses_covering_index(self):
+        """
+        Test the history query is served from the (user, data_created, id) index alone
+        """
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plan assertions are written for SQLite.')
+
+        response = self.client.get(reverse('order-history') + '?page_size=10')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(response.data['next'])
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {queries.captured_queries[0]["sql"]}')
+            plan = ' '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('USING COVERING INDEX orders_user_created_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
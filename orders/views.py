@@ -1,3 +1,87 @@
-from django.shortcuts import render
+from rest_framework import viewsets, status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from e_commerce.idempotency import IdempotentMixin
+from products.stock import InsufficientStock
+from .models import Orders
+from .pagination import OrdersCursorPagination
+from .serializers import OrderHistorySerializer, OrdersSerializer
+from .services import EmptyCart, checkout
 
-# Create your views here.
+class OrdersViewSet(IdempotentMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    ViewSet for the orders of the authenticated user and the checkout.
+
+    Users only see their own orders; staff see every order. Listings are
+    keyset paginated, and `history` pages through the user's own orders
+    using only the totals stored on each order.
+    """
+    serializer_class = OrdersSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrdersCursorPagination  # Cursor pagination without OFFSET scans
+    idempotent_actions = ['checkout']  # A retried checkout never places a second order
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Orders.objects.prefetch_related('items')
+
+        if user.is_staff:
+            return queryset
+
+        return queryset.filter(user=user)
+
+    @action(detail=False, methods=['get'])
+    def history(self, request):
+        """
+        Custom GET method listing the authenticated user's own orders, newest first.
+
+        Functionality:
+        - Always scoped to `request.user`, staff included.
+        - Keyset (cursor) pagination over the `(user, data_created, id)` index,
+          so every page costs the same however deep it is.
+        - Serves the item count and total stored on the order row; order lines
+          are neither fetched nor aggregated.
+
+        Args:
+            request: The HTTP request of the authenticated user.
+
+        Returns:
+            Response: A page of orders with `next`/`previous` cursor links.
+                - HTTP 200 (OK): The requested page.
+        """
+        queryset = Orders.objects.filter(user=request.user).only(*OrderHistorySerializer.Meta.fields)
+        page = self.paginate_queryset(queryset)
+        return self.get_paginated_response(OrderHistorySerializer(page, many=True).data)
+
+    @action(detail=False, methods=['post'])
+    def checkout(self, request):
+        """
+        Custom POST method placing an order with the content of the user's cart.
+
+        Functionality:
+        - Snapshots every cart line with the current product name and price.
+        - Takes the units out of the product storage with a conditional update,
+          consuming the stock the cart had reserved.
+        - Inserts the order lines in bulk and empties the cart.
+        - Everything happens in one transaction, in a fixed number of queries.
+
+        Args:
+            request: The HTTP request of the authenticated user.
+
+        Returns:
+            Response: The placed order with its lines.
+                - HTTP 201 (Created): If the order was placed.
+                - HTTP 400 (Bad Request): If the cart is empty.
+                - HTTP 409 (Conflict): If a product does not have enough stock; nothing is changed.
+        """
+        try:
+            order = checkout(request.user)
+        except EmptyCart:
+            return Response({'detail': 'The cart is empty.'}, status=status.HTTP_400_BAD_REQUEST)
+        except InsufficientStock as e:
+            return Response(
+                {'detail': 'Not enough stock available.', 'product': e.product_id, 'available': e.available},
+                status=status.HTTP_409_CONFLICT
+            )
+        return Response(OrdersSerializer(order).data, status=status.HTTP_201_CREATED)
@@ -2,4 +2,21 @@ from django.contrib import admin
 from .models import Products
 
 # Register your models here.
-admin.site.register(Products)
\ No newline at end of file
+@admin.register(Products)
+class ProductsAdmin(admin.ModelAdmin):
+
+    def get_readonly_fields(self, request, obj=None):
+        # Only carts move the reservations, and the stock of existing
+        # products only changes through the inventory ledger
+        return ('storage', 'reserved') if obj else ('reserved',)
+
+    def save_model(self, request, obj, form, change):
+        """
+        Save only the edited fields, like `ProductsSerializer.update`, so the
+        stock counters that carts and checkouts move concurrently are never
+        written back from the form's stale instance.
+        """
+        if change:
+            obj.save(update_fields=[*form.changed_data, 'data_updated'])
+        else:
+            obj.save()
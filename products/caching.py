@@ -0,0 +1,147 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+VERSION_KEY = 'products:version'
+
+
+def get_cache():
+    """
+    Return the cache used for product responses (`PRODUCTS_CACHE_ALIAS`).
+    """
+    return caches[getattr(settings, 'PRODUCTS_CACHE_ALIAS', 'default')]
+
+
+def get_version():
+    """
+    Return the current catalog version, part of every response cache key.
+    """
+    return get_cache().get_or_set(VERSION_KEY, 1, None)
+
+
+def bump_version():
+    """
+    Invalidate every cached product response at once.
+
+    Old entries are never read again because the keys include the version;
+    they simply expire.
+    """
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # The version key was evicted; start a new one that cannot collide
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def response_cache_key(request):
+    """
+    Build the cache key for a request from its scheme, host, path,
+    normalized query string and accepted media types. Pages link to each
+    other with absolute URLs, so they differ per scheme and host.
+    """
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    accept = request.META.get('HTTP_ACCEPT', '')
+    origin = f'{request.scheme}://{request.get_host()}'
+    digest = hashlib.md5(f'{origin}{request.path}?{query}|{accept}'.encode()).hexdigest()
+    return f'products:response:{get_version()}:{digest}'
+
+
+def get_or_compute(key, compute):
+    """
+    Return the cached entry for `key`, computing it at most once at a time.
+
+    The first caller of a cold key takes a short lock and runs `compute`;
+    concurrent callers wait for its result instead of hitting the database.
+    If the lock holder takes too long the waiters compute it themselves.
+
+    Args:
+        key (str): Cache key of the entry.
+        compute (callable): Returns `(entry, cacheable)`.
+
+    Returns:
+        tuple: `(entry, hit)` where `hit` tells whether it came from the cache.
+    """
+    cache = get_cache()
+    timeout = getattr(settings, 'PRODUCTS_CACHE_TIMEOUT', 300)
+    lock_timeout = getattr(settings, 'PRODUCTS_CACHE_LOCK_TIMEOUT', 10)
+
+    entry = cache.get(key)
+    if entry is not None:
+        return entry, True
+
+    lock_key = f'{key}:lock'
+    if not cache.add(lock_key, 1, lock_timeout):
+        deadline = time.monotonic() + lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(0.01)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry, True
+            if cache.add(lock_key, 1, lock_timeout):
+                break  # The previous holder gave up without storing anything
+
+    try:
+        entry, cacheable = compute()
+        if cacheable:
+            cache.set(key, entry, timeout)
+    finally:
+        cache.delete(lock_key)
+    return entry, False
+
+
+class CachedResponseMixin:
+    """
+    ViewSet mixin caching full responses of anonymous read requests.
+
+    Only GET requests without credentials to the actions listed in
+    `cached_actions` are cached, so the result is the same for every caller.
+    Entries are invalidated as a whole by `bump_version`, which runs whenever
+    a product is created, updated or deleted.
+    """
+    cached_actions = ()
+
+    def is_cacheable(self, request):
+        action = getattr(self, 'action_map', {}).get(request.method.lower())
+        return (
+            request.method == 'GET'
+            and action in self.cached_actions
+            and 'HTTP_AUTHORIZATION' not in request.META
+        )
+
+    def dispatch(self, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        def compute():
+            response = super(CachedResponseMixin, self).dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            entry = {
+                'status': response.status_code,
+                'content': response.content,
+                'headers': dict(response.items()),
+            }
+            return entry, response.status_code == 200
+
+        entry, hit = get_or_compute(response_cache_key(request), compute)
+
+        # Conditional GETs are answered from the validators stored with the entry
+        last_modified = parse_http_date_safe(entry['headers'].get('Last-Modified', ''))
+        not_modified = get_conditional_response(
+            request, etag=entry['headers'].get('ETag'), last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers'].items():
+            response[header] = value
+        response['X-Cache'] = 'HIT' if hit else 'MISS'
+        return response
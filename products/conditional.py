@@ -0,0 +1,68 @@
+import hashlib
+from urllib.parse import urlencode
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_etag(request, *parts):
+    """
+    Build a quoted ETag from the validator parts, the normalized query string
+    and the accepted media types (JSON and browsable pages differ).
+    """
+    query = urlencode(sorted(request.GET.lists()), doseq=True)
+    accept = request.META.get('HTTP_ACCEPT', '')
+    raw = '|'.join([*map(str, parts), query, accept])
+    return f'"{hashlib.md5(raw.encode()).hexdigest()}"'
+
+
+def page_validators(request, page, paginator):
+    """
+    Return `(etag, last_modified)` for one page of products.
+
+    Derived from the rows (model instances or `.values()` dicts) the page
+    query already fetched: the newest `data_updated`, the row count and ids,
+    and whether there are neighbouring pages. Any create, update or delete
+    that changes the page changes the ETag, and nothing has to be serialized
+    to compare it.
+    """
+    if page and isinstance(page[0], dict):
+        rows = [(row['id'], row['data_updated']) for row in page]
+    else:
+        rows = [(product.pk, product.data_updated) for product in page]
+    last_modified = max((updated for pk, updated in rows), default=None)
+    etag = make_etag(request, last_modified, len(rows), rows, paginator.has_next, paginator.has_previous)
+    return etag, last_modified
+
+
+def instance_validators(request, instance):
+    """
+    Return `(etag, last_modified)` for one product from its `data_updated`.
+    """
+    return make_etag(request, instance.pk, instance.data_updated), instance.data_updated
+
+
+def conditional_response(request, validators, get_response):
+    """
+    Answer a conditional GET before serializing anything.
+
+    Args:
+        request: The incoming request.
+        validators (tuple): `(etag, last_modified)` of the current resource.
+        get_response (callable): Builds the full response when needed.
+
+    Returns:
+        A 304 response without body when the client copy is still fresh,
+        otherwise the full response carrying `ETag` and `Last-Modified`.
+    """
+    etag, last_modified = validators
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = get_response()
+
+    response['ETag'] = etag
+    if timestamp is not None:
+        response['Last-Modified'] = http_date(timestamp)
+    return response
@@ -0,0 +1,54 @@
+import csv
+import json
+
+from .models import Products
+from .serializers import products_values_serializer
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+EXPORT_FIELDS = products_values_serializer.field_names
+
+
+class Echo:
+    """
+    File-like object that hands back what is written, so `csv.writer` can
+    produce lines for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def export_queryset(updated_since=None):
+    """
+    Return the rows to export as plain dicts, in a stable indexed order.
+
+    With `updated_since` only products updated at or after that moment are
+    exported, walking the `(data_updated, id)` index.
+    """
+    queryset = products_values_serializer.values(Products.objects.all())
+    if updated_since is not None:
+        return queryset.filter(data_updated__gte=updated_since).order_by('data_updated', 'id')
+    return queryset.order_by('id')
+
+
+def export_lines(queryset, file_format, chunk_size=2000):
+    """
+    Yield the export one line at a time.
+
+    Rows are read with a server-side iterator in chunks of `chunk_size`, so
+    memory stays bounded regardless of the catalog size.
+    """
+    rows = products_values_serializer.represent(queryset.iterator(chunk_size=chunk_size))
+
+    if file_format == 'ndjson':
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+        return
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for row in rows:
+        yield writer.writerow([row[name] for name in EXPORT_FIELDS])
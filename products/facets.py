@@ -0,0 +1,122 @@
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Max, Min, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import CategoryFacets, Products
+
+
+def as_price(value):
+    """
+    Normalize a price (Decimal, float or str) the way the database stores it.
+    """
+    field = Products._meta.get_field('value')
+    return field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+
+
+def add_product(category, value, storage):
+    """
+    Count a product in its category facet.
+    """
+    value = as_price(value)
+    CategoryFacets.objects.bulk_create([CategoryFacets(category=category)], ignore_conflicts=True)
+    CategoryFacets.objects.filter(category=category).update(
+        product_count=F('product_count') + 1,
+        total_storage=F('total_storage') + storage,
+        min_value=Least(Coalesce('min_value', Value(value)), Value(value)),
+        max_value=Greatest(Coalesce('max_value', Value(value)), Value(value)),
+    )
+
+
+def remove_product(category, value, storage):
+    """
+    Stop counting a product in its category facet.
+
+    The price range only has to be recomputed when the product held the
+    minimum or maximum, and then it is an index lookup on `(category, value)`.
+    """
+    value = as_price(value)
+    CategoryFacets.objects.filter(category=category).update(
+        product_count=F('product_count') - 1,
+        total_storage=F('total_storage') - storage,
+    )
+    facet = CategoryFacets.objects.filter(category=category).values('product_count', 'min_value', 'max_value').first()
+    if facet is None:
+        return
+    if facet['product_count'] <= 0:
+        CategoryFacets.objects.filter(category=category, product_count__lte=0).delete()
+    elif value in (facet['min_value'], facet['max_value']):
+        CategoryFacets.objects.filter(category=category).update(
+            **Products.objects.filter(category=category).aggregate(min_value=Min('value'), max_value=Max('value'))
+        )
+
+
+def product_saved(previous, product):
+    """
+    Apply a product create or update to the facets.
+
+    Args:
+        previous (dict): `category`, `value` and `storage` before the save,
+            or None for a new product.
+        product (Products): The saved product.
+    """
+    with transaction.atomic():
+        if previous is None:
+            add_product(product.category, product.value, product.storage)
+        elif previous['category'] != product.category or previous['value'] != as_price(product.value):
+            remove_product(previous['category'], previous['value'], previous['storage'])
+            add_product(product.category, product.value, product.storage)
+        elif previous['storage'] != product.storage:
+            CategoryFacets.objects.filter(category=product.category).update(
+                total_storage=F('total_storage') + (product.storage - previous['storage'])
+            )
+
+
+def product_deleted(product):
+    """
+    Apply a product delete to the facets.
+    """
+    with transaction.atomic():
+        remove_product(product.category, product.value, product.storage)
+
+
+def add_storage(units):
+    """
+    Add compacted stock movements to the category totals with one `UPDATE`.
+
+    Args:
+        units (dict): Units added (or taken out, when negative) by category.
+    """
+    if units:
+        CategoryFacets.objects.filter(category__in=units).update(
+            total_storage=F('total_storage') + Case(
+                *[When(category=category, then=Value(count)) for category, count in units.items()],
+                default=Value(0),
+            )
+        )
+
+
+def rebuild(categories=None):
+    """
+    Recompute the facets from the `Products` table.
+
+    Args:
+        categories (iterable): Only rebuild these categories; all when None.
+    """
+    products = Products.objects.all()
+    facets = CategoryFacets.objects.all()
+    if categories is not None:
+        categories = list(categories)
+        products = products.filter(category__in=categories)
+        facets = facets.filter(category__in=categories)
+
+    rows = products.values('category').order_by().annotate(
+        product_count=Count('id'),
+        min_value=Min('value'),
+        max_value=Max('value'),
+        total_storage=Sum('storage'),
+    )
+    with transaction.atomic():
+        facets.delete()
+        CategoryFacets.objects.bulk_create(CategoryFacets(**row) for row in rows)
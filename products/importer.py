@@ -0,0 +1,179 @@
+import csv
+import io
+import json
+import time
+
+from django.db import DatabaseError, transaction
+from rest_framework.exceptions import ValidationError
+
+from .models import Products
+from .serializers import ProductsSerializer
+from .signals import products_changed
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+# Not `storage`: the stock of existing products only changes through the inventory ledger
+UPDATE_FIELDS = ['name', 'category', 'description', 'value', 'data_updated']
+
+
+class ImportReport:
+    """
+    Summary of a bulk import: row counts, throughput and per-row errors.
+
+    Only the first `max_errors` errors are kept so that memory stays constant
+    on feeds with many bad rows; `failed` always holds the full count.
+    """
+
+    def __init__(self, max_errors=100):
+        self.max_errors = max_errors
+        self.imported = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.monotonic()
+        self.elapsed = 0.0
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'errors': errors})
+
+    @property
+    def rows_per_second(self):
+        return round((self.imported + self.failed) / self.elapsed, 1) if self.elapsed else 0.0
+
+    def finish(self):
+        self.elapsed = time.monotonic() - self.started
+        return self
+
+    def as_dict(self):
+        return {
+            'imported': self.imported,
+            'failed': self.failed,
+            'errors': self.errors,
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_second': self.rows_per_second,
+        }
+
+
+def iter_rows(stream, file_format):
+    """
+    Yield `(line, row)` pairs from a text stream without reading it whole.
+
+    A JSONL line that is not a JSON object is yielded as `(line, None)`.
+    """
+    if file_format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError:
+            row = None
+        yield line, row if isinstance(row, dict) else None
+
+
+def open_text(binary_stream):
+    """
+    Wrap a binary upload or file in a UTF-8 text stream for `iter_rows`.
+    """
+    return io.TextIOWrapper(binary_stream, encoding='utf-8-sig', newline='')
+
+
+class ProductImporter:
+    """
+    Streams product rows into the database in batches.
+
+    Every batch is validated with the `ProductsSerializer` rules and written
+    with one `bulk_create` inside its own transaction. With `upsert`, rows
+    carrying an `id` update the existing product instead of creating one;
+    their `storage` is ignored, as stock changes are recorded as movements.
+
+    Args:
+        batch_size (int): Rows validated and inserted per transaction.
+        upsert (bool): Update products whose `id` already exists.
+        max_errors (int): Maximum number of row errors kept in the report.
+    """
+
+    def __init__(self, batch_size=1000, upsert=False, max_errors=100):
+        self.batch_size = batch_size
+        self.upsert = upsert
+        self.max_errors = max_errors
+        self.validator = ProductsSerializer()
+
+    def run(self, stream, file_format):
+        """
+        Import every row of `stream` and return an `ImportReport`.
+        """
+        if file_format not in IMPORT_FORMATS:
+            raise ValueError(f'Unsupported format {file_format!r}; choose one of {", ".join(IMPORT_FORMATS)}.')
+
+        report = ImportReport(self.max_errors)
+        batch = []
+        for line, row in iter_rows(stream, file_format):
+            if row is None:
+                report.add_error(line, {'non_field_errors': ['Invalid JSON object.']})
+                continue
+            batch.append((line, row))
+            if len(batch) >= self.batch_size:
+                self.import_batch(batch, report)
+                batch = []
+        if batch:
+            self.import_batch(batch, report)
+        return report.finish()
+
+    def import_batch(self, batch, report):
+        """
+        Validate and write one batch, recording errors in the report.
+        """
+        products = []
+        lines = []
+        for line, row in batch:
+            try:
+                # One serializer instance validates every row, like `many=True` does
+                data = self.validator.run_validation(row)
+            except ValidationError as e:
+                report.add_error(line, e.detail)
+                continue
+
+            product = Products(**data)
+            if self.upsert and row.get('id') not in (None, ''):
+                try:
+                    product.pk = int(row['id'])
+                except (TypeError, ValueError):
+                    report.add_error(line, {'id': ['A valid integer is required.']})
+                    continue
+            products.append(product)
+            lines.append(line)
+
+        if not products:
+            return
+
+        # Categories touched by the batch, including those upserted rows leave
+        categories = {product.category for product in products}
+        existing = [product.pk for product in products if product.pk is not None]
+        if existing:
+            categories.update(Products.objects.filter(pk__in=existing).values_list('category', flat=True))
+
+        try:
+            with transaction.atomic():
+                if self.upsert:
+                    Products.objects.bulk_create(
+                        products,
+                        update_conflicts=True,
+                        unique_fields=['id'],
+                        update_fields=UPDATE_FIELDS,
+                    )
+                else:
+                    Products.objects.bulk_create(products)
+        except DatabaseError as e:
+            for line in lines:
+                report.add_error(line, {'non_field_errors': [str(e)]})
+            return
+
+        report.imported += len(products)
+        # bulk_create sends no post_save; let the index, facets and caches catch up
+        products_changed.send(sender=Products, products=products, categories=categories)
@@ -0,0 +1,74 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from products.models import Products
+from products.serializers import ProductsSerializer, products_values_serializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows/sec of ProductsSerializer and the .values() fast path. '
+        'Rows are created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help='Row counts to benchmark.')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement; the best is kept.')
+
+    def handle(self, *args, **options):
+        for rows in options['rows']:
+            with transaction.atomic():
+                self.seed(rows)
+                # Cloned on every run, so both paths pay for their query
+                queryset = Products.objects.order_by('id')
+
+                standard, standard_output = self.measure(
+                    lambda: ProductsSerializer(list(queryset.all()), many=True).data, options['repeat']
+                )
+                fast, fast_output = self.measure(
+                    lambda: products_values_serializer.data(products_values_serializer.values(queryset)),
+                    options['repeat']
+                )
+                transaction.set_rollback(True)
+
+            renderer = JSONRenderer()
+            if renderer.render(standard_output) != renderer.render(fast_output):
+                raise CommandError(f'Fast path output differs from ProductsSerializer for {rows} rows.')
+
+            self.stdout.write(
+                f'{rows} rows: ProductsSerializer {rows / standard:,.0f} rows/s, '
+                f'fast path {rows / fast:,.0f} rows/s ({standard / fast:.1f}x), output identical'
+            )
+
+    @staticmethod
+    def seed(rows):
+        Products.objects.bulk_create(
+            (
+                Products(
+                    name=f'Benchmark product {i}',
+                    category=f'Category {i % 50}',
+                    description='Benchmark row used to time product serialization.',
+                    value=Decimal(i % 100000) / 100,
+                    storage=i % 500,
+                )
+                for i in range(rows)
+            ),
+            batch_size=5000,
+        )
+
+    @staticmethod
+    def measure(function, repeat):
+        """
+        Return the best wall time of `function` (query included) and its output.
+        """
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = function()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, output
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.stock import compact
+
+
+class Command(BaseCommand):
+    help = 'Fold the pending inventory movements into the product storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Movements folded per transaction.')
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep compacting every INTERVAL seconds instead of running once.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            folded = compact(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Compacted {folded} inventory movements.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework import serializers
+
+from products.exporter import EXPORT_FORMATS, export_lines, export_queryset
+
+
+class Command(BaseCommand):
+    help = 'Stream the product catalog as NDJSON or CSV.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', help='File to write; defaults to standard output.')
+        parser.add_argument('--format', dest='file_format', choices=list(EXPORT_FORMATS), default='ndjson')
+        parser.add_argument('--updated-since', help='Only export products updated since this ISO 8601 datetime.')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched per database round trip.')
+
+    def handle(self, *args, **options):
+        updated_since = None
+        if options['updated_since']:
+            try:
+                updated_since = serializers.DateTimeField().to_internal_value(options['updated_since'])
+            except serializers.ValidationError:
+                raise CommandError('--updated-since must be an ISO 8601 datetime.')
+
+        lines = export_lines(export_queryset(updated_since), options['file_format'], options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
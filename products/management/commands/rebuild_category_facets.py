@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from products import facets
+from products.models import CategoryFacets
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-category product facets from the Products table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('categories', nargs='*', help='Only rebuild these categories.')
+
+    def handle(self, *args, **options):
+        facets.rebuild(options['categories'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f'Category facets rebuilt ({CategoryFacets.objects.count()} categories).'
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.stock import release_expired
+
+
+class Command(BaseCommand):
+    help = 'Release the stock reservations whose TTL has passed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Reservations released per transaction.')
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep sweeping every INTERVAL seconds instead of running once.'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Released {released} reserved units.'))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 01:58
+
+import django.db.models.deletion
+import products.fields
+from django.db import migrations, models
+
+
+def create_fts_table(apps, schema_editor):
+    # The FTS5 index only exists on SQLite; other databases use the
+    # portable search backend and need no table.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE products_products_fts USING fts5("
+        "name, description, prefix='2 3', tokenize='unicode61 remove_diacritics 2')"
+    )
+    # Rank with BM25, weighting the name above the description
+    schema_editor.execute(
+        "INSERT INTO products_products_fts (products_products_fts, rank) "
+        "VALUES ('rank', 'bm25(10.0, 1.0)')"
+    )
+    schema_editor.execute(
+        "INSERT INTO products_products_fts (rowid, name, description) "
+        "SELECT id, name, description FROM products_products"
+    )
+
+
+def drop_fts_table(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute('DROP TABLE products_products_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchIndex',
+            fields=[
+                ('product', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='products.products')),
+                ('name', models.TextField()),
+                ('description', models.TextField()),
+                ('document', products.fields.FullTextField(db_column='products_products_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'products_products_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_fts_table, drop_fts_table),
+    ]
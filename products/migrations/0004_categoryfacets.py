@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:13
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+
+
+def populate_facets(apps, schema_editor):
+    Products = apps.get_model('products', 'Products')
+    CategoryFacets = apps.get_model('products', 'CategoryFacets')
+    rows = Products.objects.values('category').order_by().annotate(
+        product_count=Count('id'),
+        min_value=Min('value'),
+        max_value=Max('value'),
+        total_storage=Sum('storage'),
+    )
+    CategoryFacets.objects.bulk_create(CategoryFacets(**row) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_products_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryFacets',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(max_length=100, unique=True)),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('min_value', models.DecimalField(decimal_places=2, max_digits=15, null=True)),
+                ('max_value', models.DecimalField(decimal_places=2, max_digits=15, null=True)),
+                ('total_storage', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_facets, migrations.RunPython.noop),
+    ]
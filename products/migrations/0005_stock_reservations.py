@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_categoryfacets'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='products',
+            name='reserved',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockReservations',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holder', models.CharField(max_length=64)),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.products')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['expires_at'], name='reservations_expires_idx'), models.Index(fields=['holder'], name='reservations_holder_idx')],
+                'constraints': [models.UniqueConstraint(fields=('product', 'holder'), name='unique_reservation_holder')],
+            },
+        ),
+    ]
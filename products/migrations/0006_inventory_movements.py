@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_stock_reservations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryMovements',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.IntegerField()),
+                ('reason', models.CharField(choices=[('restock', 'Restock'), ('sale', 'Sale'), ('return', 'Return'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('compacted', models.BooleanField(default=False)),
+                ('data_created', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='products.products')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('compacted', False)), fields=['product', 'delta'], name='movements_pending_idx'), models.Index(condition=models.Q(('compacted', False)), fields=['id'], name='movements_compaction_idx')],
+            },
+        ),
+    ]
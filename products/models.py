@@ -1,6 +1,7 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
+from .fields import FullTextField
 
 class Products(models.Model):
     name = models.CharField(max_length=255)
@@ -12,8 +13,113 @@ class Products(models.Model):
     validators=[MinValueValidator(Decimal('0.0'))] 
     )
     storage = models.IntegerField(validators=[MinValueValidator(0)])
+    # Units held by live `StockReservations`; available stock is `storage - reserved`
+    reserved = models.PositiveIntegerField(default=0)
     data_created = models.DateTimeField(auto_now_add=True)
     data_updated = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Filters and keyset pages of the product read paths
+            models.Index(fields=['category'], name='products_category_idx'),
+            models.Index(fields=['value'], name='products_value_idx'),
+            models.Index(fields=['category', 'value'], name='products_category_value_idx'),
+            # "Recently updated" syncs and exports
+            models.Index(fields=['data_updated', 'id'], name='products_updated_id_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.category} - {self.name}: {self.value}'
+
+class StockReservations(models.Model):
+    """
+    Units of a product held for a holder (such as a cart) until `expires_at`.
+
+    `Products.reserved` is the sum of these rows; both are only changed
+    together, by `products.stock`.
+    """
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='reservations')
+    holder = models.CharField(max_length=64)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # One hold per holder and product; reserving again raises its quantity
+            models.UniqueConstraint(fields=['product', 'holder'], name='unique_reservation_holder'),
+        ]
+        indexes = [
+            # Sweeping expired holds and releasing a holder's holds
+            models.Index(fields=['expires_at'], name='reservations_expires_idx'),
+            models.Index(fields=['holder'], name='reservations_holder_idx'),
+        ]
+
+class InventoryMovements(models.Model):
+    """
+    Append-only record of a stock change (restock, sale, return, adjustment).
+
+    Writers only insert, so they never contend on the product row. `storage`
+    is the snapshot of every compacted movement: `products.stock.compact`
+    folds pending movements into it in batches, and the stock read adds the
+    pending tail to the snapshot.
+    """
+    REASON_CHOICES = [
+        ('restock', 'Restock'),
+        ('sale', 'Sale'),
+        ('return', 'Return'),
+        ('adjustment', 'Adjustment'),
+    ]
+
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='movements')
+    delta = models.IntegerField()
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES)
+    reference = models.CharField(max_length=100, blank=True)
+    compacted = models.BooleanField(default=False)
+    data_created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The pending tail of a product, summed from the index alone
+            models.Index(fields=['product', 'delta'], condition=models.Q(compacted=False), name='movements_pending_idx'),
+            # Compaction walks pending movements in insertion order
+            models.Index(fields=['id'], condition=models.Q(compacted=False), name='movements_compaction_idx'),
+        ]
+
+class CategoryFacets(models.Model):
+    """
+    Per-category aggregate of the catalog, maintained incrementally by
+    `products.facets` on every product save and delete.
+    """
+    category = models.CharField(max_length=100, unique=True)
+    product_count = models.PositiveIntegerField(default=0)
+    min_value = models.DecimalField(max_digits=15, decimal_places=2, null=True)
+    max_value = models.DecimalField(max_digits=15, decimal_places=2, null=True)
+    total_storage = models.BigIntegerField(default=0)
+
     def __str__(self) -> str:
-        return f'{self.category} - {self.name}: {self.value}'
\ No newline at end of file
+        return f'{self.category}: {self.product_count}'
+
+
+class ProductSearchIndex(models.Model):
+    """
+    Full-text index over product names and descriptions.
+
+    Backed by an SQLite FTS5 virtual table created in the migrations; the
+    table is kept in sync by `products.search` and is never written through
+    the ORM.
+    """
+    product = models.OneToOneField(
+        Products,
+        primary_key=True,
+        db_column='rowid',
+        on_delete=models.DO_NOTHING,
+        related_name='search_index'
+    )
+    name = models.TextField()
+    description = models.TextField()
+    document = FullTextField(db_column='products_products_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'products_products_fts'
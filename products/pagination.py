@@ -0,0 +1,249 @@
+import base64
+import datetime
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    JSON encoder for cursor positions that keeps datetimes at full precision
+    (`DjangoJSONEncoder` truncates them to milliseconds, which would skip
+    rows within the same millisecond).
+    """
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over a fixed set of orderings.
+
+    Instead of OFFSET, every page is fetched with a `WHERE (a, b) > (x, y)`
+    condition built from the last row of the previous page, so page N costs
+    the same as page 1 as long as the ordering is backed by an index.
+
+    Attributes:
+        orderings: Maps the public `ordering` query value to a tuple of model
+            fields. The last field of every tuple must be unique (usually `id`)
+            so that positions are stable.
+        default_ordering: Key of `orderings` used when no ordering is given.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering_query_param = 'ordering'
+    page_size = 50
+    max_page_size = 500
+    orderings = {'id': ('id',)}
+    default_ordering = 'id'
+
+    def get_page_size(self, request):
+        """
+        Return the requested page size, capped at `max_page_size`.
+        """
+        page_size = request.query_params.get(self.page_size_query_param)
+        if page_size is None:
+            return self.page_size
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ValidationError({self.page_size_query_param: 'A valid integer is required.'})
+        if page_size < 1:
+            raise ValidationError({self.page_size_query_param: 'Must be greater than zero.'})
+        return min(page_size, self.max_page_size)
+
+    def get_default_ordering(self, queryset):
+        """
+        Return the ordering key used when the request does not choose one.
+        """
+        return self.default_ordering
+
+    def get_ordering(self, request, queryset):
+        """
+        Return the tuple of fields for the requested ordering.
+        """
+        ordering = request.query_params.get(self.ordering_query_param)
+        if ordering is None:
+            ordering = self.get_default_ordering(queryset)
+        if ordering not in self.orderings:
+            raise ValidationError({
+                self.ordering_query_param: f'Choose one of: {", ".join(self.orderings)}.'
+            })
+        return self.orderings[ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.limit = self.get_page_size(request)
+        self.fields = self.get_ordering(request, queryset)
+        position, reverse = self.decode_cursor(request, queryset.model)
+
+        ordering = [self._flip(field) if reverse else field for field in self.fields]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._after(ordering, position))
+
+        # Fetch one extra row to know whether there is another page
+        rows = list(queryset[:self.limit + 1])
+        has_more = len(rows) > self.limit
+        rows = rows[:self.limit]
+
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = position is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, position is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self._position(self.page[-1]), reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Walked past the end: the previous page starts from the beginning
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self._position(self.page[0]), reverse=True)
+
+    def encode_cursor(self, position, reverse):
+        """
+        Build the URL of the page that starts right after `position`.
+        """
+        payload = json.dumps({'p': position, 'r': reverse}, cls=CursorEncoder)
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """
+        Return the `(position, reverse)` pair encoded in the request cursor.
+        """
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            position = payload['p']
+            reverse = bool(payload['r'])
+            if len(position) != len(self.fields):
+                raise ValueError
+            position = [
+                self._to_python(model, field, value)
+                for field, value in zip(self.fields, position)
+            ]
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor.')
+        return position, reverse
+
+    def _position(self, row):
+        names = [field.lstrip('-') for field in self.fields]
+        if isinstance(row, dict):
+            return [row[name] for name in names]
+        return [getattr(row, name) for name in names]
+
+    @staticmethod
+    def _to_python(model, field, value):
+        try:
+            model_field = model._meta.get_field(field.lstrip('-'))
+        except FieldDoesNotExist:
+            # Annotations (e.g. a relevance score) are stored as plain JSON values
+            return value
+        try:
+            return model_field.to_python(value)
+        except Exception:
+            raise ValueError(value)
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _after(ordering, position):
+        """
+        Build the keyset condition selecting rows strictly after `position`.
+
+        For `(a, b)` ascending this is `a >= x AND (a > x OR (a = x AND b > y))`;
+        the redundant leading bound lets the database use a range scan on `a`.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        if len(ordering) == 1:
+            return condition
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & condition
+
+
+class ProductsCursorPagination(KeysetPagination):
+    """
+    Keyset pagination used by every product read path.
+
+    Supports ordering by `id` or by `value` (with `id` as tie-breaker), in both
+    directions, and by `relevance` for full-text searches, which is also the
+    default whenever the queryset carries a relevance score. Page sizes come
+    from the `PRODUCTS_PAGE_SIZE` and `PRODUCTS_MAX_PAGE_SIZE` settings.
+    """
+    orderings = {
+        'id': ('id',),
+        '-id': ('-id',),
+        'value': ('value', 'id'),
+        '-value': ('-value', '-id'),
+        'relevance': ('relevance', 'id'),
+    }
+    default_ordering = 'id'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'PRODUCTS_PAGE_SIZE', 50)
+        self.max_page_size = getattr(settings, 'PRODUCTS_MAX_PAGE_SIZE', 500)
+
+    def get_default_ordering(self, queryset):
+        if 'relevance' in queryset.query.annotations:
+            return 'relevance'
+        return self.default_ordering
+
+    def get_ordering(self, request, queryset):
+        fields = super().get_ordering(request, queryset)
+        if 'relevance' in fields and 'relevance' not in queryset.query.annotations:
+            raise ValidationError({
+                self.ordering_query_param: 'Relevance ordering requires a name search.'
+            })
+        return fields
@@ -0,0 +1,130 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, F, FloatField, Q, Value, When
+from django.utils.module_loading import import_string
+
+from .models import Products, ProductSearchIndex
+
+
+class BaseSearchBackend:
+    """
+    Interface for the product full-text search backends.
+
+    Backends keep their index in sync through `index`/`remove` and filter a
+    product queryset through `search`, which must annotate every row with a
+    `relevance` score where lower values mean better matches.
+    """
+
+    def index(self, products):
+        """
+        Add or refresh the given products in the index.
+        """
+
+    def remove(self, product_ids):
+        """
+        Drop the given product ids from the index.
+        """
+
+    def rebuild(self):
+        """
+        Rebuild the whole index from the `Products` table.
+        """
+
+    def search(self, queryset, query):
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Portable fallback that searches with `icontains` on name and description.
+
+    It needs no index, so `index`, `remove` and `rebuild` are no-ops. Name
+    matches rank before description-only matches.
+    """
+
+    def search(self, queryset, query):
+        return queryset.filter(
+            Q(name__icontains=query) | Q(description__icontains=query)
+        ).annotate(
+            relevance=Case(
+                When(name__icontains=query, then=Value(0.0)),
+                default=Value(1.0),
+                output_field=FloatField(),
+            )
+        )
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """
+    Search backend using the `products_products_fts` FTS5 virtual table.
+
+    Results are ranked with BM25 (name weighted over description) and every
+    search term matches as a prefix, so "smart" finds "Smartphone".
+    """
+    table = ProductSearchIndex._meta.db_table
+
+    def index(self, products):
+        rows = [(product.pk, product.name, product.description) for product in products]
+        if not rows:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, [row[0] for row in rows])
+            cursor.executemany(
+                f'INSERT INTO {self.table} (rowid, name, description) VALUES (%s, %s, %s)',
+                rows
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, product_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, description) '
+                f'SELECT id, name, description FROM {Products._meta.db_table}'
+            )
+
+    def search(self, queryset, query):
+        expression = self.to_match_expression(query)
+        if not expression:
+            return queryset.none().annotate(relevance=Value(0.0, output_field=FloatField()))
+        return queryset.filter(
+            search_index__document__match=expression
+        ).annotate(
+            relevance=F('search_index__rank')
+        )
+
+    @staticmethod
+    def to_match_expression(query):
+        """
+        Turn free text into a safe FTS5 query: every word becomes a quoted
+        prefix term and all of them must match.
+        """
+        terms = re.findall(r'\w+', query)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def _delete(self, cursor, product_ids):
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', product_ids)
+
+
+def get_search_backend():
+    """
+    Return the configured search backend.
+
+    Uses the `PRODUCTS_SEARCH_BACKEND` setting (a dotted path) when present,
+    otherwise FTS5 on SQLite and the portable fallback on other databases.
+    """
+    backend = getattr(settings, 'PRODUCTS_SEARCH_BACKEND', None)
+    if backend:
+        return import_string(backend)()
+    if connection.vendor == 'sqlite':
+        return SQLiteFTS5Backend()
+    return DatabaseSearchBackend()
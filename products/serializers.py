@@ -1,5 +1,9 @@
-from rest_framework import serializers
-from .models import Products
+import decimal
+from decimal import Decimal
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from .models import CategoryFacets, InventoryMovements, Products
 
 class ProductsSerializer(serializers.ModelSerializer):
     class Meta:
@@ -8,4 +12,184 @@ class ProductsSerializer(serializers.ModelSerializer):
             'id', 'name', 'category', 'description', 'value', 'storage', 'data_created', 'data_updated'
         ]
 
-    
\ No newline at end of file
+    def get_fields(self):
+        fields = super().get_fields()
+        if self.instance is not None:
+            # The stock of existing products only changes through the inventory ledger
+            fields['storage'] = serializers.IntegerField(read_only=True)
+        return fields
+
+    def update(self, instance, validated_data):
+        """
+        Save only the edited fields, so the `reserved` count that carts move
+        concurrently is never written back from a stale instance.
+        """
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, 'data_updated'])
+        return instance
+
+
+class ProductStockSerializer(serializers.Serializer):
+    """
+    Stock of a product: the storage snapshot, the movements not compacted
+    into it yet, the units held by carts and what is left.
+    """
+    id = serializers.IntegerField(read_only=True)
+    storage = serializers.IntegerField(read_only=True)
+    pending = serializers.IntegerField(read_only=True)
+    reserved = serializers.IntegerField(read_only=True)
+    available = serializers.IntegerField(read_only=True)
+
+
+class InventoryMovementsSerializer(serializers.ModelSerializer):
+    """
+    A stock change recorded by hand; sales are only recorded by checkout.
+    """
+    class Meta:
+        model = InventoryMovements
+        fields = ['id', 'product', 'delta', 'reason', 'reference', 'data_created']
+        read_only_fields = ['product']
+
+    def validate_delta(self, value):
+        if value == 0:
+            raise serializers.ValidationError('A movement must change the stock.')
+        return value
+
+    def validate_reason(self, value):
+        if value == 'sale':
+            raise serializers.ValidationError('Sales are recorded by checkout.')
+        return value
+
+
+class CategoryFacetsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CategoryFacets
+        fields = [
+            'category', 'product_count', 'min_value', 'max_value', 'total_storage'
+        ]
+
+
+class ValuesSerializer:
+    """
+    Read-only fast path for a `ModelSerializer` working on `.values()` rows.
+
+    Instead of calling `to_representation` field by field on model instances,
+    it precompiles one converter per field and applies them to the plain
+    dicts returned by `.values()`. The output is identical to the wrapped
+    serializer for the field types it compiles (integers, strings, decimals
+    and ISO 8601 datetimes); any other field falls back to its own
+    `to_representation`.
+
+    Args:
+        serializer_class: The `ModelSerializer` whose output is reproduced.
+            Every readable field must map to a model column of the same name.
+    """
+
+    def __init__(self, serializer_class):
+        self.fields = serializer_class().fields
+        self.field_names = [name for name, field in self.fields.items() if not field.write_only]
+
+    def values(self, queryset):
+        """
+        Return `queryset.values()` with the serialized fields, keeping any
+        annotation (such as a relevance score) needed for ordering.
+        """
+        return queryset.values(*self.field_names, *queryset.query.annotations)
+
+    def compile(self):
+        """
+        Return the `(name, converter)` pairs for the current request.
+
+        Compiled per call because datetime output depends on the active timezone.
+        """
+        return [(name, self.converter(self.fields[name])) for name in self.field_names]
+
+    @staticmethod
+    def converter(field):
+        if isinstance(field, (serializers.IntegerField, serializers.CharField)):
+            # Database values are already int/str, which is all these fields do
+            return None
+
+        if (
+            isinstance(field, serializers.DecimalField)
+            and field.decimal_places is not None
+            and not field.normalize_output
+            and not field.localize
+            and getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+        ):
+            exponent = Decimal('.1') ** field.decimal_places
+            context = decimal.getcontext().copy()
+            if field.max_digits is not None:
+                context.prec = field.max_digits
+            rounding = field.rounding
+
+            def to_decimal_string(value):
+                return f'{value.quantize(exponent, rounding=rounding, context=context):f}'
+            return to_decimal_string
+
+        if (
+            isinstance(field, serializers.DateTimeField)
+            and getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == ISO_8601
+        ):
+            field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+            if field_timezone is not None:
+                def to_iso_datetime(value):
+                    if timezone.is_naive(value):
+                        return field.to_representation(value)
+                    value = value.astimezone(field_timezone).isoformat()
+                    if value.endswith('+00:00'):
+                        value = value[:-6] + 'Z'
+                    return value
+                return to_iso_datetime
+
+        return field.to_representation
+
+    def represent(self, rows):
+        """
+        Yield the representation of every `.values()` row.
+        """
+        converters = self.compile()
+        for row in rows:
+            item = {}
+            for name, convert in converters:
+                value = row[name]
+                item[name] = value if convert is None or value is None else convert(value)
+            yield item
+
+    def data(self, rows):
+        """
+        Return the representation of every row as a list.
+        """
+        return list(self.represent(rows))
+
+
+products_values_serializer = ValuesSerializer(ProductsSerializer)
+
+
+class ProductSearchSerializer(serializers.Serializer):
+    """
+    Validates the query parameters accepted by the product search endpoint.
+
+    Every filter is optional and they can be freely combined.
+    """
+    category = serializers.CharField(required=False, max_length=100)
+    name = serializers.CharField(required=False, max_length=255)
+    min_price = serializers.DecimalField(
+        max_digits=15, decimal_places=2, min_value=Decimal('0.0'), required=False
+    )
+    max_price = serializers.DecimalField(
+        max_digits=15, decimal_places=2, min_value=Decimal('0.0'), required=False
+    )
+
+    def validate(self, data):
+        """
+        Ensure the price range is not inverted.
+        """
+        min_price = data.get('min_price')
+        max_price = data.get('max_price')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            raise serializers.ValidationError(
+                'Min price parameter must be lower than Max price parameter.'
+            )
+        return data
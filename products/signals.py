@@ -0,0 +1,79 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import Signal, receiver
+
+from . import facets
+from .caching import bump_version
+from .models import Products
+from .search import get_search_backend
+
+# Sent after bulk writes that bypass `post_save`, with the written `products`
+# and every `categories` they were in before or after the write
+products_changed = Signal()
+
+
+@receiver(pre_save, sender=Products)
+def remember_previous_values(sender, instance, raw=False, **kwargs):
+    """
+    Keep the stored category, value and storage of a product being updated,
+    so post_save receivers can apply deltas (`None` for new products).
+    """
+    instance._previous_values = None
+    if instance.pk is not None and not raw:
+        instance._previous_values = Products.objects.filter(pk=instance.pk).values(
+            'category', 'value', 'storage'
+        ).first()
+
+
+@receiver(post_save, sender=Products)
+def index_product(sender, instance, **kwargs):
+    """
+    Keep the full-text index in sync when a product is created or updated.
+    """
+    get_search_backend().index([instance])
+
+
+@receiver(post_delete, sender=Products)
+def unindex_product(sender, instance, **kwargs):
+    """
+    Drop a deleted product from the full-text index.
+    """
+    get_search_backend().remove([instance.pk])
+
+
+@receiver(post_save, sender=Products)
+def update_facets_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Update the category facets for a created or updated product.
+    """
+    if raw:
+        return
+    previous = None if created else getattr(instance, '_previous_values', None)
+    facets.product_saved(previous, instance)
+
+
+@receiver(post_delete, sender=Products)
+def update_facets_on_delete(sender, instance, **kwargs):
+    """
+    Update the category facets for a deleted product.
+    """
+    facets.product_deleted(instance)
+
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+def invalidate_cached_responses(sender, **kwargs):
+    """
+    Drop every cached product response when any product changes.
+    """
+    bump_version()
+
+
+@receiver(products_changed)
+def bulk_products_changed(sender, products, categories, **kwargs):
+    """
+    Reindex, rebuild the touched facets and invalidate cached responses after
+    a bulk write.
+    """
+    get_search_backend().index(products)
+    facets.rebuild(categories)
+    bump_version()
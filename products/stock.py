@@ -0,0 +1,335 @@
+from collections import defaultdict
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Now
+from django.utils import timezone
+
+from . import facets
+from .caching import bump_version
+from .models import InventoryMovements, Products, StockReservations
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when a product does not have enough available units to reserve.
+    """
+
+    def __init__(self, product_id, requested, available):
+        self.product_id = product_id
+        self.requested = requested
+        self.available = available
+        super().__init__(f'Product {product_id} has {available} units available, {requested} requested.')
+
+
+def reservation_ttl():
+    """
+    Return how long a reservation holds stock (`STOCK_RESERVATION_TTL` seconds).
+    """
+    return timedelta(seconds=getattr(settings, 'STOCK_RESERVATION_TTL', 15 * 60))
+
+
+def pending():
+    """
+    Expression summing the movements of the outer product not yet compacted
+    into its `storage`, read from the partial `movements_pending_idx` index.
+    """
+    tail = (
+        InventoryMovements.objects.filter(product=OuterRef('pk'), compacted=False)
+        .order_by().values('product').annotate(total=Sum('delta')).values('total')
+    )
+    return Coalesce(Subquery(tail), 0)
+
+
+def on_hand():
+    """
+    Expression for the units a product really has: the `storage` snapshot
+    plus its un-compacted movements.
+    """
+    return F('storage') + pending()
+
+
+def available(product_id):
+    """
+    Return the units of a product that can still be reserved, with one
+    primary-key lookup.
+    """
+    return Products.objects.filter(pk=product_id).values_list(on_hand() - F('reserved'), flat=True).get()
+
+
+def lock(product_ids):
+    """
+    Lock the product rows before their pending movements are read, so a
+    check sees the movements committed by the previous holder of the lock.
+
+    Only needed where rows can be locked; SQLite serializes writers anyway.
+    """
+    if connection.features.has_select_for_update:
+        list(Products.objects.select_for_update().filter(pk__in=product_ids).order_by('pk').values_list('pk'))
+
+
+def hold(product_id, quantity):
+    """
+    Move `quantity` units of a product from available to reserved, in one
+    `UPDATE ... WHERE storage + pending - reserved >= quantity`. Returns
+    whether it did.
+    """
+    lock([product_id])
+    return bool(
+        Products.objects.alias(on_hand=on_hand()).filter(pk=product_id, on_hand__gte=F('reserved') + quantity)
+        .update(reserved=F('reserved') + quantity)
+    )
+
+
+def record(product_id, delta, reason, reference=''):
+    """
+    Append a stock change to the inventory ledger.
+
+    Restocks only insert, so they never wait on the product row; the change
+    is visible to `available` at once and reaches `storage` at the next
+    `compact`. Units taken out are checked like `hold` does: a conditional
+    `UPDATE ... WHERE storage + pending - reserved >= units` on the product
+    row, in the transaction of the insert, so the stock never drops below
+    what is reserved.
+
+    Args:
+        product_id (int): Id of the product.
+        delta (int): Units added (positive) or taken out (negative).
+        reason (str): One of `InventoryMovements.REASON_CHOICES`.
+        reference (str): What caused the change, such as `order:<id>`.
+
+    Returns:
+        InventoryMovements: The recorded movement.
+
+    Raises:
+        InsufficientStock: If fewer than `-delta` units are available.
+    """
+    with transaction.atomic():
+        if delta < 0:
+            lock([product_id])
+            # Writes the row unchanged: the check and the row lock in one statement
+            covered = Products.objects.alias(on_hand=on_hand()).filter(
+                pk=product_id, on_hand__gte=F('reserved') - delta
+            ).update(reserved=F('reserved'))
+            if not covered:
+                raise InsufficientStock(product_id, -delta, available(product_id))
+        return InventoryMovements.objects.create(
+            product_id=product_id, delta=delta, reason=reason, reference=reference
+        )
+
+
+def reserve(product_id, holder, quantity):
+    """
+    Reserve `quantity` more units of a product for `holder`.
+
+    The stock check and the increment are a single conditional `UPDATE`, so
+    concurrent reservations can never take more than the storage. When it
+    fails, the expired holds of the product are released and it is tried
+    once more before giving up. The holder's reservation is created or
+    raised, and its expiry pushed back by the reservation TTL.
+
+    Args:
+        product_id (int): Id of the product.
+        holder (str): Who holds the units, such as `cart:<id>`.
+        quantity (int): Units to reserve.
+
+    Raises:
+        InsufficientStock: If fewer than `quantity` units are available.
+    """
+    with transaction.atomic():
+        if not hold(product_id, quantity):
+            release_expired(product_ids=[product_id])
+            if not hold(product_id, quantity):
+                raise InsufficientStock(product_id, quantity, available(product_id))
+
+        expires_at = timezone.now() + reservation_ttl()
+        reservations = StockReservations.objects.filter(product_id=product_id, holder=holder)
+        if reservations.update(quantity=F('quantity') + quantity, expires_at=expires_at):
+            return
+        try:
+            with transaction.atomic():
+                StockReservations.objects.create(
+                    product_id=product_id, holder=holder, quantity=quantity, expires_at=expires_at
+                )
+        except IntegrityError:
+            reservations.update(quantity=F('quantity') + quantity, expires_at=expires_at)
+
+
+def release(product_id, holder, quantity=None):
+    """
+    Give back up to `quantity` units (all when None) held by `holder`.
+
+    The reservation is changed with a compare-and-swap on its quantity, so a
+    concurrent release or expiry of the same hold is never counted twice.
+
+    Returns:
+        int: The units actually released; 0 when the hold already expired.
+    """
+    reservations = StockReservations.objects.filter(product_id=product_id, holder=holder)
+    while True:
+        current = reservations.values_list('pk', 'quantity').first()
+        if current is None:
+            return 0
+        pk, held = current
+        released = held if quantity is None else min(quantity, held)
+
+        with transaction.atomic():
+            unchanged = StockReservations.objects.filter(pk=pk, quantity=held)
+            if released == held:
+                changed = unchanged.delete()[0]
+            else:
+                changed = unchanged.update(quantity=F('quantity') - released)
+            if changed:
+                Products.objects.filter(pk=product_id).update(reserved=F('reserved') - released)
+                return released
+
+
+def sell(holder, quantities, reference=''):
+    """
+    Take sold units out of the stock, consuming the holder's reservations.
+
+    Fixed number of queries however many products are sold: the holds are
+    read (and locked) at once, one conditional `UPDATE` lowers `reserved`
+    by the units held for the products whose available stock plus the
+    holder's own holds covers the sale, and the sold units are appended to
+    the inventory ledger with one `bulk_create`. If any product was short
+    the caller's transaction must be rolled back; raising `InsufficientStock`
+    does that inside `atomic()`.
+
+    Meant to run inside the caller's transaction.
+
+    Args:
+        holder (str): Holder whose reservations are consumed, such as `cart:<id>`.
+        quantities (dict): Units sold by product id.
+        reference (str): Reference of the sale movements, such as `order:<id>`.
+
+    Raises:
+        InsufficientStock: For the first product that cannot cover its units.
+    """
+    lock(quantities)
+    reservations = StockReservations.objects.filter(holder=holder, product_id__in=quantities)
+    held = dict(reservations.select_for_update().values_list('product_id', 'quantity'))
+
+    released = Case(*[When(pk=pk, then=Value(quantity)) for pk, quantity in held.items()], default=Value(0))
+    covered = reduce(or_, (
+        Q(pk=pk, on_hand__gte=F('reserved') + (quantity - held.get(pk, 0)))
+        for pk, quantity in quantities.items()
+    ))
+    updated = Products.objects.alias(on_hand=on_hand()).filter(covered).update(reserved=F('reserved') - released)
+
+    if updated != len(quantities):
+        # Short products kept their values: report the first one. If none
+        # looks short any more it was restocked meanwhile and a retry succeeds.
+        units = dict(
+            Products.objects.filter(pk__in=quantities).annotate(units=on_hand() - F('reserved'))
+            .values_list('pk', 'units')
+        )
+        units = {pk: units[pk] + held.get(pk, 0) if pk in units else 0 for pk in sorted(quantities)}
+        short = [pk for pk, available_units in units.items() if available_units < quantities[pk]] or list(units)
+        raise InsufficientStock(short[0], quantities[short[0]], units[short[0]])
+
+    InventoryMovements.objects.bulk_create(
+        InventoryMovements(product_id=pk, delta=-quantity, reason='sale', reference=reference)
+        for pk, quantity in quantities.items()
+    )
+    reservations.delete()
+
+
+def compact(batch_size=1000):
+    """
+    Fold the pending inventory movements into `Products.storage`, oldest
+    first, `batch_size` at a time.
+
+    Every batch is one transaction that first flags its movements as
+    compacted (only if none was taken by a concurrent compaction; otherwise
+    it is rolled back and read again) and then adds their deltas to the
+    storage of their products and to the category facets. The flag and the
+    storage change commit together, so `storage + pending` never counts a
+    movement twice or misses one.
+
+    Args:
+        batch_size (int): Movements folded per transaction.
+
+    Returns:
+        int: The number of movements folded.
+    """
+    pending_movements = InventoryMovements.objects.filter(compacted=False).order_by('pk')
+
+    total = 0
+    while True:
+        batch = list(pending_movements.values_list('pk', 'product_id', 'delta')[:batch_size])
+        if not batch:
+            break
+
+        deltas = defaultdict(int)
+        for _, product_id, delta in batch:
+            deltas[product_id] += delta
+
+        with transaction.atomic():
+            claimed = InventoryMovements.objects.filter(
+                pk__in=[pk for pk, _, _ in batch], compacted=False
+            ).update(compacted=True)
+            if claimed != len(batch):
+                transaction.set_rollback(True)
+                continue
+
+            Products.objects.filter(pk__in=deltas).update(
+                storage=F('storage') + Case(
+                    *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()], default=Value(0)
+                ),
+                data_updated=Now(),
+            )
+            units = defaultdict(int)
+            for pk, category in Products.objects.filter(pk__in=deltas).values_list('pk', 'category'):
+                units[category] += deltas[pk]
+            facets.add_storage(units)
+        total += len(batch)
+
+    if total:
+        # Storage is part of the product responses
+        bump_version()
+    return total
+
+
+def release_expired(batch_size=1000, product_ids=None):
+    """
+    Release the holds whose TTL has passed, `batch_size` at a time.
+
+    Every batch is one transaction: the expired rows still unchanged are
+    deleted one by one (a concurrent reserve may have just extended one),
+    then `Products.reserved` is lowered once per product.
+
+    Args:
+        batch_size (int): Reservations handled per transaction.
+        product_ids (list): Only sweep these products; all when None.
+
+    Returns:
+        int: The number of units released.
+    """
+    now = timezone.now()
+    expired = StockReservations.objects.filter(expires_at__lte=now)
+    if product_ids is not None:
+        expired = expired.filter(product_id__in=product_ids)
+
+    total = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            expired.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'product_id', 'quantity')[:batch_size]
+        )
+        if not batch:
+            return total
+        last_pk = batch[-1][0]
+
+        released = defaultdict(int)
+        with transaction.atomic():
+            for pk, product_id, quantity in batch:
+                if StockReservations.objects.filter(pk=pk, quantity=quantity, expires_at__lte=now).delete()[0]:
+                    released[product_id] += quantity
+            for product_id, quantity in released.items():
+                Products.objects.filter(pk=product_id).update(reserved=F('reserved') - quantity)
+        total += sum(released.values())
@@ -1,9 +1,35 @@
-from django.test import TestCase
+import json
+import os
+import re
+from decimal import Decimal
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+import random
+import threading
+from datetime import timedelta
+from unittest import mock
+from django.test import TestCase, TransactionTestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.urls import reverse
-from .models import Products
+from .models import CategoryFacets, InventoryMovements, Products, StockReservations
+from . import stock
+from .serializers import ProductsSerializer, products_values_serializer
+from .caching import get_or_compute
 from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib import admin
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection, transaction
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from e_commerce.throttling import get_cache as get_throttle_cache
 
 class ProductsTestCase(TestCase):
 
@@ -66,7 +92,7 @@ class ProductsTestCase(TestCase):
         response = self.client.get(url)
         
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(response.data[0]['name'], self.product1.name)
+        self.assertEqual(response.data['results'][0]['name'], self.product1.name)
 
     def test_get_product(self):
         """
@@ -97,6 +123,11 @@ class ProductsTestCase(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertTrue(Products.objects.filter(name="Laptop ABC",category="Computers").exists())
 
+        # Stock is changed with inventory movements, not written over
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.storage, 50)
+        self.assertEqual(response.data['storage'], 50)
+
     def test_partial_update_product(self):
         """
         Test partial update of a product
@@ -133,19 +164,20 @@ class ProductsTestCase(TestCase):
         }
         response = self.client.get(url, data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        for product in response.data:
+        for product in response.data['results']:
             self.assertEqual(product['category'], data['category'])
 
         # Test bad request error when category parameter is missing
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-        # Test not found error when no product was found
+        # Test empty page when no product was found
         data = {
             "category": "not found category"
         }
         response = self.client.get(url, data)
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
 
     def test_browse_products_by_value(self):
         """
@@ -192,13 +224,14 @@ class ProductsTestCase(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-        # Test not found error when no product was found
+        # Test empty page when no product was found
         data = {
             "min_price": 200.00,
             "max_price": 300.00
         }
         response = self.client.get(url, data)
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
 
     def test_browse_products_by_name(self):
         """
@@ -218,9 +251,1160 @@ class ProductsTestCase(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-        # Test not found error when no product was found
+        # Test empty page when no product was found
         data = {
             "name": "not a name"
         }
         response = self.client.get(url, data)
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [])
+
+    def test_list_product_cursor_pagination(self):
+        """
+        Test walking the product list page by page with cursors
+        """
+
+        for i in range(5):
+            Products.objects.create(
+                name=f"Produto {i}",
+                category="Books",
+                description="Livro.",
+                value=10 + i,
+                storage=1
+            )
+
+        url = reverse('product-list')
+        expected = list(Products.objects.order_by('id').values_list('id', flat=True))
+
+        seen = []
+        response = self.client.get(url, {'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 2)
+            seen += [product['id'] for product in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+
+        # Going back from the last page returns the previous rows in order
+        response = self.client.get(response.data['previous'])
+        self.assertEqual([product['id'] for product in response.data['results']], expected[-3:-1])
+
+    def test_list_product_ordering_by_value(self):
+        """
+        Test cursor pagination ordered by value with id as tie-breaker
+        """
+
+        for i in range(3):
+            Products.objects.create(
+                name=f"Caneca {i}",
+                category="Kitchen",
+                description="Caneca de cerâmica.",
+                value=49.99,
+                storage=1
+            )
+
+        url = reverse('product-list')
+        expected = list(Products.objects.order_by('-value', '-id').values_list('id', flat=True))
+
+        seen = []
+        response = self.client.get(url, {'ordering': '-value', 'page_size': 2})
+        while True:
+            seen += [product['id'] for product in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+
+        # Test bad request error when ordering is not supported
+        response = self.client.get(url, {'ordering': 'name'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Test not found error when the cursor is invalid
+        response = self.client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(PRODUCTS_MAX_PAGE_SIZE=1)
+    def test_list_product_page_size_cap(self):
+        """
+        Test that the requested page size is capped by the settings
+        """
+
+        url = reverse('product-list')
+
+        response = self.client.get(url, {'page_size': 100})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_search_products(self):
+        """
+        Test searching products combining several filters
+        """
+
+        Products.objects.create(
+            name="Smartphone Básico",
+            category="Electronics",
+            description="Smartphone de entrada.",
+            value=499.99,
+            storage=10
+        )
+
+        url = reverse('product-search')
+
+        data = {
+            "category": "Electronics",
+            "name": "smartphone",
+            "max_price": "100.00"
+        }
+        response = self.client.get(url, data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product1.id])
+
+        # Test ordering by value across every matching product
+        response = self.client.get(url, {"category": "Electronics", "ordering": "-value"})
+        self.assertEqual(response.data['results'][0]['name'], "Smartphone Básico")
+
+        # Test bad request error when prices are not valid decimals
+        response = self.client.get(url, {"min_price": "abc"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Test bad request error when min price is higher than max price
+        response = self.client.get(url, {"min_price": "200.00", "max_price": "100.00"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_products_single_query(self):
+        """
+        Test that a search page, empty or not, costs exactly one query
+        """
+
+        url = reverse('product-search')
+        client = APIClient()
+
+        with self.assertNumQueries(1):
+            response = client.get(url, {"category": "Clothing", "min_price": "10.00"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()['results']), 1)
+
+        with self.assertNumQueries(1):
+            response = client.get(url, {"category": "Nothing here"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_search_products_full_text(self):
+        """
+        Test full-text search over name and description ranked by relevance
+        """
+
+        cable = Products.objects.create(
+            name="Cabo USB-C",
+            category="Electronics",
+            description="Cabo para carregar smartphone.",
+            value=19.99,
+            storage=200
+        )
+
+        url = reverse('product-search')
+
+        # Name matches rank before description-only matches
+        response = self.client.get(url, {"name": "smartphone"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [product['id'] for product in response.data['results']],
+            [self.product1.id, cable.id]
+        )
+
+        # Words match as prefixes and accents are ignored
+        response = self.client.get(url, {"name": "camera smart"})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product1.id])
+
+        # Search syntax characters are treated as plain text
+        response = self.client.get(url, {"name": '"cabo" ('})
+        self.assertEqual([product['id'] for product in response.data['results']], [cable.id])
+
+        # Test bad request error when relevance ordering has no search terms
+        response = self.client.get(url, {"ordering": "relevance"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_search_index_follows_product_changes(self):
+        """
+        Test that the full-text index is updated on product save and delete
+        """
+
+        url = reverse('product-search')
+
+        self.product2.name = "Camiseta Polo"
+        self.product2.save()
+        response = self.client.get(url, {"name": "polo"})
+        self.assertEqual([product['id'] for product in response.data['results']], [self.product2.id])
+        response = self.client.get(url, {"name": "masculina"})
+        self.assertEqual(response.data['results'], [])
+
+        self.product2.delete()
+        response = self.client.get(url, {"name": "polo"})
+        self.assertEqual(response.data['results'], [])
+
+
+class ProductsQueryPlanTestCase(TestCase):
+    """
+    Regression tests making sure every product filter path is served by an
+    index instead of a full scan of the products table.
+    """
+
+    full_scan = re.compile(r'\bSCAN products_products\b(?!_fts)')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        for i in range(30):
+            Products.objects.create(
+                name=f"Produto {i}",
+                category=["Electronics", "Clothing", "Books"][i % 3],
+                description="Descrição do produto.",
+                value=10 + i,
+                storage=i
+            )
+
+    def query_plans(self, url, params):
+        """
+        Request the url and return the query plan of every products query it ran.
+        """
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, params)
+            if response.json()['next']:
+                # The keyset condition of the following page must use an index too
+                self.client.get(response.json()['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        plans = []
+        with connection.cursor() as cursor:
+            for query in context.captured_queries:
+                if 'products_products' not in query['sql']:
+                    continue
+                cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                plans.append('\n'.join(row[-1] for row in cursor.fetchall()))
+        self.assertTrue(plans)
+        return plans
+
+    def test_filter_paths_use_indexes(self):
+        """
+        Test that no product filter path falls back to a full table scan
+        """
+
+        search = reverse('product-search')
+        paths = [
+            (reverse('product-browse-products-by-category'), {"category": "Books", "page_size": 3}),
+            (reverse('product-browse-products-by-value'), {"min_price": "15.00", "max_price": "20.00", "page_size": 3}),
+            (reverse('product-browse-products-by-value'), {"min_price": "15.00", "page_size": 3}),
+            (reverse('product-browse-products-by-name'), {"name": "produto", "page_size": 3}),
+            (search, {"category": "Books", "ordering": "value", "page_size": 3}),
+            (search, {"category": "Books", "max_price": "20.00", "page_size": 3}),
+            (search, {"min_price": "15.00", "ordering": "-value", "page_size": 3}),
+            (search, {"category": "Books", "name": "produto", "page_size": 3}),
+        ]
+
+        for url, params in paths:
+            for plan in self.query_plans(url, params):
+                with self.subTest(url=url, params=params):
+                    self.assertIsNone(self.full_scan.search(plan), plan)
+
+
+class ProductsCacheTestCase(TestCase):
+    """
+    Tests for the response cache of anonymous product reads.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.product1 = Products.objects.create(
+            name="Smartphone XYZ 5G",
+            category="Electronics",
+            description="Smartphone com 5G e câmera de 64MP.",
+            value=99.99,
+            storage=50
+        )
+
+    def test_anonymous_reads_are_cached(self):
+        """
+        Test that a repeated anonymous read is served without queries
+        """
+
+        url = reverse('product-list')
+
+        response = self.client.get(url, {"ordering": "id", "page_size": 10})
+        self.assertEqual(response['X-Cache'], 'MISS')
+
+        # Same parameters in a different order hit the same entry
+        with self.assertNumQueries(0):
+            response = self.client.get(url + '?page_size=10&ordering=id')
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(response.json()['results'][0]['name'], self.product1.name)
+
+    @override_settings(ALLOWED_HOSTS=['internal', 'shop.example.com'])
+    def test_cache_keyed_by_host_and_scheme(self):
+        """
+        Test pages cached for one host or scheme never link to it from another
+        """
+        Products.objects.create(name="Fone", category="Audio", description="Fone.", value=10, storage=1)
+        url = reverse('product-list')
+
+        response = self.client.get(url, {"page_size": 1}, HTTP_HOST='internal')
+        self.assertTrue(response.json()['next'].startswith('http://internal/'))
+
+        response = self.client.get(url, {"page_size": 1}, HTTP_HOST='shop.example.com', secure=True)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertTrue(response.json()['next'].startswith('https://shop.example.com/'))
+
+    def test_cache_invalidated_on_product_change(self):
+        """
+        Test that creating, updating or deleting a product drops cached responses
+        """
+
+        url = reverse('product-detail', kwargs={'pk': self.product1.id})
+        self.client.get(url)
+
+        self.product1.name = "Smartphone XYZ 6G"
+        self.product1.save()
+        response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['name'], "Smartphone XYZ 6G")
+
+        self.product1.delete()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_authenticated_reads_are_not_cached(self):
+        """
+        Test that requests with credentials bypass the cache
+        """
+
+        get_user_model().objects.create_superuser(username="testuser", password="password123")
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "testuser", "password": "password123"})
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+        url = reverse('product-list')
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertNotIn('X-Cache', response)
+
+    def test_cold_key_is_computed_once(self):
+        """
+        Test that concurrent requests for a cold key compute the response once
+        """
+
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'response', True
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda _: get_or_compute('cold-key', compute), range(8)))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({entry for entry, hit in results}, {'response'})
+        self.assertEqual(sum(not hit for entry, hit in results), 1)
+
+    def test_file_based_cache_backend(self):
+        """
+        Test that the response cache works with the file based backend
+        """
+
+        with tempfile.TemporaryDirectory() as directory:
+            file_cache = {
+                **settings.CACHES,
+                'default': {
+                    'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                    'LOCATION': directory,
+                }
+            }
+            with override_settings(CACHES=file_cache):
+                url = reverse('product-list')
+                self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+                self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+
+                Products.objects.create(
+                    name="Camiseta Masculina Slim Fit",
+                    category="Clothing",
+                    description="Camiseta slim fit em algodão.",
+                    value=49.99,
+                    storage=100
+                )
+                response = self.client.get(url)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertEqual(len(response.json()['results']), 2)
+
+
+class ProductsConditionalGetTestCase(TestCase):
+    """
+    Tests for ETag / Last-Modified support on product reads.
+    """
+
+    def setUp(self):
+        cache.clear()
+        get_user_model().objects.create_superuser(username="testuser", password="password123")
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "testuser", "password": "password123"})
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+        self.product1 = Products.objects.create(
+            name="Smartphone XYZ 5G",
+            category="Electronics",
+            description="Smartphone com 5G e câmera de 64MP.",
+            value=99.99,
+            storage=50
+        )
+
+    def test_detail_not_modified(self):
+        """
+        Test conditional GETs on a product detail
+        """
+
+        url = reverse('product-detail', kwargs={'pk': self.product1.id})
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.product1.value = 89.99
+        self.product1.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_not_modified(self):
+        """
+        Test conditional GETs on product pages
+        """
+
+        url = reverse('product-search')
+        params = {"category": "Electronics"}
+
+        response = self.client.get(url, params)
+        etag = response['ETag']
+
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        # Other parameters are another resource
+        response = self.client.get(url, {"category": "Clothing"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # Creating a product in the page changes the ETag
+        Products.objects.create(
+            name="Tablet",
+            category="Electronics",
+            description="Tablet de 10 polegadas.",
+            value=899.99,
+            storage=5
+        )
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 2)
+
+        # So does deleting one
+        etag = response['ETag']
+        self.product1.delete()
+        response = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cached_response_not_modified(self):
+        """
+        Test that cached anonymous responses answer conditional GETs without queries
+        """
+
+        client = APIClient()
+        url = reverse('product-list')
+
+        etag = client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class ProductsImportExportTestCase(TestCase):
+    """
+    Tests for the streaming bulk product import and catalog export.
+    """
+
+    def setUp(self):
+        get_user_model().objects.create_superuser(username="testuser", password="password123")
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "testuser", "password": "password123"})
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+        self.product1 = Products.objects.create(
+            name="Smartphone XYZ 5G",
+            category="Electronics",
+            description="Smartphone com 5G e câmera de 64MP.",
+            value=99.99,
+            storage=50
+        )
+
+    def test_import_products_command(self):
+        """
+        Test importing a CSV feed with the management command
+        """
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False, encoding='utf-8') as feed:
+            feed.write("name,category,description,value,storage\n")
+            for i in range(5):
+                feed.write(f"Livro {i},Books,Livro de bolso,{10 + i}.50,{i}\n")
+            feed.write("Livro ruim,Books,Sem estoque,-1,abc\n")
+        self.addCleanup(os.remove, feed.name)
+
+        out, err = StringIO(), StringIO()
+        call_command('import_products', feed.name, '--batch-size', '2', stdout=out, stderr=err)
+
+        self.assertEqual(Products.objects.filter(category="Books").count(), 5)
+        self.assertIn('Imported 5 rows, 1 failed', out.getvalue())
+        self.assertIn('Line 7', err.getvalue())
+
+        # Imported rows are searchable right away
+        response = self.client.get(reverse('product-search'), {"name": "livro"})
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_import_products_endpoint_upsert(self):
+        """
+        Test uploading a JSONL feed that updates and creates products
+        """
+
+        lines = [
+            {"id": self.product1.id, "name": "Smartphone XYZ 6G", "category": "Electronics",
+             "description": "Nova versão.", "value": "109.99", "storage": 40},
+            {"name": "Fone Bluetooth", "category": "Electronics",
+             "description": "Fone sem fio.", "value": "59.90", "storage": 15},
+            "not an object",
+        ]
+        content = '\n'.join(json.dumps(line) for line in lines).encode()
+        upload = SimpleUploadedFile('feed.jsonl', content)
+
+        url = reverse('product-import-products')
+        response = self.client.post(url, {"file": upload, "upsert": "true"}, format='multipart')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['imported'], 2)
+        self.assertEqual(response.data['failed'], 1)
+        self.assertEqual(response.data['errors'][0]['line'], 3)
+        self.assertIn('rows_per_second', response.data)
+
+        self.product1.refresh_from_db()
+        self.assertEqual(self.product1.name, "Smartphone XYZ 6G")
+        self.assertEqual(self.product1.storage, 50)
+        self.assertEqual(Products.objects.count(), 2)
+        self.assertEqual(CategoryFacets.objects.get(category="Electronics").product_count, 2)
+
+        # Test forbidden error for users that are not superusers
+        response = APIClient().post(url, {"file": SimpleUploadedFile('feed.jsonl', content)}, format='multipart')
+        self.assertIn(response.status_code, [status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN])
+
+        # Test bad request error when the file is missing
+        response = self.client.post(url, {}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_products(self):
+        """
+        Test streaming the catalog as NDJSON and CSV
+        """
+
+        url = reverse('product-export-products')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        detail = self.client.get(reverse('product-detail', kwargs={'pk': self.product1.id}))
+        self.assertEqual(rows, [dict(detail.data)])
+
+        response = self.client.get(url, {"file_format": "csv"})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'id,name,category,description,value,storage,data_created,data_updated')
+        self.assertEqual(len(lines), 2)
+
+        # Only products updated since the given moment are exported
+        response = self.client.get(url, {"updated_since": "2999-01-01T00:00:00Z"})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+
+        # Test bad request error for an unknown format or date
+        response = self.client.get(url, {"file_format": "xml"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(url, {"updated_since": "yesterday"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_products_command(self):
+        """
+        Test exporting the catalog with the management command
+        """
+
+        out = StringIO()
+        call_command('export_products', '--format', 'ndjson', '--chunk-size', '1', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['name'], self.product1.name)
+
+
+class ProductsFastSerializationTestCase(TestCase):
+    """
+    Tests for the `.values()` fast path of product reads.
+    """
+
+    def setUp(self):
+        get_user_model().objects.create_superuser(username="testuser", password="password123")
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "testuser", "password": "password123"})
+
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+
+        for value in ["0", "0.10", "49.99", "1234567890123.45"]:
+            Products.objects.create(
+                name=f"Produto {value}",
+                category="Misc",
+                description="Descrição com acentuação.",
+                value=value,
+                storage=0
+            )
+
+    def test_fast_path_is_byte_identical(self):
+        """
+        Test that the fast path renders exactly what ProductsSerializer renders
+        """
+
+        queryset = Products.objects.order_by('id')
+        renderer = JSONRenderer()
+
+        expected = renderer.render(ProductsSerializer(queryset, many=True).data)
+        fast = renderer.render(products_values_serializer.data(products_values_serializer.values(queryset)))
+        self.assertEqual(fast, expected)
+
+        with timezone.override('UTC'):
+            expected = renderer.render(ProductsSerializer(queryset, many=True).data)
+            fast = renderer.render(products_values_serializer.data(products_values_serializer.values(queryset)))
+        self.assertEqual(fast, expected)
+
+    def test_fast_path_endpoints(self):
+        """
+        Test that product pages are the same with and without the fast path
+        """
+
+        for url, params in [
+            (reverse('product-list'), {"ordering": "-value"}),
+            (reverse('product-search'), {"name": "produto", "page_size": 2}),
+        ]:
+            with override_settings(PRODUCTS_FAST_SERIALIZATION=False):
+                expected = self.client.get(url, params)
+            with override_settings(PRODUCTS_FAST_SERIALIZATION=True):
+                response = self.client.get(url, params)
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['ETag'], expected['ETag'])
+
+
+class CategoryFacetsTestCase(TestCase):
+    """
+    Tests for the incrementally maintained category facets.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+        self.product1 = Products.objects.create(
+            name="Smartphone XYZ 5G",
+            category="Electronics",
+            description="Smartphone com 5G e câmera de 64MP.",
+            value=99.99,
+            storage=50
+        )
+        self.product2 = Products.objects.create(
+            name="Fone Bluetooth",
+            category="Electronics",
+            description="Fone sem fio.",
+            value=59.90,
+            storage=15
+        )
+        self.product3 = Products.objects.create(
+            name="Camiseta Masculina Slim Fit",
+            category="Clothing",
+            description="Camiseta slim fit em algodão.",
+            value=49.99,
+            storage=100
+        )
+
+    def assertFacetsConsistent(self):
+        """
+        Assert the maintained facets match a full rebuild.
+        """
+        maintained = list(CategoryFacets.objects.order_by('category').values(
+            'category', 'product_count', 'min_value', 'max_value', 'total_storage'
+        ))
+        call_command('rebuild_category_facets', stdout=StringIO())
+        rebuilt = list(CategoryFacets.objects.order_by('category').values(
+            'category', 'product_count', 'min_value', 'max_value', 'total_storage'
+        ))
+        self.assertEqual(maintained, rebuilt)
+
+    def test_category_facets(self):
+        """
+        Test the facets endpoint
+        """
+
+        url = reverse('product-category-facets')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), [
+            {"category": "Clothing", "product_count": 1, "min_value": "49.99",
+             "max_value": "49.99", "total_storage": 100},
+            {"category": "Electronics", "product_count": 2, "min_value": "59.90",
+             "max_value": "99.99", "total_storage": 65},
+        ])
+
+    def test_facets_follow_product_changes(self):
+        """
+        Test that saves, category moves and deletes keep the facets consistent
+        """
+
+        # Price change of the category maximum
+        self.product1.value = 19.99
+        self.product1.save()
+        facet = CategoryFacets.objects.get(category="Electronics")
+        self.assertEqual((facet.min_value, facet.max_value), (Decimal("19.99"), Decimal("59.90")))
+        self.assertFacetsConsistent()
+
+        # Storage change only
+        self.product2.storage = 20
+        self.product2.save()
+        self.assertEqual(CategoryFacets.objects.get(category="Electronics").total_storage, 70)
+        self.assertFacetsConsistent()
+
+        # Category move
+        self.product2.category = "Clothing"
+        self.product2.save()
+        self.assertEqual(CategoryFacets.objects.get(category="Electronics").product_count, 1)
+        self.assertEqual(CategoryFacets.objects.get(category="Clothing").product_count, 2)
+        self.assertFacetsConsistent()
+
+        # Deleting the last product of a category removes its facet
+        self.product1.delete()
+        self.assertFalse(CategoryFacets.objects.filter(category="Electronics").exists())
+        self.assertFacetsConsistent()
+
+    def test_facets_single_query(self):
+        """
+        Test that the facets are served with a single query
+        """
+
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-category-facets'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class ThrottlingTestCase(TestCase):
+    """
+    Tests for the fixed-window throttles of the catalog.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        Products.objects.create(
+            name="Caneca Térmica", category="Casa", description="Caneca de inox.", value=59.90, storage=10
+        )
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'search': '3/min'}})
+    def test_search_throttled_per_address(self):
+        """
+        Test searches take tokens per address, report them in headers and are refused once out
+        """
+        url = reverse('product-search')
+        for remaining in (2, 1, 0):
+            response = self.client.get(url, {"name": f"caneca {remaining}"})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(response['RateLimit-Limit'], '3')
+            self.assertEqual(response['RateLimit-Remaining'], str(remaining))
+            self.assertLessEqual(int(response['RateLimit-Reset']), 60)
+
+        # Refused before any query is run
+        with self.assertNumQueries(0):
+            response = self.client.get(url, {"name": "caneca"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['RateLimit-Remaining'], '0')
+        self.assertIn('Retry-After', response)
+
+        # Other addresses and endpoint classes keep their own counters
+        response = self.client.get(url, {"name": "caneca"}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(reverse('product-stock', kwargs={'pk': Products.objects.get().pk}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'search': '2/min'}})
+    def test_forwarded_for_does_not_pick_counter(self):
+        """
+        Test a client cannot get a fresh counter by sending a new X-Forwarded-For
+        """
+        url = reverse('product-search')
+        codes = [
+            self.client.get(url, {"name": f"caneca {i}"}, HTTP_X_FORWARDED_FOR=f'203.0.113.{i}').status_code
+            for i in range(4)
+        ]
+        self.assertEqual(codes, [200, 200, 429, 429])
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'search': '1/min'}})
+    def test_refusal_survives_evicted_counter(self):
+        """
+        Test a counter evicted while a request is refused still refuses instead of failing
+        """
+        url = reverse('product-search')
+        self.client.get(url, {"name": "caneca"})
+
+        with mock.patch.object(type(get_throttle_cache()), 'decr', side_effect=ValueError):
+            response = self.client.get(url, {"name": "caneca 1"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class StockReservationTestCase(TestCase):
+    """
+    Tests for the stock reservation engine.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.product = Products.objects.create(
+            name="Console Edição Limitada",
+            category="Games",
+            description="Console em pré-venda.",
+            value=2999.90,
+            storage=5
+        )
+
+    def assertReservedConsistent(self):
+        """
+        Assert `Products.reserved` is the sum of the live reservations.
+        """
+        self.product.refresh_from_db()
+        held = sum(StockReservations.objects.filter(product=self.product).values_list('quantity', flat=True))
+        self.assertEqual(self.product.reserved, held)
+        self.assertLessEqual(self.product.reserved, self.product.storage)
+
+    def test_reserve_and_release(self):
+        """
+        Test reservations take available units, refuse overselling and give units back
+        """
+        stock.reserve(self.product.id, 'cart:1', 3)
+        stock.reserve(self.product.id, 'cart:2', 2)
+        self.assertEqual(stock.available(self.product.id), 0)
+
+        with self.assertRaises(stock.InsufficientStock):
+            stock.reserve(self.product.id, 'cart:3', 1)
+
+        self.assertEqual(stock.release(self.product.id, 'cart:1', 1), 1)
+        self.assertEqual(stock.release(self.product.id, 'cart:2'), 2)
+        self.assertEqual(stock.available(self.product.id), 3)
+        self.assertReservedConsistent()
+
+    def test_expired_reservations(self):
+        """
+        Test expired holds are swept, and released on demand when stock runs out
+        """
+        stock.reserve(self.product.id, 'cart:1', 4)
+        stock.reserve(self.product.id, 'cart:2', 1)
+        StockReservations.objects.filter(holder='cart:1').update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        # The expired hold of cart:1 is released to make room
+        stock.reserve(self.product.id, 'cart:3', 3)
+        self.assertFalse(StockReservations.objects.filter(holder='cart:1').exists())
+        self.assertReservedConsistent()
+
+        StockReservations.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('release_expired_reservations', '--batch-size', '1', stdout=StringIO())
+        self.assertFalse(StockReservations.objects.exists())
+        self.assertReservedConsistent()
+        self.assertEqual(self.product.reserved, 0)
+
+    def test_stock_endpoint(self):
+        """
+        Test the stock endpoint reads the product row with a single query
+        """
+        stock.reserve(self.product.id, 'cart:1', 2)
+        stock.record(self.product.id, 4, 'restock')
+        url = reverse('product-stock', kwargs={'pk': self.product.id})
+
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(), {'id': self.product.id, 'storage': 5, 'pending': 4, 'reserved': 2, 'available': 7}
+        )
+
+    def test_product_update_keeps_reservations(self):
+        """
+        Test editing a product does not overwrite the units reserved meanwhile
+        """
+        stale = Products.objects.get(pk=self.product.id)
+        stock.reserve(self.product.id, 'cart:1', 2)
+
+        serializer = ProductsSerializer(stale, data={'value': 10}, partial=True)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+
+        self.assertReservedConsistent()
+        self.assertEqual(self.product.reserved, 2)
+
+    def test_admin_edit_keeps_stock(self):
+        """
+        Test the admin cannot edit the stock counters nor write back stale ones
+        """
+        request = RequestFactory().post('/')
+        request.user = get_user_model().objects.create_superuser(username="admin", password="adminpass")
+        model_admin = admin.site._registry[Products]
+        stale = Products.objects.get(pk=self.product.id)
+        stock.reserve(self.product.id, 'cart:1', 2)
+
+        form_class = model_admin.get_form(request, stale, change=True)
+        self.assertNotIn('storage', form_class.base_fields)
+        self.assertNotIn('reserved', form_class.base_fields)
+        form = form_class(data={
+            'name': stale.name, 'category': stale.category, 'description': stale.description, 'value': '10.00',
+        }, instance=stale)
+        self.assertTrue(form.is_valid(), form.errors)
+        model_admin.save_model(request, form.save(commit=False), form, change=True)
+
+        self.assertReservedConsistent()
+        self.assertEqual((self.product.value, self.product.reserved), (Decimal('10.00'), 2))
+
+
+class InventoryLedgerTestCase(TestCase):
+    """
+    Tests for the append-only inventory ledger and its compaction.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.superuser = get_user_model().objects.create_superuser(username="admin", password="adminpass")
+        self.client = APIClient()
+        self.product = Products.objects.create(
+            name="Fone Bluetooth", category="Audio", description="Fone sem fio.", value=199.90, storage=10
+        )
+
+    def on_hand(self):
+        return Products.objects.filter(pk=self.product.id).values_list(stock.on_hand(), flat=True).get()
+
+    def test_compaction_keeps_stock(self):
+        """
+        Test stock reads the same before and after every compaction batch
+        """
+        stock.reserve(self.product.id, 'cart:1', 3)
+        for delta, reason in [(5, 'restock'), (-2, 'adjustment'), (1, 'return'), (7, 'restock'), (-4, 'adjustment')]:
+            stock.record(self.product.id, delta, reason)
+            self.assertEqual(self.on_hand(), stock.available(self.product.id) + 3)
+        self.assertEqual(stock.available(self.product.id), 14)
+
+        # Unchanged after every batch, and in total
+        self.assertEqual(stock.compact(batch_size=2), 5)
+        self.assertEqual(stock.available(self.product.id), 14)
+        self.assertEqual(stock.compact(), 0)
+
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.storage, self.product.reserved), (17, 3))
+        self.assertEqual(CategoryFacets.objects.get(category="Audio").total_storage, 17)
+        self.assertEqual(InventoryMovements.objects.filter(compacted=False).count(), 0)
+        self.assertEqual(InventoryMovements.objects.count(), 5)
+
+    def test_reservations_see_pending_movements(self):
+        """
+        Test reservations and sales check the snapshot plus the pending tail
+        """
+        stock.record(self.product.id, -8, 'adjustment')
+        with self.assertRaises(stock.InsufficientStock) as raised:
+            stock.reserve(self.product.id, 'cart:1', 3)
+        self.assertEqual(raised.exception.available, 2)
+
+        stock.record(self.product.id, 6, 'restock')
+        stock.reserve(self.product.id, 'cart:1', 8)
+        with transaction.atomic():
+            stock.sell('cart:1', {self.product.id: 8}, reference='order:1')
+        self.assertEqual(stock.available(self.product.id), 0)
+        self.assertEqual(
+            list(InventoryMovements.objects.filter(reason='sale').values_list('delta', 'reference')),
+            [(-8, 'order:1')]
+        )
+
+        stock.compact()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.storage, self.product.reserved), (0, 0))
+
+    def test_record_movement_endpoint(self):
+        """
+        Test superusers record movements, which count in the stock at once
+        """
+        url = reverse('product-record-movement', kwargs={'pk': self.product.id})
+        data = {'delta': 5, 'reason': 'restock', 'reference': 'NF-123'}
+
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.client.force_authenticate(user=self.superuser)
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['product'], self.product.id)
+        self.assertEqual(stock.available(self.product.id), 15)
+
+        response = self.client.post(url, {'delta': -1, 'reason': 'sale'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(url, {'delta': 0, 'reason': 'adjustment'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # Units held by carts cannot be adjusted away
+        stock.reserve(self.product.id, 'cart:1', 3)
+        response = self.client.post(url, {'delta': -13, 'reason': 'adjustment'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['available'], 12)
+        response = self.client.post(url, {'delta': -1000, 'reason': 'adjustment'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(stock.available(self.product.id), 12)
+        stock.release(self.product.id, 'cart:1')
+
+        call_command('compact_inventory', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.storage, 15)
+
+
+class InventoryLedgerStressTestCase(TransactionTestCase):
+    """
+    Concurrent restocks and compactions against one product.
+    """
+
+    def test_stock_always_consistent(self):
+        """
+        Test readers never see a movement counted twice or missed while compaction runs
+        """
+        product = Products.objects.create(
+            name="Caderno Universitário", category="Papelaria", description="200 folhas.", value=29.90, storage=0
+        )
+        errors = []
+        samples = []
+        stop = threading.Event()
+
+        def writer(number):
+            try:
+                for i in range(25):
+                    stock.record(product.id, 1, 'restock', reference=f'{number}:{i}')
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def compactor():
+            try:
+                while not stop.is_set():
+                    stock.compact(batch_size=7)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def reader():
+            try:
+                while not stop.is_set():
+                    samples.append(stock.available(product.id))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=writer, args=(number,)) for number in range(8)]
+        background = [threading.Thread(target=compactor), threading.Thread(target=reader)]
+        for thread in background + threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop.set()
+        for thread in background:
+            thread.join()
+
+        # Only restocks: a double count would jump above 200, a missed movement would go backwards
+        self.assertEqual(errors, [])
+        self.assertEqual(samples, sorted(samples))
+        self.assertLessEqual(samples[-1], 200)
+        self.assertEqual(stock.available(product.id), 200)
+
+        stock.compact()
+        product.refresh_from_db()
+        self.assertEqual(product.storage, 200)
+        self.assertFalse(InventoryMovements.objects.filter(compacted=False).exists())
+
+
+class StockReservationStressTestCase(TransactionTestCase):
+    """
+    Concurrent reservations, releases and sweeps against one scarce product.
+    """
+
+    def test_stock_never_goes_negative(self):
+        """
+        Test parallel reservations never take more units than the storage
+        """
+        product = Products.objects.create(
+            name="Tênis Edição Limitada", category="Shoes", description="Lançamento.", value=899.90, storage=20
+        )
+        errors = []
+        lowest = []
+        stop = threading.Event()
+
+        def shopper(number):
+            holder = f'cart:{number}'
+            generator = random.Random(number)
+            try:
+                for _ in range(30):
+                    if generator.random() < 0.6:
+                        try:
+                            stock.reserve(product.id, holder, generator.randint(1, 3))
+                        except stock.InsufficientStock:
+                            pass
+                    else:
+                        stock.release(product.id, holder, generator.randint(1, 3))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def sweeper():
+            try:
+                while not stop.is_set():
+                    StockReservations.objects.filter(holder__endswith='0').update(expires_at=timezone.now())
+                    stock.release_expired(batch_size=5)
+                    lowest.append(stock.available(product.id))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=shopper, args=(number,)) for number in range(12)]
+        sweeping = threading.Thread(target=sweeper)
+        sweeping.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stop.set()
+        sweeping.join()
+
+        self.assertEqual(errors, [])
+        self.assertGreaterEqual(min(lowest), 0)
+        product.refresh_from_db()
+        held = sum(StockReservations.objects.filter(product=product).values_list('quantity', flat=True))
+        self.assertEqual(product.reserved, held)
+        self.assertLessEqual(product.reserved, product.storage)
\ No newline at end of file
@@ -1,37 +1,86 @@
-from rest_framework import viewsets, status
-from .models import Products
-from .serializers import ProductsSerializer
+import os
+from django.conf import settings
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from rest_framework import viewsets, status, serializers
+from .models import CategoryFacets, Products
+from .serializers import (
+    CategoryFacetsSerializer, InventoryMovementsSerializer, ProductsSerializer, ProductSearchSerializer,
+    ProductStockSerializer, products_values_serializer,
+)
 from rest_framework.response import Response
 from .permissions import IsSuperUser
+from .pagination import ProductsCursorPagination
+from .search import get_search_backend
+from .stock import InsufficientStock, on_hand, pending, record
+from .caching import CachedResponseMixin
+from .importer import IMPORT_FORMATS, ProductImporter, open_text
+from .exporter import EXPORT_FORMATS, export_lines, export_queryset
+from .conditional import conditional_response, instance_validators, page_validators
 from rest_framework.permissions import AllowAny
 from rest_framework.decorators import action
 
 # ViewSet to manage product-related CRUD operations
-class ProductsViewSet(viewsets.ModelViewSet):
+class ProductsViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """
     ViewSet for handling CRUD operations and custom actions for Products.
 
     This ViewSet provides:
     - Default CRUD operations (list, create, retrieve, update, delete).
-    - Custom actions for filtering products by category, value, and name.
+    - A search action combining category, price range and name filters,
+      plus the older single-filter actions built on top of it.
+    - Keyset (cursor) pagination on every read path that returns many products.
+    - A full-response cache for anonymous reads, invalidated on any product change.
+    - Conditional GETs (ETag / Last-Modified / 304) driven by `data_updated`.
+    - Per-category facets, bulk import and streaming export.
     - Permission logic to restrict certain actions to superusers only.
     """
     queryset = Products.objects.all()  # Queryset to retrieve all products
     serializer_class = ProductsSerializer  # Serializer to handle product data
+    pagination_class = ProductsCursorPagination  # Cursor pagination without OFFSET scans
+    cached_actions = [
+        'list', 'retrieve', 'search', 'category_facets',
+        'browse_products_by_category', 'browse_products_by_value', 'browse_products_by_name',
+    ]  # Anonymous reads are identical for every caller
+    public_actions = cached_actions + ['stock']  # Stock moves with every cart change; never cached
+    throttle_scopes = dict.fromkeys(  # Filters and searches that hit the database, per client
+        ['search', 'browse_products_by_category', 'browse_products_by_value', 'browse_products_by_name'], 'search'
+    )
 
     def get_permissions(self):
         """
         Override default permission logic.
 
-        - 'list' and 'retrieve' actions are open to all users.
+        - Read actions (list, retrieve, search and the filters) are open to all users.
         - Other actions (create, update, delete) are restricted to superusers.
         """
-        if self.action not in ['list', 'retrieve']:
+        if self.action not in self.public_actions:
             permission_classes = [IsSuperUser]  # Custom permission for superusers
         else:
             permission_classes = [AllowAny]  # Open access for public endpoints
         return [permission() for permission in permission_classes]
 
+    def list(self, request, *args, **kwargs):
+        """
+        List products one page at a time.
+
+        Supports conditional GETs: the `ETag`/`Last-Modified` validators come
+        from the `data_updated` values of the fetched page, and a matching
+        `If-None-Match`/`If-Modified-Since` gets a 304 without serializing anything.
+        """
+        return self.paginated_response(request, self.get_queryset())
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a product, answering conditional GETs from its `data_updated`.
+        """
+        instance = self.get_object()
+        return conditional_response(
+            request,
+            instance_validators(request, instance),
+            lambda: Response(self.get_serializer(instance).data)
+        )
+
     def create(self, request, *args, **kwargs):
         """
         Custom create method to register a new product.
@@ -57,114 +106,296 @@ class ProductsViewSet(viewsets.ModelViewSet):
         # Return a 400 response if input data is invalid
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    @action(detail=False, methods=["GET"], url_path="filter_category")
-    def browse_products_by_category(self, request):
+    def filter_products(self, filters):
         """
-        Custom action to filter products by category.
+        Build the product queryset for a set of validated search filters.
 
-        Query Parameters:
-            - category: The category to filter products by.
+        Args:
+            filters (dict): Validated data from `ProductSearchSerializer`.
 
         Returns:
-            - List of products in the given category or appropriate error messages.
+            QuerySet: Products matching every given filter (not yet evaluated).
+        """
+        queryset = self.get_queryset()
+
+        if filters.get('category'):
+            queryset = queryset.filter(category=filters['category'])
+        if filters.get('min_price') is not None:
+            queryset = queryset.filter(value__gte=filters['min_price'])
+        if filters.get('max_price') is not None:
+            queryset = queryset.filter(value__lte=filters['max_price'])
+        if filters.get('name'):
+            # Full-text search over name and description, ranked by relevance
+            queryset = get_search_backend().search(queryset, filters['name'])
+
+        return queryset
+
+    def search_response(self, request):
+        """
+        Validate the search parameters and return one page of matching products.
+
+        The page is fetched with a single query; an empty result is a regular
+        200 response with an empty `results` list.
+        """
+        params = ProductSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        filters = params.validated_data
+
+        if 'min_price' in filters or 'max_price' in filters:
+            # Price ranges are walked in price order so they stay an index range scan
+            self.paginator.default_ordering = 'value'
+
+        return self.paginated_response(request, self.filter_products(filters))
+
+    def paginated_response(self, request, queryset):
+        """
+        Fetch one page of the queryset and return it, or a 304 when the
+        client already has it.
+        """
+        fast = getattr(settings, 'PRODUCTS_FAST_SERIALIZATION', False)
+        if fast:
+            # Read-only fast path: plain `.values()` rows and precompiled converters
+            queryset = products_values_serializer.values(queryset)
+
+        page = self.paginate_queryset(queryset)
+
+        def get_response():
+            if fast:
+                return self.get_paginated_response(products_values_serializer.data(page))
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        return conditional_response(
+            request, page_validators(request, page, self.paginator), get_response
+        )
+
+    @action(detail=False, methods=['POST'], url_path='import')
+    def import_products(self, request):
         """
-        category = request.query_params.get('category')  # Get category parameter
+        Custom action to bulk import products from an uploaded CSV or JSONL file.
 
-        if not category:
+        The file is streamed and written in batches with `bulk_create`, each
+        batch in its own transaction, so memory stays constant whatever its size.
+
+        Form Fields:
+            - file: The CSV or JSONL file.
+            - file_format: `csv` or `jsonl` (optional, guessed from the file name).
+            - batch_size: Rows per transaction (optional, default 1000).
+            - upsert: Update rows whose `id` already exists (optional).
+
+        Returns:
+            - A report with imported/failed counts, per-row errors and rows/sec.
+        """
+        upload = request.FILES.get('file')
+        if upload is None:
             return Response(
-                {'detail': 'Category parameter is required.'},
+                {'detail': 'File parameter is required.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Retrieve products matching the given category
-        products_by_category = Products.objects.filter(category=category)
+        file_format = request.data.get('file_format') or os.path.splitext(upload.name)[1].lstrip('.').lower()
+        if file_format not in IMPORT_FORMATS:
+            return Response(
+                {'detail': f'File format must be one of: {", ".join(IMPORT_FORMATS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        if not products_by_category.exists():
+        try:
+            batch_size = int(request.data.get('batch_size', 1000))
+        except ValueError:
+            batch_size = 0
+        if batch_size < 1:
             return Response(
-                {'detail': f'No products found for category {category}'},
-                status=status.HTTP_404_NOT_FOUND
+                {'detail': 'Batch size must be a positive integer.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Serialize and return the matching products
-        serializer = self.get_serializer(products_by_category, many=True)
-        return Response(serializer.data)
+        upsert = str(request.data.get('upsert', '')).lower() in ('1', 'true', 'yes')
+        importer = ProductImporter(batch_size=batch_size, upsert=upsert)
+        report = importer.run(open_text(upload.open('rb')), file_format)
+        return Response(report.as_dict(), status=status.HTTP_200_OK)
 
-    @action(detail=False, methods=["GET"], url_path="filter_value")
-    def browse_products_by_value(self, request):
+    @action(detail=False, methods=['GET'], url_path='export')
+    def export_products(self, request):
         """
-        Custom action to filter products by price range.
+        Custom action to stream the whole catalog for feed partners.
+
+        Rows are read with a server-side iterator and streamed as they are
+        formatted, so memory stays bounded regardless of the catalog size.
 
         Query Parameters:
-            - min_price: Minimum product price (optional).
-            - max_price: Maximum product price (optional).
+            - file_format: `ndjson` (default) or `csv`.
+            - updated_since: Only products updated since this ISO 8601 datetime (optional).
 
         Returns:
-            - List of products within the given price range or appropriate error messages.
+            - A streaming NDJSON or CSV attachment, or a 400 response for invalid parameters.
         """
-        # Retrieve query parameters for price filtering
-        min_price = request.query_params.get('min_price')
-        max_price = request.query_params.get('max_price')
-
-        # Validate input parameters
-        if not min_price and not max_price:
+        file_format = request.query_params.get('file_format', 'ndjson')
+        if file_format not in EXPORT_FORMATS:
             return Response(
-                {'detail': 'Min price and Max price parameters are required.'},
+                {'detail': f'File format must be one of: {", ".join(EXPORT_FORMATS)}.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Filter products based on price range
-        if not min_price:
-            products_by_value = Products.objects.filter(value__lte=max_price)
-        elif not max_price:
-            products_by_value = Products.objects.filter(value__gte=min_price)
-        else:
-            # Ensure min_price is less than max_price
-            if float(min_price) > float(max_price):
-                return Response(
-                    {'detail': 'Min price parameter must be lower than Max price parameter.'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            products_by_value = Products.objects.filter(value__range=(min_price, max_price))
+        updated_since = request.query_params.get('updated_since')
+        if updated_since:
+            try:
+                updated_since = serializers.DateTimeField().to_internal_value(updated_since)
+            except serializers.ValidationError as e:
+                return Response({'updated_since': e.detail}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(
+            export_lines(export_queryset(updated_since or None), file_format),
+            content_type=EXPORT_FORMATS[file_format]
+        )
+        response['Content-Disposition'] = f'attachment; filename="products.{file_format}"'
+        return response
+
+    @action(detail=True, methods=['GET'], url_path='stock')
+    def stock(self, request, pk=None):
+        """
+        Custom action returning the storage, pending, reserved and available
+        units of a product.
+
+        One primary-key lookup: `reserved` is maintained on the product row by
+        the reservation engine, and the movements not yet compacted into
+        `storage` are summed from a partial index.
+        """
+        try:
+            product = Products.objects.filter(pk=pk).values('id', 'storage', 'reserved').annotate(
+                pending=pending(), available=on_hand() - F('reserved')
+            ).get()
+        except (Products.DoesNotExist, ValueError):
+            return Response({'detail': 'Product not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ProductStockSerializer(product).data, status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['POST'], url_path='movements')
+    def record_movement(self, request, pk=None):
+        """
+        Custom action appending a restock, return or adjustment to the
+        inventory ledger of a product.
+
+        The movement is only inserted, so it never waits on carts reserving
+        the same product; it counts in the stock right away and is folded
+        into `storage` by the `compact_inventory` command.
 
-        # Handle case where no products are found
-        if not products_by_value.exists():
+        Request body:
+            - delta: Units added, or taken out when negative.
+            - reason: restock, return or adjustment.
+            - reference: What caused the change (optional).
+
+        Returns:
+            - The recorded movement.
+            - HTTP 409 (Conflict): A negative delta larger than the units available.
+        """
+        try:
+            product_id = Products.objects.filter(pk=pk).values_list('pk', flat=True).get()
+        except (Products.DoesNotExist, ValueError):
+            return Response({'detail': 'Product not found.'}, status=status.HTTP_404_NOT_FOUND)
+        serializer = InventoryMovementsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            movement = record(product_id, **serializer.validated_data)
+        except InsufficientStock as e:
             return Response(
-                {'detail': 'No products found.'},
-                status=status.HTTP_404_NOT_FOUND
+                {'detail': 'Not enough stock available.', 'product': e.product_id, 'available': e.available},
+                status=status.HTTP_409_CONFLICT
             )
+        return Response(InventoryMovementsSerializer(movement).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['GET'], url_path='facets')
+    def category_facets(self, request):
+        """
+        Custom action returning the product count, price range and total
+        storage of every category.
 
-        # Serialize and return the matching products
-        serializer = self.get_serializer(products_by_value, many=True)
+        Served from the `CategoryFacets` aggregate table, which is kept up to
+        date on every product change, so it is one indexed read instead of a
+        GROUP BY over the whole catalog.
+
+        Returns:
+            - List of facets ordered by category.
+        """
+        facets = CategoryFacets.objects.filter(product_count__gt=0).order_by('category')
+        serializer = CategoryFacetsSerializer(facets, many=True)
         return Response(serializer.data)
 
-    @action(detail=False, methods=['GET'], url_path="filter_name")
-    def browse_products_by_name(self, request):
+    @action(detail=False, methods=['GET'], url_path='search')
+    def search(self, request):
         """
-        Custom action to filter products by name.
+        Custom action to search products combining several filters.
 
         Query Parameters:
-            - name: The name (or partial name) to search products by.
+            - category: Exact category of the products (optional).
+            - min_price: Minimum product price (optional).
+            - max_price: Maximum product price (optional).
+            - name: Words to look up in the product name and description (optional).
+            - ordering: One of `id`, `-id`, `value`, `-value` or `relevance` (optional);
+              name searches are ordered by relevance and price ranges by value by default.
 
         Returns:
-            - List of products matching the given name or appropriate error messages.
+            - A page of products matching every given filter, or a 400 response
+              when the parameters are invalid.
         """
-        name = request.query_params.get('name')  # Get name parameter
+        return self.search_response(request)
+
+    @action(detail=False, methods=["GET"], url_path="filter_category")
+    def browse_products_by_category(self, request):
+        """
+        Custom action to filter products by category.
+
+        Kept for existing clients; it is a restricted form of `search`.
 
-        if not name:
+        Query Parameters:
+            - category: The category to filter products by.
+
+        Returns:
+            - A page of products in the given category or appropriate error messages.
+        """
+        if not request.query_params.get('category'):
             return Response(
-                {'detail': 'Name parameter is required.'},
+                {'detail': 'Category parameter is required.'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        return self.search_response(request)
 
-        # Filter products where name contains the given value (case insensitive)
-        products_by_name = Products.objects.filter(name__icontains=name)
+    @action(detail=False, methods=["GET"], url_path="filter_value")
+    def browse_products_by_value(self, request):
+        """
+        Custom action to filter products by price range.
+
+        Kept for existing clients; it is a restricted form of `search`.
+
+        Query Parameters:
+            - min_price: Minimum product price (optional).
+            - max_price: Maximum product price (optional).
 
-        if not products_by_name.exists():
+        Returns:
+            - A page of products within the given price range or appropriate error messages.
+        """
+        if not request.query_params.get('min_price') and not request.query_params.get('max_price'):
             return Response(
-                {'detail': 'No products found.'},
-                status=status.HTTP_404_NOT_FOUND
+                {'detail': 'Min price and Max price parameters are required.'},
+                status=status.HTTP_400_BAD_REQUEST
             )
+        return self.search_response(request)
 
-        # Serialize and return the matching products
-        serializer = self.get_serializer(products_by_name, many=True)
-        return Response(serializer.data)
+    @action(detail=False, methods=['GET'], url_path="filter_name")
+    def browse_products_by_name(self, request):
+        """
+        Custom action to filter products by name.
+
+        Kept for existing clients; it is a restricted form of `search`.
+
+        Query Parameters:
+            - name: Words to look up in the product name and description.
+
+        Returns:
+            - A page of products matching the given name or appropriate error messages.
+        """
+        if not request.query_params.get('name'):
+            return Response(
+                {'detail': 'Name parameter is required.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.search_response(request)
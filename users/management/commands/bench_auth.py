@@ -0,0 +1,57 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from cart.models import Carts
+from cart.views import ItensCartViewSet
+from users.authentication import CachedJWTAuthentication, forget_user
+from users.models import Users
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare queries and time per authenticated request with the plain and the cached JWT '
+        'authentication, on the cart badge endpoint. Rows are created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help='Requests served per authentication class.')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = Users.objects.create(username='bench-auth', cpf='bench-auth', email='bench-auth@example.com')
+            Carts.objects.create(user=user)
+            token = str(AccessToken.for_user(user))
+            forget_user(user.pk)
+
+            factory = APIRequestFactory()
+            for authentication in (JWTAuthentication, CachedJWTAuthentication):
+                view = ItensCartViewSet.as_view({'get': 'badge'}, authentication_classes=[authentication])
+                queries, elapsed = self.measure(view, factory, token, options['requests'])
+                self.stdout.write(
+                    f'{authentication.__name__:>24}: {queries / options["requests"]:.2f} queries/request, '
+                    f'{elapsed / options["requests"] * 1000:.3f} ms/request'
+                )
+
+            transaction.set_rollback(True)
+        forget_user(user.pk)
+
+    @staticmethod
+    def measure(view, factory, token, requests):
+        """
+        Serve `requests` badge requests; return the queries run and the wall time.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(requests):
+                request = factory.get('/api/cart/badge/', HTTP_HOST='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+                response = view(request)
+                if response.status_code != 200:
+                    raise CommandError(f'Badge request failed: {response.data}')
+            elapsed = time.perf_counter() - started
+        return len(queries.captured_queries), elapsed
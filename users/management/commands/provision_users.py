@@ -0,0 +1,44 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import open_text
+from users.provisioning import PROVISION_FORMATS, UserProvisioner
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL file of users into the database in batches, with a cart each.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Path of the CSV or JSONL file.')
+        parser.add_argument(
+            '--format', dest='file_format', choices=PROVISION_FORMATS,
+            help='File format; guessed from the extension when omitted.'
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per transaction.')
+        parser.add_argument('--workers', type=int, help='Password hashing processes; one per CPU by default.')
+        parser.add_argument('--max-errors', type=int, default=100, help='Row errors to report in detail.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['file_format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if file_format not in PROVISION_FORMATS:
+            raise CommandError('Could not guess the file format; use --format.')
+
+        provisioner = UserProvisioner(
+            batch_size=options['batch_size'],
+            workers=options['workers'],
+            max_errors=options['max_errors'],
+        )
+        try:
+            with open(path, 'rb') as binary:
+                report = provisioner.run(open_text(binary), file_format)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for error in report.errors:
+            self.stderr.write(f"Line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'Provisioned {report.imported} users, {report.failed} failed '
+            f'in {report.elapsed:.2f}s ({report.rows_per_second} rows/s).'
+        ))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.revocation import purge_expired
+
+
+class Command(BaseCommand):
+    help = 'Delete the token revocations whose tokens have all expired.'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} expired revocations.'))
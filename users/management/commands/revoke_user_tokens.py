@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from users.models import Users
+from users.revocation import revoke_user
+
+
+class Command(BaseCommand):
+    help = 'Revoke every token issued so far to a user, such as a compromised account.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Username whose tokens are revoked.')
+
+    def handle(self, *args, **options):
+        try:
+            user = Users.objects.get(username=options['username'])
+        except Users.DoesNotExist:
+            raise CommandError(f'User {options["username"]!r} does not exist.')
+        revoke_user(user.pk)
+        self.stdout.write(self.style.SUCCESS(f'Revoked every token of {user.username}.'))
@@ -4,3 +4,28 @@ from django.contrib.auth.models import AbstractUser
 class Users(AbstractUser):
     cpf = models.CharField(max_length=14, unique=True)
     email = models.EmailField(unique=True)
+
+
+class RevokedTokens(models.Model):
+    """
+    Authoritative record of revoked JWTs.
+
+    A row revokes either one token, by its `jti`, or every token of the user
+    issued before `revoked_before` (logout everywhere, compromised account).
+    Rows are only needed until `expires_at`, when every token they revoke
+    has expired anyway. Requests are checked against the in-memory
+    `users.revocation.revocations` set built from this table.
+    """
+    jti = models.CharField(max_length=255, unique=True, null=True, blank=True)
+    user = models.ForeignKey(Users, on_delete=models.CASCADE, related_name='revoked_tokens')
+    revoked_before = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField(db_index=True)
+    data_created = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(jti__isnull=False) ^ models.Q(revoked_before__isnull=False),
+                name='revoked_token_or_watermark',
+            ),
+        ]
@@ -0,0 +1,159 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from rest_framework.exceptions import ValidationError
+from rest_framework.validators import UniqueValidator
+
+from cart.models import Carts
+from cart.services import forget_cart_id
+from products.importer import ImportReport, iter_rows
+
+from .authentication import forget_user
+from .models import Users
+from .serializers import UsersSerializer
+
+PROVISION_FORMATS = ('csv', 'jsonl')
+UNIQUE_FIELDS = ('username', 'cpf', 'email')
+
+
+def setup_worker():
+    """
+    Make Django usable in a hashing process started with `spawn`.
+    """
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def hash_password(raw_password):
+    return make_password(raw_password)
+
+
+class UserProvisioner:
+    """
+    Streams user rows into the database in batches, with a cart each.
+
+    Rows are validated with the `UsersSerializer` rules, except that
+    uniqueness is checked with one query per unique field and batch instead
+    of per row. The passwords of a batch are hashed across a process pool,
+    as hashing is CPU bound, then the users and their carts are written with
+    two `bulk_create` in one transaction. A row clashing with an existing
+    user, or with an earlier row of the file, is reported and skipped; the
+    rest of the run goes on.
+
+    Args:
+        batch_size (int): Rows validated and inserted per transaction.
+        workers (int): Hashing processes; one per CPU when None.
+        max_errors (int): Maximum number of row errors kept in the report.
+    """
+
+    def __init__(self, batch_size=500, workers=None, max_errors=100):
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+        self.max_errors = max_errors
+        self.validator = UsersSerializer()
+        for name in UNIQUE_FIELDS:
+            field = self.validator.fields[name]
+            field.validators = [v for v in field.validators if not isinstance(v, UniqueValidator)]
+
+    def run(self, stream, file_format):
+        """
+        Provision every row of `stream` and return an `ImportReport`.
+        """
+        if file_format not in PROVISION_FORMATS:
+            raise ValueError(f'Unsupported format {file_format!r}; choose one of {", ".join(PROVISION_FORMATS)}.')
+
+        report = ImportReport(self.max_errors)
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=setup_worker) as pool:
+            batch = []
+            for line, row in iter_rows(stream, file_format):
+                if row is None:
+                    report.add_error(line, {'non_field_errors': ['Invalid JSON object.']})
+                    continue
+                batch.append((line, row))
+                if len(batch) >= self.batch_size:
+                    self.provision_batch(batch, report, pool)
+                    batch = []
+            if batch:
+                self.provision_batch(batch, report, pool)
+        return report.finish()
+
+    def provision_batch(self, batch, report, pool):
+        """
+        Validate, hash and write one batch, recording errors in the report.
+
+        Earlier batches are already in the database, so clashes with them are
+        found by the same queries as clashes with existing users.
+        """
+        rows = []
+        for line, row in batch:
+            try:
+                rows.append((line, self.validator.run_validation(row)))
+            except ValidationError as e:
+                report.add_error(line, e.detail)
+
+        taken = {
+            name: set(Users.objects.filter(**{f'{name}__in': [data[name] for _, data in rows]})
+                      .values_list(name, flat=True))
+            for name in UNIQUE_FIELDS
+        }
+        seen = {name: set() for name in UNIQUE_FIELDS}
+        accepted = []
+        for line, data in rows:
+            clashes = {
+                name: [f'user with this {name} already exists.']
+                for name in UNIQUE_FIELDS
+                if data[name] in taken[name] or data[name] in seen[name]
+            }
+            if clashes:
+                report.add_error(line, clashes)
+                continue
+            for name in UNIQUE_FIELDS:
+                seen[name].add(data[name])
+            accepted.append((line, data))
+        if not accepted:
+            return
+
+        passwords = [data.pop('password') for _, data in accepted]
+        chunksize = math.ceil(len(passwords) / self.workers)
+        users = [
+            Users(**data, password=hashed)
+            for (_, data), hashed in zip(accepted, pool.map(hash_password, passwords, chunksize=chunksize))
+        ]
+
+        try:
+            with transaction.atomic():
+                self.write(users)
+        except IntegrityError:
+            # A clashing user was created meanwhile: fall back to one row at a time
+            for user in users:
+                user.pk = None
+            users = self.write_one_by_one([line for line, _ in accepted], users, report)
+        report.imported += len(users)
+
+        # bulk_create sends no post_save; drop anything cached for the new ids
+        for user in users:
+            forget_user(user.pk)
+            forget_cart_id(user.pk)
+
+    @staticmethod
+    def write(users):
+        Users.objects.bulk_create(users)
+        Carts.objects.bulk_create(Carts(user=user) for user in users)
+
+    def write_one_by_one(self, lines, users, report):
+        written = []
+        for line, user in zip(lines, users):
+            try:
+                with transaction.atomic():
+                    self.write([user])
+            except IntegrityError as e:
+                user.pk = None
+                report.add_error(line, {'non_field_errors': [str(e)]})
+                continue
+            written.append(user)
+        return written
@@ -0,0 +1,190 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import RevokedTokens
+
+# Rows are re-read this far back on every refresh, to cover transactions
+# that committed after a newer row was seen and clock skew between servers
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class BloomFilter:
+    """
+    Fixed-size set of strings answering "maybe present" or "surely absent".
+
+    Sized for `capacity` items at a false-positive rate of `error_rate`;
+    past that capacity the rate grows, so the owner rebuilds it larger.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        self.capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item):
+        """
+        Add an item; items already (maybe) present are not counted again.
+        """
+        positions = self.positions(item)
+        if all(self.bits[p >> 3] & (1 << (p & 7)) for p in positions):
+            return
+        for p in positions:
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self.positions(item))
+
+
+class RevocationSet:
+    """
+    Process-local view of the `RevokedTokens` table, checked on every request.
+
+    Revoked token ids live in a Bloom filter and the per-user watermarks in a
+    dict, so checking a token costs no query: only a Bloom filter hit, which
+    is a revoked token or a rare false positive, is confirmed against the
+    table. At most every `TOKEN_REVOCATION_REFRESH_INTERVAL` seconds the rows
+    created since the previous refresh are read; the filter is rebuilt from
+    the live rows when it outgrows its capacity. Revocations made in this
+    process apply at once, those made elsewhere within the refresh interval.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        """
+        Forget everything; the next check rebuilds from the table.
+        """
+        self.bloom = None
+        self.watermarks = {}
+        self.synced_at = None
+        self.checked_at = 0.0
+
+    def refresh(self, force=False):
+        """
+        Read the revocations created since the last refresh, when it is due.
+        """
+        interval = getattr(settings, 'TOKEN_REVOCATION_REFRESH_INTERVAL', 5)
+        if not force and self.bloom is not None and time.monotonic() - self.checked_at < interval:
+            return
+        with self.lock:
+            if not force and self.bloom is not None and time.monotonic() - self.checked_at < interval:
+                return
+            started = timezone.now()
+            if self.bloom is None or self.bloom.count > self.bloom.capacity:
+                self.rebuild(started)
+            else:
+                rows = RevokedTokens.objects.filter(data_created__gte=self.synced_at - SYNC_OVERLAP)
+                self.load(rows.values_list('jti', 'user_id', 'revoked_before', 'expires_at'))
+            self.synced_at = started
+            self.checked_at = time.monotonic()
+
+    def rebuild(self, now):
+        rows = list(
+            RevokedTokens.objects.filter(expires_at__gt=now)
+            .values_list('jti', 'user_id', 'revoked_before', 'expires_at')
+        )
+        tokens = sum(1 for jti, *_ in rows if jti is not None)
+        self.bloom = BloomFilter(
+            max(2 * tokens, getattr(settings, 'TOKEN_REVOCATION_CAPACITY', 10000)),
+            getattr(settings, 'TOKEN_REVOCATION_ERROR_RATE', 0.01),
+        )
+        self.watermarks = {}
+        self.load(rows)
+
+    def load(self, rows):
+        for jti, user_id, revoked_before, expires_at in rows:
+            if jti is not None:
+                self.bloom.add(jti)
+            else:
+                self.add_watermark(user_id, revoked_before, expires_at)
+
+    def add_watermark(self, user_id, revoked_before, expires_at):
+        current = self.watermarks.get(str(user_id))
+        if current is None or current[0] < revoked_before:
+            self.watermarks[str(user_id)] = (revoked_before, expires_at)
+
+    def is_revoked(self, token):
+        """
+        Return whether a validated token (or its payload) was revoked.
+
+        A token is revoked when it was issued before its user's watermark,
+        or when its id is in the filter and confirmed by the table.
+        """
+        self.refresh()
+
+        watermark = self.watermarks.get(str(token.get(api_settings.USER_ID_CLAIM)))
+        issued_at = token.get('iat')
+        if watermark is not None and issued_at is not None and issued_at < int(watermark[0].timestamp()):
+            return True
+
+        jti = token.get(api_settings.JTI_CLAIM)
+        return jti is not None and jti in self.bloom and RevokedTokens.objects.filter(jti=jti).exists()
+
+
+revocations = RevocationSet()
+
+
+def token_expiry(token):
+    return datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc)
+
+
+def revoke_token(token, user_id):
+    """
+    Revoke one token (access or refresh) until it expires.
+
+    Args:
+        token (Token): The validated token.
+        user_id (int): Id of the token's user.
+    """
+    jti = token[api_settings.JTI_CLAIM]
+    RevokedTokens.objects.get_or_create(jti=jti, defaults={'user_id': user_id, 'expires_at': token_expiry(token)})
+    revocations.refresh()
+    revocations.bloom.add(jti)
+
+
+def revoke_user(user_id, before=None):
+    """
+    Revoke every token of a user issued before `before` (now when None).
+
+    Tokens carry a whole-second `iat`, so the watermark is truncated to the
+    second: a login right after the revocation gets tokens that are
+    accepted. Tokens issued earlier within that same second are accepted
+    too; revoke the one making the request by its id (`revoke_token`).
+    """
+    before = (before or timezone.now()).replace(microsecond=0)
+    lifetime = max(api_settings.ACCESS_TOKEN_LIFETIME, api_settings.REFRESH_TOKEN_LIFETIME)
+    revocation = RevokedTokens.objects.create(user_id=user_id, revoked_before=before, expires_at=before + lifetime)
+    revocations.refresh()
+    revocations.add_watermark(user_id, revocation.revoked_before, revocation.expires_at)
+
+
+def purge_expired():
+    """
+    Delete the revocations whose tokens have all expired.
+
+    Returns:
+        int: The number of rows deleted.
+    """
+    deleted = RevokedTokens.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+    # Dropped rows leave the filter at its next rebuild
+    revocations.clear()
+    return deleted
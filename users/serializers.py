@@ -1,5 +1,8 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 from .models import Users
+from .revocation import revocations
 
 class UsersSerializer(serializers.ModelSerializer):
     class Meta:
@@ -22,4 +25,24 @@ class UsersSerializer(serializers.ModelSerializer):
         user = Users(**validated_data)  # Create user instance with remaining data
         user.set_password(password)  # Encrypt the password
         user.save()  # Save the user to the database
-        return user  # Return the created user
\ No newline at end of file
+        return user  # Return the created user
+
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh serializer refusing refresh tokens that were revoked.
+    """
+
+    def validate(self, attrs):
+        if revocations.is_revoked(self.token_class(attrs['refresh'])):
+            raise TokenError('Token has been revoked')
+        return super().validate(attrs)
+
+
+class LogoutSerializer(serializers.Serializer):
+    """
+    Input of a logout: the refresh token to revoke along with the access
+    token, and whether every other session ends too.
+    """
+    refresh = serializers.CharField(required=False)
+    all = serializers.BooleanField(default=False)
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import forget_user
+from .models import Users
+
+
+@receiver(post_save, sender=Users)
+@receiver(post_delete, sender=Users)
+def user_changed(sender, instance, **kwargs):
+    """
+    Drop a saved (possibly deactivated) or deleted user from the
+    authentication cache.
+    """
+    forget_user(instance.pk)
@@ -1,13 +1,28 @@
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.conf import settings
+from django.test import override_settings
+from django.utils import timezone
+from io import StringIO
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.test import TestCase
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.urls import reverse
-from .models import Users
+from cart.models import Carts
+from .models import RevokedTokens, Users
+from .revocation import BloomFilter, revocations, revoke_user
 from django.contrib.auth import get_user_model
 
 class UsersTestCase(TestCase):
 
     def setUp(self):
+        caches['idempotency'].clear()
         self.user1 = Users.objects.create(
             username="lucaspaulo",
             first_name="Lucas",
@@ -61,6 +76,47 @@ class UsersTestCase(TestCase):
         response = self.client.post(url, data)
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(Users.objects.filter(username="joaosilva").exists())
+        self.assertTrue(Carts.objects.filter(user__username="joaosilva").exists())
+
+    def test_create_user_is_atomic(self):
+        """
+        Test a registration whose cart cannot be created leaves no user behind
+        """
+        data = {
+            "username": "joaosilva",
+            "cpf": "435.435.432-00",
+            "email": "joao.silva@example.com",
+            "password": "Aleatoria@456"
+        }
+        with mock.patch.object(Carts.objects, 'create', side_effect=DatabaseError('cart insert failed')):
+            response = self.client.post(reverse('user-list'), data)
+        self.assertEqual(response.status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(Users.objects.filter(username="joaosilva").exists())
+
+    def test_create_user_idempotency_key(self):
+        """
+        Test a retried registration replays the first response without touching the database
+        """
+
+        url = reverse('user-list')
+        data = {
+            "username": "anasouza",
+            "first_name": "Ana",
+            "last_name": "Souza",
+            "cpf": "123.456.789-10",
+            "email": "ana.souza@example.com",
+            "password": "Senha@456"
+        }
+
+        self.client.credentials()
+        response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='signup-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with self.assertNumQueries(0):
+            response = self.client.post(url, data, HTTP_IDEMPOTENCY_KEY='signup-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(Users.objects.filter(username="anasouza").count(), 1)
 
     def test_list_user(self):
         """
@@ -156,4 +212,254 @@ class UsersTestCase(TestCase):
         url = reverse('user-detail', kwargs={'pk': self.user1.id})
         
         response = self.client.delete(url)
-        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+# The revocation set is refreshed once in setUp, not during the query counts
+@override_settings(TOKEN_REVOCATION_REFRESH_INTERVAL=60 * 60)
+class CachedAuthenticationTestCase(TestCase):
+
+    def setUp(self):
+        revocations.refresh(force=True)
+        self.user = Users.objects.create(
+            username="anacosta", cpf="444.555.666-77", email="ana.costa@example.com"
+        )
+        self.user.set_password("Senha@456")
+        self.user.save()
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "anacosta", "password": "Senha@456"})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        self.url = reverse('user-detail', kwargs={'pk': self.user.id})
+
+    def test_user_read_once(self):
+        """
+        Test authenticated requests stop reading the user row once it is cached
+        """
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_changes_invalidate_cache(self):
+        """
+        Test saving, deactivating or deleting a user drops the cached row
+        """
+        self.client.get(self.url)
+
+        self.user.first_name = "Ana"
+        self.user.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['first_name'], "Ana")
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.user.is_active = True
+        self.user.save()
+        self.client.get(self.url)
+        self.user.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class TokenRevocationTestCase(TestCase):
+
+    def setUp(self):
+        revocations.clear()
+        self.addCleanup(revocations.clear)
+        self.user = Users.objects.create(
+            username="brunolima", cpf="555.666.777-88", email="bruno.lima@example.com"
+        )
+        self.user.set_password("Senha@321")
+        self.user.save()
+        self.url = reverse('user-detail', kwargs={'pk': self.user.id})
+
+    def login(self):
+        """
+        Return an API client authenticated with a fresh token pair, and the refresh token.
+        """
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "brunolima", "password": "Senha@321"})
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {response.data["access"]}')
+        return client, response.data['refresh']
+
+    def old_login(self):
+        """
+        Return an API client authenticated with a token pair issued a while
+        ago, before any watermark set now, and the refresh token.
+        """
+        refresh = RefreshToken.for_user(self.user)
+        refresh.set_iat(at_time=timezone.now() - timedelta(seconds=10))
+        access = refresh.access_token
+        access.set_iat(at_time=timezone.now() - timedelta(seconds=10))
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return client, str(refresh)
+
+    def test_logout_revokes_tokens(self):
+        """
+        Test logging out revokes the access and refresh tokens, and only them
+        """
+        client, refresh = self.login()
+        other, _ = self.login()
+
+        response = client.post(reverse('token_revoke'), {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(other.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_logout_everywhere(self):
+        """
+        Test revoking every token of a user refuses all tokens issued before
+        """
+        client, refresh = self.login()
+        other, other_refresh = self.old_login()  # Another device
+
+        response = client.post(reverse('token_revoke'), {'all': True, 'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(other.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        for token in (refresh, other_refresh):
+            response = self.client.post(reverse('token_refresh'), {'refresh': token})
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_login_right_after_logout_everywhere(self):
+        """
+        Test tokens from a login in the same second as a logout everywhere are accepted
+        """
+        client, _ = self.login()
+        client.post(reverse('token_revoke'), {'all': True})
+
+        client, refresh = self.login()
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_200_OK)
+        response = self.client.post(reverse('token_refresh'), {'refresh': refresh})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_tokens_after_watermark_accepted(self):
+        """
+        Test only the tokens issued before the watermark are refused
+        """
+        client = APIClient()
+        old = RefreshToken.for_user(self.user).access_token
+        old.set_iat(at_time=timezone.now() - timedelta(seconds=10))
+        revoke_user(self.user.id, before=timezone.now() - timedelta(seconds=5))
+
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {old}')
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        client, _ = self.login()
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_200_OK)
+
+    def test_check_runs_no_query(self):
+        """
+        Test checking a valid token against the revocation set runs no query
+        """
+        client, _ = self.login()
+        revoke_user(self.user.id, before=timezone.now() - timedelta(hours=1))
+        client.get(self.url)
+
+        # The user lookup is cached: only the viewset's own query is left
+        with self.assertNumQueries(1):
+            response = client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(TOKEN_REVOCATION_REFRESH_INTERVAL=0)
+    def test_revocations_from_other_processes(self):
+        """
+        Test rows written by another process are picked up by the incremental refresh
+        """
+        client, refresh = self.old_login()
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_200_OK)
+
+        call_command('revoke_user_tokens', 'brunolima', stdout=StringIO())
+        revocations.watermarks.clear()  # As if revoked by another process
+        self.assertEqual(client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_purge_expired(self):
+        """
+        Test expired revocations are purged and live ones kept
+        """
+        now = timezone.now()
+        RevokedTokens.objects.create(jti='expired', user=self.user, expires_at=now - timedelta(seconds=1))
+        RevokedTokens.objects.create(jti='live', user=self.user, expires_at=now + timedelta(minutes=5))
+
+        call_command('purge_revoked_tokens', stdout=StringIO())
+        self.assertEqual(list(RevokedTokens.objects.values_list('jti', flat=True)), ['live'])
+        self.assertTrue(revocations.is_revoked({'jti': 'live'}))
+        self.assertFalse(revocations.is_revoked({'jti': 'expired'}))
+
+    def test_bloom_filter(self):
+        """
+        Test the Bloom filter never misses an item and keeps close to its error rate
+        """
+        bloom = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            bloom.add(f'token-{i}')
+
+        self.assertTrue(all(f'token-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class LoginThrottleTestCase(TestCase):
+
+    @override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {'login': '2/min'}})
+    def test_login_throttled(self):
+        """
+        Test repeated logins from one address are refused once its limit is reached
+        """
+        Users.objects.create_user(username="caiofreitas", password="Senha@654", cpf="666.777.888-99")
+        url = reverse('token_obtain_pair')
+        data = {"username": "caiofreitas", "password": "errada"}
+
+        for _ in range(2):
+            self.assertEqual(self.client.post(url, data).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(url, {"username": "caiofreitas", "password": "Senha@654"})
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['RateLimit-Limit'], '2')
+
+        # A spoofed X-Forwarded-For does not open a new counter
+        response = self.client.post(url, data, HTTP_X_FORWARDED_FOR='198.51.100.7')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+
+class ProvisionUsersTestCase(TestCase):
+
+    def test_provision_users_command(self):
+        """
+        Test provisioning creates users with carts and reports clashing rows without stopping
+        """
+        Users.objects.create(username="existente", cpf="000.000.000-01", email="existente@example.com")
+        rows = [
+            "username,first_name,last_name,cpf,email,password",
+            "ana,Ana,Souza,100.000.000-01,ana@example.com,Senha@001",
+            "beto,Beto,Lima,100.000.000-02,beto@example.com,Senha@002",
+            "carla,Carla,Dias,100.000.000-01,carla@example.com,Senha@003",
+            "duda,Duda,Melo,100.000.000-04,existente@example.com,Senha@004",
+            "edu,Edu,Reis,100.000.000-05,not-an-email,Senha@005",
+            "fabi,Fabi,Rosa,100.000.000-06,fabi@example.com,Senha@006",
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write('\n'.join(rows) + '\n')
+        self.addCleanup(os.remove, feed.name)
+
+        out, err = StringIO(), StringIO()
+        call_command('provision_users', feed.name, '--batch-size', '3', '--workers', '2', stdout=out, stderr=err)
+
+        self.assertIn('Provisioned 3 users, 3 failed', out.getvalue())
+        for line in ('Line 4', 'Line 5', 'Line 6'):
+            self.assertIn(line, err.getvalue())
+        self.assertIn('cpf', err.getvalue())
+
+        provisioned = Users.objects.filter(username__in=["ana", "beto", "fabi"])
+        self.assertEqual(provisioned.count(), 3)
+        self.assertEqual(Carts.objects.filter(user__in=provisioned).count(), 3)
+        self.assertTrue(provisioned.get(username="fabi").check_password("Senha@006"))
+
+        response = self.client.post(reverse('token_obtain_pair'), {"username": "beto", "password": "Senha@002"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
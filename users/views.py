@@ -1,12 +1,22 @@
 from rest_framework import viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
-from .serializers import UsersSerializer
+from .serializers import LogoutSerializer, UsersSerializer
 from .models import Users
 from .permissions import IsAdminOrOwner
+from django.core import signing
+from django.db import transaction
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework.views import APIView
+from .revocation import revoke_token, revoke_user
+from cart.guest import GuestCart
+from e_commerce.idempotency import IdempotentMixin
 from cart.models import Carts
 
-class UsersViewSet(viewsets.ModelViewSet):
+class UsersViewSet(IdempotentMixin, viewsets.ModelViewSet):
     """
     A ViewSet for managing `Users` in the system.
 
@@ -16,6 +26,8 @@ class UsersViewSet(viewsets.ModelViewSet):
     """
     queryset = Users.objects.all()
     serializer_class = UsersSerializer
+    idempotent_actions = ['create']  # Retried registrations replay the first response
+    idempotency_scope_body = True  # Only who sent the password can replay the registration
 
     def get_permissions(self):
         """
@@ -38,7 +50,8 @@ class UsersViewSet(viewsets.ModelViewSet):
         Handles the creation of a new `User`.
 
         Validates the input data and saves the user to the database. Automatically creates
-        a shopping cart (`Cart`) associated with the newly registered user. 
+        a shopping cart (`Cart`) associated with the newly registered user, in the same
+        transaction: one commit per signup, and never a user without a cart.
 
         Args:
             request: The HTTP request object containing user data.
@@ -53,10 +66,11 @@ class UsersViewSet(viewsets.ModelViewSet):
         
         if serializer.is_valid():
             try:
-                # Save the user instance
-                user = serializer.save()
-                # Automatically create a cart for the newly registered user
-                Carts.objects.create(user=user)
+                with transaction.atomic():
+                    # Save the user instance
+                    user = serializer.save()
+                    # Automatically create a cart for the newly registered user
+                    Carts.objects.create(user=user)
                 return Response(
                     {'message': 'User registered successfully!'},
                     status=status.HTTP_201_CREATED
@@ -69,3 +83,68 @@ class UsersViewSet(viewsets.ModelViewSet):
                 )
         # Return validation errors if the input data is invalid
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class LoginView(TokenObtainPairView):
+    """
+    Issues the JWT pair, merging the visitor's guest cart into their own.
+
+    When the login request carries the `X-Cart-Token` header of a guest cart,
+    its lines are added to the user's cart with one bulk operation. A missing,
+    expired or invalid cart token never makes the login fail.
+    """
+    throttle_scope = 'login'  # Password guessing, per address
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        try:
+            serializer.is_valid(raise_exception=True)
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        try:
+            guest_cart = GuestCart.from_request(request)
+        except signing.BadSignature:
+            guest_cart = None
+        if guest_cart is not None:
+            guest_cart.merge_into(serializer.user.id)
+
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+class LogoutView(APIView):
+    """
+    Revokes the access token of the request, and optionally a refresh token
+    or every token of the user.
+
+    Revoked tokens are refused from then on by the authentication, which
+    checks them against an in-memory revocation set instead of the database.
+
+    Request body:
+        - refresh: A refresh token of the user to revoke too (optional).
+        - all: Revoke every token of the user issued so far (optional).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        refresh = None
+        if 'refresh' in serializer.validated_data:
+            try:
+                refresh = RefreshToken(serializer.validated_data['refresh'])
+            except TokenError as e:
+                raise InvalidToken(e.args[0])
+            if str(refresh.get(api_settings.USER_ID_CLAIM)) != str(request.user.pk):
+                return Response(
+                    {'detail': 'The refresh token belongs to another user.'}, status=status.HTTP_400_BAD_REQUEST
+                )
+
+        # By id even with `all`: the watermark spares tokens issued in its own second
+        revoke_token(request.auth, request.user.pk)
+        if refresh is not None:
+            revoke_token(refresh, request.user.pk)
+        if serializer.validated_data['all']:
+            revoke_user(request.user.pk)
+        return Response(status=status.HTTP_204_NO_CONTENT)